@@ -0,0 +1,41 @@
+"""
+gunicorn settings for the Django backend:
+
+    gunicorn --config etc/gunicorn.conf.py --chdir remindmoi_django remindmoi.wsgi
+
+Workers only serve requests, reminders are sent by `manage.py run_dispatcher`.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("REMINDMOI_BIND", "127.0.0.1:8789")
+workers = int(
+    os.environ.get("REMINDMOI_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+# Calendar views wait on CalDAV, threads keep the other requests moving
+worker_class = "gthread"
+threads = int(os.environ.get("REMINDMOI_THREADS", 4))
+# The bot keeps its connections open between commands
+keepalive = 75
+# Above the bot's longest read timeout (calendar commands, 45 s)
+timeout = 60
+graceful_timeout = 10
+max_requests = 10000
+max_requests_jitter = 500
+
+# Workers share the cached "list" pages through files
+list_cache_dir = os.environ.get(
+    "REMINDMOI_LIST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "remindmoi-lists")
+)
+
+raw_env = [
+    "REMINDMOI_DISPATCH_IN_PROCESS=0",
+    f"REMINDMOI_LIST_CACHE_DIR={list_cache_dir}",
+]
+
+
+def on_starting(server):
+    # The table may have changed while the backend was down
+    shutil.rmtree(list_cache_dir, ignore_errors=True)
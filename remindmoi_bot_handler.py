@@ -1,42 +1,62 @@
+import atexit
+import functools
 import json
+import logging
 import requests
+import signal
+import sys
+import threading
 
 from datetime import datetime
 from dateutil.tz import gettz
 
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 
 from remindmoi_django.bot_server.constants import (
     ADD_ENDPOINT,
+    BULK_ADD_ENDPOINT,
     REMOVE_ENDPOINT,
     LIST_ENDPOINT,
     REPEAT_ENDPOINT,
     MULTI_REMIND_ENDPOINT,
     CALENDAR_REMIND_ENDPOINT,
-    AUTHORIZED_USER,
-    REFRESH_TOKEN,
     REDIRECT_LOGIN_URL,
+    BOT_ASYNC_RUNTIME,
+    TRACE_FILE,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_COMMAND_SECONDS,
 )
 from remindmoi_django.bot_server.bot_helpers import (
-    is_add_command,
-    is_remove_command,
-    is_list_command,
-    is_repeat_reminder_command,
-    is_multi_remind_command,
-    is_remindme_command,
     parse_add_command_content,
+    parse_bulk_add_command_content,
     parse_remove_command_content,
     generate_reminders_list,
+    parse_list_command_content,
     parse_repeat_command_content,
     parse_multi_remind_command_content,
     parse_remindme_command_content,
-    is_iso_time_command,
     parse_add_is_time_command_content,
-    is_iso_date_command,
     parse_add_date_command_content,
-    is_calendar_remind_command,
     parse_calendar_remind_command_content)
-from remindmoi_django.bot_server.constants import ENDPOINT_URL
+from remindmoi_django.bot_server.commands import (
+    Command,
+    parse_command,
+    ISO_DATE_COMMAND,
+    ISO_TIME_COMMAND,
+    REMINDME_COMMAND,
+    ADD_COMMAND,
+    BULK_ADD_COMMAND,
+    REMOVE_COMMAND,
+    LIST_COMMAND,
+    REPEAT_COMMAND,
+    MULTI_REMIND_COMMAND,
+    CALENDAR_REMIND_COMMAND,
+)
+from remindmoi_django.bot_server.backend_client import BackendClient
+from remindmoi_django.bot_server.runtime import AsyncBotRuntime
+from remindmoi_django.bot_server.tracing import Tracer, span
+
+logger = logging.getLogger(__name__)
 
 USAGE = """
 A bot that schedules reminders for users.
@@ -48,6 +68,14 @@ To store a reminder, mention or send a message to the bot in the following forma
 `add 1 day clean the dishes`
 `add 10 hours eat`
 
+To store several reminders at once, put one per line after `add`:
+
+```
+add
+1 day clean the dishes
+10 hours eat
+```
+
 To add a event to your calendar the format is:
 `--calendar 16-06-2020 18:00` (dd/mm/yyyy) (hour in utc time)
 
@@ -56,19 +84,25 @@ Avaliable time units: minutes, hours, days, weeks
 To remove a reminder:
 `remove <reminder_id>`
 
-To list reminders:
-`list`
+To list reminders (one page at a time):
+`list`, then `list next`, or `list --page 2`
 
 To repeat a reminder: 
 repeat <reminder_id> every <int> <time_unit>
 
 `repeat 23 every 2 weeks`
 
-Avaliable units: days, weeks, months
+Avaliable units: minutes, hours, days, weeks, months
 
 """
 
 
+# Cursor of the next "list" page, per user
+list_cursors: Dict[str, str] = {}
+
+tracer = Tracer(TRACE_SLOW_COMMAND_SECONDS, TRACE_SAMPLE_RATE, TRACE_FILE)
+
+
 class RemindMoiHandler(object):
     """
     A docstring documenting this bot.
@@ -78,106 +112,213 @@ class RemindMoiHandler(object):
     def usage(self) -> str:
         return USAGE
 
+    def initialize(self, bot_handler: Any) -> None:
+        self.backend = BackendClient()
+        self.runtime = None
+        if BOT_ASYNC_RUNTIME:
+            self.runtime = AsyncBotRuntime()
+            self.runtime.start()
+            atexit.register(self.shutdown)
+            # supervisord stops the bot with SIGTERM, which skips atexit
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, self.terminate)
+
     def handle_message(self, message: Dict[str, Any], bot_handler: Any) -> None:
-        bot_response = get_bot_response(message, bot_handler)
+        reply = functools.partial(self.reply, message, bot_handler)
+        if self.runtime is None or not self.runtime.submit(message, reply):
+            reply()
+
+    def reply(self, message: Dict[str, Any], bot_handler: Any) -> None:
+        bot_response = get_bot_response(message, bot_handler, self.backend)
         bot_handler.send_reply(message, bot_response)
 
+    def shutdown(self) -> None:
+        """
+        Answer the messages already received, then close the connections.
+        """
+        if self.runtime is not None:
+            self.runtime.stop()
+        self.backend.close()
+
+    def terminate(self, signum: int, frame: Any) -> None:
+        atexit.unregister(self.shutdown)
+        self.shutdown()
+        sys.exit(0)
+
+
+def add_iso_date_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    reminder_object = parse_add_date_command_content(
+        message, command.tokens, command.deadline
+    )
+    response = backend.post(url=ADD_ENDPOINT, json=reminder_object)
+    response = response.json()
+    assert response["success"]
+    return f"Reminder stored. title: {reminder_object['title']} Your reminder id is: {response['reminder_id']}. "
+
+
+def add_iso_time_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    reminder_object = parse_add_is_time_command_content(
+        message, command.tokens, command.deadline
+    )
+    response = backend.post(url=ADD_ENDPOINT, json=reminder_object)
+    response = response.json()
+    assert response["success"]
+    return f"Reminder stored. Your reminder id is: {response['reminder_id']}. title: {reminder_object['title']}"
+
+
+def add_remindme_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    reminder_object = parse_remindme_command_content(message, command.tokens)
+    response = backend.post(url=ADD_ENDPOINT, json=reminder_object)
+    response = response.json()
+    assert response["success"]
+    return f"Reminder stored. Your reminder id is: {response['reminder_id']}. url: {reminder_object['title']}"
+
+
+def add_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    reminder_object = parse_add_command_content(message, command.tokens)
+    response = backend.post(url=ADD_ENDPOINT, json=reminder_object)
+    response = response.json()
+    assert response["success"]
+    return f"Reminder stored. Your reminder id is: {response['reminder_id']}"
+
+
+def bulk_add_reminders(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    bulk_request = parse_bulk_add_command_content(message, command.tokens)
+    response = backend.post(url=BULK_ADD_ENDPOINT, json=bulk_request)
+    response = response.json()
+    assert response["success"]
+    reminder_ids = ", ".join(str(i) for i in response["reminder_ids"])
+    return f"Reminders stored. Your reminder ids are: {reminder_ids}"
+
+
+def remove_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    reminder_id = parse_remove_command_content(message["content"], command.tokens)
+    response = backend.post(url=REMOVE_ENDPOINT, json=reminder_id)
+    response = response.json()
+    assert response["success"]
+    return "Reminder deleted."
+
+
+def list_reminders(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    list_request = parse_list_command_content(message, command.tokens)
+    user_email = list_request["zulip_user_email"]
+    payload = {"zulip_user_email": user_email, "page": list_request["page"]}
+    if list_request["next"]:
+        payload["cursor"] = list_cursors.get(user_email)
+    response = backend.post(url=LIST_ENDPOINT, json=payload)
+    response = response.json()
+    assert response["success"]
+    if response.get("next_cursor"):
+        list_cursors[user_email] = response["next_cursor"]
+    else:
+        list_cursors.pop(user_email, None)
+    return generate_reminders_list(response)
+
+
+def repeat_reminder(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    repeat_request = parse_repeat_command_content(message["content"], command.tokens)
+    response = backend.post(url=REPEAT_ENDPOINT, json=repeat_request)
+    response = response.json()
+    assert response["success"]
+    return f"Reminder will be repeated every {repeat_request['repeat_value']} {repeat_request['repeat_unit']}."
+
+
+def multi_remind(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    multi_remind_request = parse_multi_remind_command_content(
+        message["content"], command.tokens
+    )
+    response = backend.post(url=MULTI_REMIND_ENDPOINT, json=multi_remind_request)
+    response = response.json()
+    assert response["success"]
+    emails = ", ".join(
+        [f"@**{email}**" for email in response["user_emails_to_remind"]]
+    )
+    return f"Reminder will be sent to {emails}. Your reminder id is: {response['reminder_id']}."
+
+
+def calendar_remind(
+    message: Dict[str, Any], command: Command, backend: BackendClient
+) -> str:
+    calendar_remind_request = parse_calendar_remind_command_content(
+        message, command.tokens
+    )
+    calendar_response = backend.post(
+        url=CALENDAR_REMIND_ENDPOINT, json=calendar_remind_request
+    )
+    if calendar_response.status_code == 404:
+        return f"Please go to {REDIRECT_LOGIN_URL} to authorize the Zulip bot to add a event in your calendar"
+    if calendar_response.status_code == 401:
+        return f"Refresh your session was not possible please go to {REDIRECT_LOGIN_URL} to authorize the Zulip bot to add a event in your calendar"
+    if calendar_response.status_code != 200:
+        try:
+            error = calendar_response.json()["message"]
+        except (ValueError, KeyError, TypeError):
+            error = calendar_response.text
+        logger.warning(
+            "Calendar event failed (%s): %s", calendar_response.status_code, error
+        )
+        return f"The event wasn't add to the calendar"
+    return f"Reminder will be scheduled to {calendar_remind_request['email']} at {calendar_remind_request['event_date']} {calendar_remind_request['event_time']}. "
+
+
+COMMAND_HANDLERS: Dict[
+    str, Callable[[Dict[str, Any], Command, BackendClient], str]
+] = {
+    ISO_DATE_COMMAND: add_iso_date_reminder,
+    ISO_TIME_COMMAND: add_iso_time_reminder,
+    REMINDME_COMMAND: add_remindme_reminder,
+    ADD_COMMAND: add_reminder,
+    BULK_ADD_COMMAND: bulk_add_reminders,
+    REMOVE_COMMAND: remove_reminder,
+    LIST_COMMAND: list_reminders,
+    REPEAT_COMMAND: repeat_reminder,
+    MULTI_REMIND_COMMAND: multi_remind,
+    CALENDAR_REMIND_COMMAND: calendar_remind,
+}
+
 
-def get_bot_response(message: Dict[str, Any], bot_handler: Any) -> str:
+def get_bot_response(
+    message: Dict[str, Any], bot_handler: Any, backend: BackendClient
+) -> str:
     message_content = message["content"]
     if message_content.startswith(("help", "?", "halp")):
         return USAGE
 
-    try:
-        if is_iso_date_command(message_content, message["timestamp"]):
-            reminder_object = parse_add_date_command_content(message)
-            response = requests.post(url=ADD_ENDPOINT, json=reminder_object)
-            response = response.json()
-            assert response["success"]
-            message = f"Reminder stored. title: {reminder_object['title']} Your reminder id is: {response['reminder_id']}. "
-            return message
-        if is_iso_time_command(message_content, message["timestamp"]):
-            reminder_object = parse_add_is_time_command_content(message)
-            response = requests.post(url=ADD_ENDPOINT, json=reminder_object)
-            response = response.json()
-            assert response["success"]
-            return f"Reminder stored. Your reminder id is: {response['reminder_id']}. title: {reminder_object['title']}"
-        if is_remindme_command(message_content):
-            reminder_object = parse_remindme_command_content(message)
-            response = requests.post(url=ADD_ENDPOINT, json=reminder_object)
-            response = response.json()
-            assert response["success"]
-            return f"Reminder stored. Your reminder id is: {response['reminder_id']}. url: {reminder_object['title']}"
-        if is_add_command(message_content):
-            reminder_object = parse_add_command_content(message)
-            response = requests.post(url=ADD_ENDPOINT, json=reminder_object)
-            response = response.json()
-            assert response["success"]
-            return f"Reminder stored. Your reminder id is: {response['reminder_id']}"
-        if is_remove_command(message_content):
-            reminder_id = parse_remove_command_content(message_content)
-            response = requests.post(url=REMOVE_ENDPOINT, json=reminder_id)
-            response = response.json()
-            assert response["success"]
-            return "Reminder deleted."
-        if is_list_command(message_content):
-            zulip_user_email = {"zulip_user_email": message["sender_email"]}
-            response = requests.post(url=LIST_ENDPOINT, json=zulip_user_email)
-            response = response.json()
-            assert response["success"]
-            return generate_reminders_list(response)
-        if is_repeat_reminder_command(message_content):
-            repeat_request = parse_repeat_command_content(message_content)
-            response = requests.post(url=REPEAT_ENDPOINT, json=repeat_request)
-            response = response.json()
-            assert response["success"]
-            return f"Reminder will be repeated every {repeat_request['repeat_value']} {repeat_request['repeat_unit']}."
-        if is_multi_remind_command(message_content):
-            multi_remind_request = parse_multi_remind_command_content(message_content)
-            response = requests.post(
-                url=MULTI_REMIND_ENDPOINT, json=multi_remind_request
-            )
-            response = response.json()
-            assert response["success"]
-            emails = ", ".join(
-                [f"@**{email}**" for email in response["user_emails_to_remind"]]
-            )
-            return f"Reminder will be sent to {emails}. Your reminder id is: {response['reminder_id']}."
-        if is_calendar_remind_command(message_content):
-            user_email = message["sender_email"]
-            exists_response = requests.get(
-                url=AUTHORIZED_USER,
-                params={"email": user_email},
-            )
-            if exists_response.status_code == 404:
-                return f"Please go to {REDIRECT_LOGIN_URL} to authorize the Zulip bot to add a event in your calendar"
-
-            json_exists_response = exists_response.json()
-            if json_exists_response["user_expired"]:
-                refresh_response = requests.get(
-                    url=REFRESH_TOKEN,
-                    params={"email": user_email},
-                )
-                if refresh_response.status_code == 500:
-                    print(refresh_response['message'])
-                    return f"Refresh your session was not possible please go to {REDIRECT_LOGIN_URL} to authorize the Zulip bot to add a event in your calendar"
-
-            calendar_remind_request = parse_calendar_remind_command_content(message)
-            calendar_response = requests.post(
-                url=CALENDAR_REMIND_ENDPOINT,
-                json=json.dumps(calendar_remind_request),
-            )
-            if calendar_response.status_code != 200:
-                print(calendar_response['message'])
-                return f"The event wasn't add to the calendar"
-            return f"Reminder will be scheduled to {calendar_remind_request['email']} at {calendar_remind_request['event_date']} {calendar_remind_request['event_time']}. "
-        return "Invalid input. Please check help."
-    except requests.exceptions.ConnectionError:
-        return "Server not running, call Karim"
-    except (json.JSONDecodeError, AssertionError):
-        return "Something went wrong"
-    except OverflowError:
-        return "What's wrong with you?"
+    # The request id follows the command to every backend endpoint
+    with tracer.trace("command") as trace:
+        try:
+            with span("parse"):
+                command = parse_command(message_content, message["timestamp"])
+            if command is None:
+                return "Invalid input. Please check help."
+            trace.name = command.name
+            return COMMAND_HANDLERS[command.name](message, command, backend)
+        except requests.exceptions.ConnectionError:
+            return "Server not running, call Karim"
+        except requests.exceptions.Timeout:
+            return "Server took too long to answer, please try again"
+        except (json.JSONDecodeError, AssertionError):
+            return "Something went wrong"
+        except OverflowError:
+            return "What's wrong with you?"
 
 
 handler_class = RemindMoiHandler
@@ -0,0 +1,164 @@
+"""
+Micro-benchmark of command recognition.
+
+Compares the single-pass grammar in ``bot_server.commands`` with the former
+chain of ``is_*_command`` predicates followed by a second split in the parser.
+
+    cd remindmoi_django && python -m benchmarks.bench_commands
+"""
+import re
+import timeit
+from datetime import datetime
+
+from bot_server.commands import parse_command
+from bot_server.constants import UNITS, SINGULAR_UNITS
+
+TIMESTAMP = datetime(2019, 12, 31, 0, 0).timestamp()
+
+CORPUS = [
+    "me 10 minutes",
+    "me 2 hours --multi @juan@carolina",
+    "me at 5 pm",
+    "me at 10:30 am --multi @henry",
+    "me at 2020-04-19 11:00",
+    "add 1 day clean the dishes",
+    "add 10 hours eat",
+    "remove 42",
+    "list",
+    "repeat 23 every 2 weeks",
+    "multi 23 @**Jose** @**Max**",
+    "--calendar 16-06-2020 18:00",
+    "--calendar 10-12-2020 01:00 --type google --email someone@example.com",
+    # garbage
+    "",
+    "hello there",
+    "thanks!",
+    "add one day laundry",
+    "remove everything",
+    "repeat 23 each 2 weeks",
+    "can you remind me at some point?",
+    "x" * 500,
+    "@**RemindJD** what is this bot",
+]
+
+
+def _legacy_is_add(content, units=UNITS + SINGULAR_UNITS):
+    try:
+        command = content.split(" ", maxsplit=4)
+        assert command[0] == "add"
+        assert type(int(command[1])) == int
+        assert command[2] in units
+        assert type(command[3]) == str
+        return True
+    except (IndexError, AssertionError, ValueError):
+        return False
+
+
+def _legacy_is_remove(content):
+    try:
+        command = content.split(" ")
+        assert command[0] == "remove"
+        assert type(int(command[1])) == int
+        return True
+    except (AssertionError, IndexError, ValueError):
+        return False
+
+
+def _legacy_is_list(content):
+    return content.split(" ")[0] == "list"
+
+
+def _legacy_is_repeat(content, units=UNITS + SINGULAR_UNITS):
+    try:
+        command = content.split(" ")
+        assert command[0] == "repeat"
+        assert type(int(command[1])) == int
+        assert command[2] == "every"
+        assert type(int(command[3])) == int
+        assert command[4] in units
+        return True
+    except (AssertionError, IndexError, ValueError):
+        return False
+
+
+def _legacy_is_iso_time(content, timestamp):
+    try:
+        result = re.match(
+            r"me at\s+\b([0-9]|1[0-2])\b(:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)?\s+(am|pm)*(\s+--multi\s+(@\w+)+)?",
+            content,
+            flags=re.IGNORECASE,
+        )
+        if result is not None:
+            current_time = datetime.fromtimestamp(timestamp).time()
+            hour = int(result.group(1))
+            period = result.group(4).lower()
+            reminder_hour = (
+                hour if period == "am" or (hour == 12 and period == "pm") else 12 + hour
+            )
+            minutes = int(result.group(3)) if result.group(3) is not None else 0
+            reminder_time = current_time.replace(hour=reminder_hour, minute=minutes)
+            return reminder_time > current_time
+        return False
+    except (AssertionError, IndexError, ValueError, AttributeError):
+        return False
+
+
+def _legacy_is_iso_date(content, timestamp):
+    try:
+        result = re.match(
+            r"me\s+at\s+\b(\b(20[2-8][0-9]|209[0-9]|2[1-9][0-9]{2}|[3-9][0-9]{3})\b-\b(0+[1-9]|1[0-2])\b-\b(0+[1-9]|[12][0-9]|3[01])\b)\b\s+\b(\b(0+[0-9]|1[0-9]|2[0-3])\b:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)(\s+--multi\s+(@\w+)+)?",
+            content,
+        )
+        if result is not None:
+            remainder_datetime = f"{result.group(1)} {result.group(5)}"
+            new_datetime = datetime.strptime(remainder_datetime, "%Y-%m-%d %H:%M")
+            return new_datetime > datetime.fromtimestamp(timestamp)
+        return False
+    except (AssertionError, IndexError, ValueError):
+        return False
+
+
+def legacy_dispatch(content, timestamp):
+    if _legacy_is_iso_date(content, timestamp):
+        return content.split(" ")
+    if _legacy_is_iso_time(content, timestamp):
+        return content.split(" ")
+    if re.match(r"me\s+\d+\s+\w+(\s+--multi\s+(@\w+)+)?", content):
+        return content.split(" ", maxsplit=4)
+    if _legacy_is_add(content):
+        return content.split(" ", maxsplit=3)
+    if _legacy_is_remove(content):
+        return content.split(" ")
+    if _legacy_is_list(content):
+        return content.split(" ")
+    if _legacy_is_repeat(content):
+        return content.split(" ")
+    if re.match(r"multi\s+\d+(((@\w+)(\s)?)+)?", content):
+        return content.split(" ", maxsplit=2)
+    if re.match(
+        r"--calendar\s(((0?([1-9]|1[0-9]|2[0-9]|3[0-1]))-(0?([1-9]|1[0-2]))-([1-2][0-9][0-9][0-9]))\s((0?([0-9]|1[0-9]|2[0-3])):(([0-5]?[0-9])))(\s(--type\s\w*\s--email\s(\w+[/.-]*?\w)*@\w*.\w*)?)?)",
+        content,
+    ):
+        return content.split(" ", maxsplit=6)
+    return None
+
+
+def run_legacy():
+    for content in CORPUS:
+        legacy_dispatch(content, TIMESTAMP)
+
+
+def run_grammar():
+    for content in CORPUS:
+        parse_command(content, TIMESTAMP)
+
+
+def main(number: int = 2000) -> None:
+    messages = number * len(CORPUS)
+    for name, func in (("legacy chain", run_legacy), ("grammar", run_grammar)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>14}: {elapsed / messages * 1e6:7.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Write throughput of reminder creation under each database setup.
+
+Several threads create reminders the way /add_reminder does (row and
+recipients in one transaction) against a scratch database, with SQLite's
+default journal, with SQLITE_PRAGMAS (WAL, synchronous NORMAL, busy
+timeout), and against PostgreSQL when REMINDMOI_DB_ENGINE=postgresql is set
+(its database is written to, use a scratch one). Every setup runs in its own
+process.
+
+    cd remindmoi_django && python -m benchmarks.bench_database
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WRITERS = 8
+REMINDERS = 200  # per writer
+
+SQLITE_DEFAULTS = {"journal_mode": "delete", "synchronous": "full"}
+
+
+def write_reminders(count: int, errors: list) -> None:
+    from django.db import OperationalError, connection, transaction
+    from django.utils import timezone
+
+    from remindmoi_bot.models import Reminder
+
+    try:
+        for _ in range(count):
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    reminder = Reminder(
+                        zulip_user_email="a@monadical.com,b@monadical.com",
+                        title="benchmark",
+                        created=now,
+                        deadline=now,
+                    )
+                    reminder.save()
+                    reminder.sync_recipients()
+            except OperationalError as error:  # database is locked
+                errors.append(error)
+    finally:
+        connection.close()
+
+
+def worker(setup: str) -> None:
+    import django
+    from django.conf import settings
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "remindmoi.settings")
+    django.setup()
+    if setup == "sqlite default":
+        settings.SQLITE_PRAGMAS = SQLITE_DEFAULTS
+        settings.DATABASES["default"]["OPTIONS"] = {"timeout": 5}  # Django's default
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    errors: list = []
+    threads = [
+        threading.Thread(target=write_reminders, args=(REMINDERS, errors))
+        for _ in range(WRITERS)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    written = WRITERS * REMINDERS - len(errors)
+    print(
+        f"{setup:>15}: {written / elapsed:7.0f} reminders/s, "
+        f"{len(errors)} failed with 'database is locked'"
+    )
+
+
+def main() -> None:
+    setups = ["sqlite default", "sqlite tuned"]
+    if os.environ.get("REMINDMOI_DB_ENGINE") == "postgresql":
+        setups.append("postgresql")
+    for setup in setups:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ)
+            if setup.startswith("sqlite"):
+                env["REMINDMOI_DB_ENGINE"] = "sqlite3"
+                env["REMINDMOI_DB_NAME"] = os.path.join(directory, "bench.sqlite3")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_database", setup],
+                env=env,
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        worker(sys.argv[1])
+    else:
+        main()
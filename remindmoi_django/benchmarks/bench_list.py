@@ -0,0 +1,101 @@
+"""
+Cost of the list_reminders view, rendering the page after the user's
+reminders changed (cache miss, including the invalidation) vs. a cache
+hit, with the in-memory cache (one process) and the file cache gunicorn
+workers share. Uses a scratch SQLite database.
+
+    cd remindmoi_django && python -m benchmarks.bench_list
+"""
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+USERS = 100
+REMINDERS_PER_USER = 50
+
+
+def setup_django(database: str, cache_dir: str) -> None:
+    os.environ["REMINDMOI_DB_ENGINE"] = "sqlite3"
+    os.environ["REMINDMOI_DB_NAME"] = database
+    os.environ["REMINDMOI_LIST_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "remindmoi.settings")
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def create_reminders() -> None:
+    from django.db import transaction
+    from django.utils import timezone
+
+    from remindmoi_bot.models import Reminder
+
+    now = timezone.now()
+    with transaction.atomic():
+        for user in range(USERS):
+            for index in range(REMINDERS_PER_USER):
+                reminder = Reminder.objects.create(
+                    zulip_user_email=f"user{user}@monadical.com",
+                    title=f"reminder {index}",
+                    created=now,
+                    deadline=now + timedelta(hours=index),
+                )
+                reminder.sync_recipients()
+
+
+def time_lists(requests, invalidate: bool, repeat: int = 3) -> float:
+    """
+    Mean time per list request, after the user's pages were invalidated
+    (as by an add) or not.
+    """
+    from remindmoi_bot.list_cache import invalidate_lists
+    from remindmoi_bot.views import list_reminders
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for user, request in enumerate(requests):
+            if invalidate:
+                invalidate_lists([f"user{user}@monadical.com"])
+            list_reminders(request)
+        best = min(best, time.perf_counter() - start)
+    return best / len(requests)
+
+
+def main() -> None:
+    scratch = tempfile.mkdtemp()
+    setup_django(os.path.join(scratch, "list.sqlite3"), os.path.join(scratch, "cache"))
+    create_reminders()
+
+    from django.core.cache import caches
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+
+    factory = RequestFactory()
+    requests = [
+        factory.post(
+            "/list_reminders",
+            json.dumps({"zulip_user_email": f"user{user}@monadical.com"}),
+            content_type="application/json",
+        )
+        for user in range(USERS)
+    ]
+    for name, alias in (("in memory", "default"), ("file", "reminder_lists")):
+        with override_settings(REMINDERS_LIST_CACHE=alias):
+            caches[alias].clear()
+            miss = time_lists(requests, invalidate=True)
+            time_lists(requests, invalidate=False, repeat=1)  # Fill the cache
+            hit = time_lists(requests, invalidate=False)
+        print(
+            f"{name:>10}: miss {miss * 1e6:7.0f} us, hit {hit * 1e6:7.0f} us, "
+            f"{miss / hit:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
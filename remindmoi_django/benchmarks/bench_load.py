@@ -0,0 +1,279 @@
+"""
+End-to-end load test, offline.
+
+Runs the whole system in one process against a scratch SQLite database:
+the bot handler (RemindMoiHandler, with its AsyncBotRuntime) answers a
+synthetic stream of commands through the Django backend, served on
+ENDPOINT_URL (127.0.0.1:8000) by a threaded WSGI server, while the
+dispatcher sends the reminders. Zulip and CalDAV are local stand-ins
+(benchmarks.fakes) adding the given latency to every call.
+
+Relative reminders are written as if their message was sent a minute ago,
+so they fall due during the run. Reports command throughput and latency
+(message received to reply sent), delivery lag (message sent to Zulip
+minus the reminder deadline) and database write rates.
+
+    cd remindmoi_django && python -m benchmarks.bench_load --messages 1000 --rate 50
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+from wsgiref.simple_server import WSGIRequestHandler
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USERS = 50
+# Command mix: (weight, kind)
+MIX = [(50, "add"), (15, "list"), (10, "bulk_add"), (10, "remove"), (5, "repeat"), (10, "calendar")]
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class BotHandler(object):
+    """
+    Stands for zulip_bots' bot handler: records when each reply is sent.
+    """
+
+    def __init__(self) -> None:
+        self.replies: List = []
+        self.lock = threading.Lock()
+
+    def send_reply(self, message: Dict, response: str) -> None:
+        with self.lock:
+            self.replies.append((message, response, time.perf_counter()))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def make_message(index: int, kind: str, lead: float) -> Dict:
+    user = f"user{index % USERS}@monadical.com"
+    backdate = 0.0
+    if kind == "add":
+        content = f"add 1 minutes load test {index}"
+        backdate = 60 - lead  # Due lead seconds after it is received
+    elif kind == "bulk_add":
+        content = "add\n1 minutes first\n1 minutes second\n1 minutes third"
+        backdate = 60 - lead
+    elif kind == "list":
+        content = "list"
+    elif kind == "remove":
+        content = f"remove {random.randint(1, index + 1)}"
+    elif kind == "repeat":
+        content = f"repeat {random.randint(1, index + 1)} every 1 days"
+    else:
+        content = "--calendar 16-06-2030 18:00"
+    return {
+        "id": index,
+        "type": "private",
+        "content": content,
+        "backdate": backdate,
+        "sender_email": user,
+        "sender_full_name": f"User {index % USERS}",
+        "display_recipient": [{"email": user}],
+        "kind": kind,
+    }
+
+
+def setup_django(database: str) -> None:
+    os.environ["REMINDMOI_DB_ENGINE"] = "sqlite3"
+    os.environ["REMINDMOI_DB_NAME"] = database
+    os.environ["REMINDMOI_DISPATCH_IN_PROCESS"] = "1"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "remindmoi.settings")
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def stand_in_services(zulip_latency: float, caldav_latency: float):
+    import zulip
+
+    from benchmarks.fakes import FakeCalDAV, FakeZulip
+    from remindmoi_bot import calendars, zulip_utils
+
+    members = [
+        {"full_name": f"User {index}", "email": f"user{index}@monadical.com"}
+        for index in range(USERS)
+    ]
+    fake_zulip = FakeZulip(zulip_latency, members).start()
+    fake_caldav = FakeCalDAV(caldav_latency).start()
+
+    client = zulip.Client(email="bot@monadical.com", api_key="key", site=fake_zulip.url)
+    zulip_utils.get_client = lambda: client
+    calendars.CALDAV_URL = f"{fake_caldav.url}/remote.php/dav"
+
+    class Secrets(object):
+        def get(self):
+            return {"client_id": "id", "client_secret": "secret", "token_uri": "/token"}
+
+    calendars.client_secrets = Secrets()
+    return fake_zulip, fake_caldav
+
+
+def create_oauth_users() -> None:
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from remindmoi_bot.models import OAuthUser
+
+    OAuthUser.objects.bulk_create(
+        [
+            OAuthUser(
+                zulip_user_email=f"user{index}@monadical.com",
+                user_id=f"user{index}",
+                access_token=f"access{index}",
+                refresh_token=f"refresh{index}",
+                token_expiry=timezone.now() + timedelta(days=1),
+            )
+            for index in range(USERS)
+        ]
+    )
+
+
+def serve_backend(port: int):
+    from django.core.servers.basehttp import ThreadedWSGIServer
+
+    from remindmoi.wsgi import application  # Starts the dispatcher
+
+    server = ThreadedWSGIServer(("127.0.0.1", port), QuietHandler)
+    server.set_app(application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def table_counts() -> Dict[str, int]:
+    from remindmoi_bot.models import HistoryEvents, Reminder, ReminderDelivery, ReminderRecipient
+
+    return {
+        model.__name__: model.objects.count()
+        for model in (Reminder, ReminderRecipient, ReminderDelivery, HistoryEvents)
+    }
+
+
+def wait_for_deliveries(timeout: float) -> None:
+    from remindmoi_bot.models import Reminder
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not Reminder.objects.filter(
+            active=True, repeat_unit__isnull=True, next_fire_at__isnull=False
+        ).exists():
+            return
+        time.sleep(0.2)
+    print(f"Some reminders were still due after {timeout:.0f} s")
+
+
+def run(args) -> None:
+    sys.path.insert(0, REPO_DIR)
+    database = os.path.join(tempfile.mkdtemp(), "load.sqlite3")
+    setup_django(database)
+    fake_zulip, fake_caldav = stand_in_services(args.zulip_latency, args.caldav_latency)
+    create_oauth_users()
+    server = serve_backend(args.port)
+    # repeat of ids removed earlier in the run answers 500s
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+    from remindmoi_bot_handler import RemindMoiHandler
+
+    random.seed(0)
+    weights, kinds = zip(*MIX)
+    messages = [
+        make_message(index, random.choices(kinds, weights)[0], args.lead)
+        for index in range(args.messages)
+    ]
+    bot_handler = BotHandler()
+    handler = RemindMoiHandler()
+    handler.initialize(bot_handler)
+
+    # Open loop: messages arrive at the given rate, however slow the replies
+    received = {}
+    before = table_counts()
+    start = time.perf_counter()
+    for index, message in enumerate(messages):
+        delay = start + index / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        received[message["id"]] = time.perf_counter()
+        message["timestamp"] = time.time() - message.pop("backdate")
+        handler.handle_message(message, bot_handler)
+    handler.runtime.stop(timeout=120)
+    elapsed = time.perf_counter() - start
+    after_commands = table_counts()
+
+    delivery_start = time.perf_counter()
+    wait_for_deliveries(args.lead + 120)
+    delivery_elapsed = time.perf_counter() - delivery_start + elapsed
+    after_deliveries = table_counts()
+
+    latencies = defaultdict(list)
+    for message, _, replied in bot_handler.replies:
+        latencies[message["kind"]].append(replied - received[message["id"]])
+    every = [value for values in latencies.values() for value in values]
+
+    print(f"{len(bot_handler.replies)} replies in {elapsed:.1f} s: {len(bot_handler.replies) / elapsed:.1f} commands/s")
+    print(f"{'command':>10} {'count':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind in sorted(latencies) + ["all"]:
+        values = every if kind == "all" else latencies[kind]
+        print(
+            f"{kind:>10} {len(values):6d} {statistics.median(values) * 1000:8.1f} "
+            f"{percentile(values, 0.99) * 1000:8.1f}"
+        )
+
+    from remindmoi_bot.models import ReminderDelivery
+
+    lags = [
+        (sent_at - fire_at).total_seconds()
+        for sent_at, fire_at in ReminderDelivery.objects.filter(
+            sent_at__isnull=False
+        ).values_list("sent_at", "fire_at")
+    ]
+    if lags:
+        print(
+            f"delivery lag: {len(lags)} messages, p50 {statistics.median(lags) * 1000:.0f} ms, "
+            f"p99 {percentile(lags, 0.99) * 1000:.0f} ms, max {max(lags) * 1000:.0f} ms"
+        )
+    for table in before:
+        written = after_commands[table] - before[table]
+        delivered = after_deliveries[table] - after_commands[table]
+        print(
+            f"{table:>18}: {written / elapsed:7.1f} rows/s during commands, "
+            f"{(written + delivered) / delivery_elapsed:7.1f} rows/s overall"
+        )
+    print(f"fake Zulip got {len(fake_zulip.messages)} messages, fake CalDAV {len(fake_caldav.events)} events")
+
+    handler.backend.close()
+    server.shutdown()
+    fake_zulip.stop()
+    fake_caldav.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=50, help="messages per second")
+    parser.add_argument("--lead", type=float, default=5, help="seconds until added reminders are due")
+    parser.add_argument("--zulip-latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--caldav-latency", type=float, default=0.2, help="seconds")
+    parser.add_argument("--port", type=int, default=8000, help="the bot's ENDPOINT_URL port")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
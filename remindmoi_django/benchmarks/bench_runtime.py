@@ -0,0 +1,80 @@
+"""
+Reply latency with a few slow commands in flight.
+
+Replays a burst of messages where some users send a slow command (a calendar
+event waiting on CalDAV) and measures, for everybody else, the time between
+the message arriving and its reply being sent: answered one by one as
+``zulip-run-bot`` did, then with ``AsyncBotRuntime``.
+
+    cd remindmoi_django && python -m benchmarks.bench_runtime
+"""
+import statistics
+import threading
+import time
+from typing import List
+
+from bot_server.runtime import AsyncBotRuntime
+
+FAST_SECONDS = 0.005
+SLOW_SECONDS = 0.5
+
+
+def make_messages(count: int, slow_every: int) -> List[dict]:
+    return [
+        {
+            "type": "private",
+            "sender_email": f"user{index % 40}@monadical.com",
+            "display_recipient": [{"email": f"user{index % 40}@monadical.com"}],
+            "slow": index % slow_every == 0,
+        }
+        for index in range(count)
+    ]
+
+
+def answer(message: dict, received: float, latencies: List[float], lock) -> None:
+    time.sleep(SLOW_SECONDS if message["slow"] else FAST_SECONDS)
+    if not message["slow"]:
+        with lock:
+            latencies.append(time.perf_counter() - received)
+
+
+def run_sync(messages: List[dict]) -> List[float]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+    received = time.perf_counter()  # The burst arrives at once
+    for message in messages:
+        answer(message, received, latencies, lock)
+    return latencies
+
+
+def run_async(messages: List[dict]) -> List[float]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+    runtime = AsyncBotRuntime()
+    runtime.start()
+    received = time.perf_counter()
+    for message in messages:
+        runtime.submit(
+            message, lambda message=message: answer(message, received, latencies, lock)
+        )
+    runtime.stop(timeout=60)
+    return latencies
+
+
+def p99(latencies: List[float]) -> float:
+    return sorted(latencies)[int(len(latencies) * 0.99)]
+
+
+def main(count: int = 200, slow_every: int = 50) -> None:
+    messages = make_messages(count, slow_every)
+    print(f"{count} messages, {count // slow_every} slow commands of {SLOW_SECONDS}s")
+    for name, run in (("sequential", run_sync), ("async runtime", run_async)):
+        latencies = run(messages)
+        print(
+            f"{name:>14}: p50 {statistics.median(latencies) * 1000:7.1f} ms"
+            f"  p99 {p99(latencies) * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Scheduling cost of the in-memory reminder schedule.
+
+Loads a million reminders into ``ReminderSchedule`` (as the dispatcher does at
+startup), adds, reschedules and cancels reminders one by one (as the views
+do), then pops them all in dispatcher-sized batches. For comparison, adds
+reminders one by one to APScheduler's ``MemoryJobStore``, which keeps a sorted
+list, at a smaller count.
+
+    cd remindmoi_django && python -m benchmarks.bench_schedule
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from remindmoi_bot.schedule import ReminderSchedule
+
+NOW = 1577836800.0  # 2020-01-01
+YEAR = 365 * 24 * 3600
+
+
+def timed(label: str, count: int, func) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>30}: {elapsed:6.2f} s, {elapsed / count * 1e6:6.2f} us each")
+
+
+def bench_schedule(count: int) -> None:
+    fire_times = [NOW + random.random() * YEAR for _ in range(count)]
+    schedule = ReminderSchedule()
+    timed(f"load {count}", count, lambda: schedule.load(enumerate(fire_times)))
+
+    fresh = ReminderSchedule()
+
+    def add_all():
+        for reminder_id, fire_at in enumerate(fire_times):
+            fresh.add(reminder_id, fire_at)
+
+    timed(f"add {count}", count, add_all)
+
+    ids = random.sample(range(count), count // 10)
+
+    def reschedule():
+        for reminder_id in ids:
+            fresh.add(reminder_id, NOW + random.random() * YEAR)
+
+    def cancel():
+        for reminder_id in ids:
+            fresh.cancel(reminder_id)
+
+    timed(f"reschedule {len(ids)}", len(ids), reschedule)
+    timed(f"cancel {len(ids)}", len(ids), cancel)
+
+    popped = []
+
+    def pop_all():
+        while True:
+            batch = fresh.pop_due(NOW + YEAR, 100)
+            if not batch:
+                break
+            popped.extend(batch)
+
+    timed(f"pop {len(fresh)}", len(fresh), pop_all)
+    assert len(popped) == count - len(ids)
+
+
+def bench_memory_jobstore(count: int) -> None:
+    from apscheduler.job import Job
+    from apscheduler.jobstores.memory import MemoryJobStore
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.date import DateTrigger
+
+    scheduler = BackgroundScheduler(timezone=pytz.utc)
+    start = datetime.fromtimestamp(NOW, pytz.utc)
+    jobs = []
+    for index in range(count):
+        run_date = start + timedelta(seconds=random.random() * YEAR)
+        jobs.append(
+            Job(
+                scheduler,
+                id=str(index),
+                func=print,
+                args=(),
+                kwargs={},
+                name="reminder",
+                trigger=DateTrigger(run_date),
+                executor="default",
+                misfire_grace_time=None,
+                coalesce=True,
+                max_instances=1,
+                next_run_time=run_date,
+            )
+        )
+
+    fresh = MemoryJobStore()
+
+    def add_all():
+        for job in jobs:
+            fresh.add_job(job)
+
+    timed(f"MemoryJobStore add {count}", count, add_all)
+
+
+def main(count: int = 1000000, jobstore_count: int = 100000) -> None:
+    random.seed(0)
+    bench_schedule(count)
+    bench_memory_jobstore(jobstore_count)
+
+
+if __name__ == "__main__":
+    main()
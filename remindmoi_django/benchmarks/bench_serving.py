@@ -0,0 +1,75 @@
+"""
+Throughput of /add_reminder and /list_reminders against a running backend.
+
+Each client thread keeps one connection open, as the bot does, and sends
+add and list requests in turn. Run it against ``manage.py runserver`` and
+against gunicorn (etc/gunicorn.conf.py) to compare:
+
+    cd remindmoi_django && python -m benchmarks.bench_serving http://127.0.0.1:8789
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from typing import List
+from urllib.parse import urlsplit
+
+
+def client(url: str, index: int, requests: int, latencies: List[float]) -> None:
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    email = f"bench{index}@monadical.com"
+    now = time.time()
+    for number in range(requests):
+        if number % 2:
+            path, body = "/list_reminders", {"zulip_user_email": email}
+        else:
+            path, body = "/add_reminder", {
+                "zulip_user_email": email,
+                "title": f"benchmark {number}",
+                "created": now,
+                "deadline": now + 365 * 24 * 3600,
+            }
+        start = time.perf_counter()
+        connection.request(
+            "POST", path, json.dumps(body), {"Content-Type": "application/json"}
+        )
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            raise RuntimeError(f"{path} answered {response.status}")
+    connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:8789")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="per client")
+    args = parser.parse_args()
+
+    latencies: List[float] = []
+    threads = [
+        threading.Thread(target=client, args=(args.url, index, args.requests, latencies))
+        for index in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} requests in {elapsed:.2f} s: {len(latencies) / elapsed:.0f} req/s")
+    print(
+        f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
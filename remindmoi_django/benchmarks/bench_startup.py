@@ -0,0 +1,82 @@
+"""
+Startup cost of a manage.py command.
+
+Times a fresh interpreter running ``django.setup()`` and importing the URL
+conf (what ``manage.py check``, ``migrate`` or a test run do), then the same
+plus the work importing the views used to do: import zulip and
+oauth2client, start the dispatcher and token refresher threads. Also prints
+the slowest imports under ``remindmoi_bot`` from ``python -X importtime``.
+Runs against a scratch SQLite database, so the dispatcher started by the
+eager case cannot send the reminders of the real one.
+
+    cd remindmoi_django && python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SETUP = (
+    "import os, threading, django; "
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'remindmoi.settings'); "
+    "django.setup(); "
+    "import remindmoi.urls; "
+)
+EAGER = (
+    "import zulip, oauth2client.client; "
+    "from remindmoi_bot import scheduler; "
+    "scheduler.start(); "
+)
+REPORT = "print(threading.active_count())"
+MIGRATE = "from django.core.management import call_command; call_command('migrate', verbosity=0)"
+
+# Every interpreter uses the scratch database
+ENV = dict(os.environ, REMINDMOI_DB_ENGINE="sqlite3")
+
+
+def run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=ENV,
+    )
+
+
+def wall_time(code: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def slowest_imports(code: str, prefix: str, count: int):
+    imports = []
+    for line in run(code, "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip().startswith(prefix):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(repeat: int = 5) -> None:
+    ENV["REMINDMOI_DB_NAME"] = os.path.join(tempfile.mkdtemp(), "startup.sqlite3")
+    run(SETUP + MIGRATE)
+    for name, code in (("lazy (now)", SETUP), ("eager (before)", SETUP + EAGER)):
+        threads = run(code + REPORT).stdout.split()[-1]
+        elapsed = wall_time(code, repeat)
+        print(f"{name:>15}: {elapsed * 1000:6.0f} ms, {threads} threads after import")
+
+    print("slowest remindmoi_bot imports (cumulative):")
+    for cumulative, name in slowest_imports(SETUP, "remindmoi_bot", 8):
+        print(f"{cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of deadline computation.
+
+Compares ``bot_server.timespec`` (deadline found once by ``parse_command`` and
+reused by the parser) with the former helpers, which called ``strptime`` or
+``fromtimestamp`` in the ``is_iso_*`` predicate and again in the parser. Also
+times the ``gettz()`` call ``convert_date_to_iso`` made for every listed
+reminder against the cached zone.
+
+    cd remindmoi_django && python -m benchmarks.bench_time
+"""
+import timeit
+from datetime import datetime, timedelta
+
+from dateutil.tz import gettz
+
+from benchmarks.bench_commands import _legacy_is_iso_date, _legacy_is_iso_time
+from bot_server.commands import parse_command
+from bot_server.timespec import get_timezone, relative_deadline
+
+TIMESTAMP = datetime(2019, 12, 31, 8, 0).timestamp()
+DEADLINE = datetime(2020, 4, 19, 11, 0, tzinfo=get_timezone("UTC"))
+
+CORPUS = [
+    ("me at 5 pm", "time"),
+    ("me at 10:30 am --multi @henry", "time"),
+    ("me at 2020-04-19 11:00", "date"),
+    ("me at 2021-01-02 23:59 --multi @juan", "date"),
+    ("me 10 minutes", "relative"),
+    ("me 2 days", "relative"),
+]
+
+
+def _legacy_compute_deadline(timestamp, time_value, time_unit):
+    if not time_unit.endswith("s"):
+        time_unit = f"{time_unit}s"
+    interval = timedelta(**{time_unit: int(time_value)})
+    return (datetime.fromtimestamp(timestamp) + interval).timestamp()
+
+
+def _legacy_time_deadline(content, timestamp):
+    tokens = content.split(" ")
+    current_time = datetime.fromtimestamp(timestamp)
+    hour, _, minutes = tokens[2].partition(":")
+    hour = int(hour) if tokens[3] == "am" else 12 + int(hour)
+    total = (hour - current_time.hour) * 60 + (int(minutes or 0) - current_time.minute)
+    return _legacy_compute_deadline(timestamp, total, "minutes")
+
+
+def _legacy_date_deadline(content):
+    tokens = content.split(" ")
+    return datetime.strptime(f"{tokens[2]} {tokens[3]}", "%Y-%m-%d %H:%M").timestamp()
+
+
+def run_legacy():
+    for content, kind in CORPUS:
+        if kind == "date":
+            _legacy_is_iso_date(content, TIMESTAMP)
+            _legacy_date_deadline(content)
+        elif kind == "time":
+            _legacy_is_iso_date(content, TIMESTAMP)
+            _legacy_is_iso_time(content, TIMESTAMP)
+            _legacy_time_deadline(content, TIMESTAMP)
+        else:
+            tokens = content.split(" ")
+            _legacy_compute_deadline(TIMESTAMP, tokens[1], tokens[2])
+
+
+def run_timespec():
+    for content, kind in CORPUS:
+        command = parse_command(content, TIMESTAMP)
+        if command.deadline is None:
+            relative_deadline(TIMESTAMP, int(command.tokens[1]), command.tokens[2])
+
+
+def run_legacy_iso():
+    DEADLINE.replace(tzinfo=gettz()).isoformat()
+
+
+def run_cached_iso():
+    DEADLINE.astimezone(get_timezone()).isoformat()
+
+
+def main(number: int = 5000) -> None:
+    messages = number * len(CORPUS)
+    for name, func in (("legacy helpers", run_legacy), ("timespec", run_timespec)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>14}: {elapsed / messages * 1e6:7.2f} us/message")
+    for name, func in (("gettz()", run_legacy_iso), ("cached zone", run_cached_iso)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>14}: {elapsed / number * 1e6:7.2f} us/listed reminder")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Local stand-ins for the Zulip and CalDAV servers, used by the load harness.
+
+Both are plain HTTP servers on 127.0.0.1 that answer only what the real
+clients (zulip.Client, caldav.DAVClient) ask for, after an injected latency.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), self.handler_class)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, as the real servers
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def answer(self, status: int, body: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ZulipHandler(Handler):
+    def do_GET(self) -> None:
+        server: FakeZulip = self.server
+        if self.path.startswith("/api/v1/users"):
+            self.json({"result": "success", "members": server.members})
+        elif self.path.startswith("/api/v1/events"):
+            # Long poll: nothing happens to the roster during a run
+            server.stopped.wait(30)
+            self.json({"result": "success", "events": [{"type": "heartbeat", "id": 0}]})
+        else:
+            self.json({"result": "error", "msg": "Not found"}, 404)
+
+    def do_POST(self) -> None:
+        server: FakeZulip = self.server
+        body = self.body()
+        if self.path.startswith("/api/v1/messages"):
+            time.sleep(server.latency)
+            fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            with server.lock:
+                server.messages.append((time.time(), fields))
+                message_id = len(server.messages)
+            self.json({"result": "success", "id": message_id})
+        elif self.path.startswith("/api/v1/register"):
+            self.json({"result": "success", "queue_id": "1", "last_event_id": -1})
+        else:
+            self.json({"result": "error", "msg": "Not found"}, 404)
+
+    def do_DELETE(self) -> None:
+        # Event queues are deleted on exit
+        self.body()
+        self.json({"result": "success"})
+
+    def json(self, data: Dict, status: int = 200) -> None:
+        self.answer(status, json.dumps(data).encode())
+
+
+class FakeZulip(FakeServer):
+    """
+    Accepts messages (kept in messages with their arrival time) and serves
+    members as the realm roster.
+    """
+
+    handler_class = ZulipHandler
+
+    def __init__(self, latency: float = 0.0, members: List[Dict] = ()) -> None:
+        super().__init__(latency)
+        self.members = list(members)
+        self.messages: List = []
+
+
+MULTISTATUS = """<?xml version="1.0" encoding="utf-8"?>
+<d:multistatus xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">{}</d:multistatus>"""
+RESPONSE = """<d:response><d:href>{href}</d:href><d:propstat><d:prop>{props}</d:prop>
+<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>"""
+COLLECTION = "<d:resourcetype><d:collection/></d:resourcetype>"
+CALENDAR = "<d:resourcetype><d:collection/><c:calendar/></d:resourcetype>"
+
+
+class CalDAVHandler(Handler):
+    def do_OPTIONS(self) -> None:
+        self.send_response(200)
+        self.send_header("DAV", "1, 2, calendar-access")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PROPFIND(self) -> None:
+        body = self.body().decode()
+        user = self.path.strip("/").split("/")[-1] or "user"
+        if "current-user-principal" in body:
+            props = f"<d:current-user-principal><d:href>/principals/{user}/</d:href></d:current-user-principal>"
+            responses = [RESPONSE.format(href=self.path, props=props)]
+        elif "calendar-home-set" in body:
+            props = f"<c:calendar-home-set><d:href>/calendars/{user}/</d:href></c:calendar-home-set>"
+            responses = [RESPONSE.format(href=self.path, props=props)]
+        else:  # Calendars in the home
+            responses = [
+                RESPONSE.format(href=self.path, props=COLLECTION),
+                RESPONSE.format(
+                    href=f"{self.path}personal/",
+                    props=f"{CALENDAR}<d:displayname>Personal</d:displayname>",
+                ),
+            ]
+        self.answer(207, MULTISTATUS.format("".join(responses)).encode(), "application/xml")
+
+    def do_PUT(self) -> None:
+        server: FakeCalDAV = self.server
+        event = self.body()
+        time.sleep(server.latency)
+        with server.lock:
+            server.events.append((time.time(), self.path, event))
+        self.answer(201)
+
+
+class FakeCalDAV(FakeServer):
+    """
+    One "Personal" calendar per principal, events are kept in events.
+    """
+
+    handler_class = CalDAVHandler
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self.events: List = []
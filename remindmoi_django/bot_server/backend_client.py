@@ -0,0 +1,80 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .constants import (
+    BACKEND_POOL_SIZE,
+    BACKEND_RETRIES,
+    BACKEND_RETRY_BACKOFF,
+    BACKEND_RETRY_STATUSES,
+    BACKEND_TIMEOUTS,
+    DEFAULT_BACKEND_TIMEOUT,
+)
+from .tracing import REQUEST_ID_HEADER, current_request_id, span
+
+# urllib3 1.26 renamed Retry's method_whitelist to allowed_methods, 2.0
+# dropped the old name.
+RETRY_METHODS_ARGUMENT = (
+    "allowed_methods"
+    if hasattr(Retry, "DEFAULT_ALLOWED_METHODS")
+    else "method_whitelist"
+)
+
+
+class BackendClient(object):
+    """
+    Keep-alive HTTP client used by the bot to talk to the Django backend.
+    Connections are pooled, every endpoint gets its own (connect, read)
+    timeout and failed connections are retried a bounded number of times.
+    Requests carry the request id of the current command.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = BACKEND_POOL_SIZE,
+        retries: int = BACKEND_RETRIES,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> None:
+        self.timeouts = BACKEND_TIMEOUTS if timeouts is None else timeouts
+        # Only connection errors are retried for every method: the request
+        # never reached the backend, so creating a reminder twice is impossible.
+        # Read errors and 5xx answers are only retried for idempotent GETs.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=BACKEND_RETRY_BACKOFF,
+            status_forcelist=BACKEND_RETRY_STATUSES,
+            raise_on_status=False,
+            **{RETRY_METHODS_ARGUMENT: frozenset(["GET"])},
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def timeout_for(self, url: str) -> Tuple[float, float]:
+        return self.timeouts.get(url, DEFAULT_BACKEND_TIMEOUT)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout_for(url))
+        request_id = current_request_id()
+        if request_id is not None:
+            kwargs["headers"] = {REQUEST_ID_HEADER: request_id, **kwargs.get("headers", {})}
+        with span("backend", method=method, path=urlsplit(url).path):
+            return self.session.request(method, url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
@@ -1,7 +1,5 @@
-import re
 import urllib.parse
-from typing import Any, Dict
-from datetime import timedelta, datetime
+from typing import Any, Dict, List, Optional
 
 from .constants import (
     UNITS,
@@ -10,6 +8,21 @@ from .constants import (
     STREAM_TYPES,
     PUBLIC_STREAM_TYPE,
 )
+from .commands import (
+    ALL_REPEAT_UNITS,
+    tokenize,
+    bulk_add_lines,
+    match_add,
+    match_remove,
+    match_list,
+    match_repeat,
+    match_multi_remind,
+    match_remindme,
+    match_calendar_remind,
+    match_iso_time,
+    match_iso_date,
+)
+from .timespec import clock_deadline, date_deadline, relative_deadline, to_24_hour
 
 
 def get_url_params(message):
@@ -51,64 +64,36 @@ def is_add_command(content: str, units=UNITS + SINGULAR_UNITS) -> bool:
     """
     Ensure message is in form <COMMAND> reminder <int> UNIT <str>
     """
-    try:
-        command = content.split(" ", maxsplit=4)  # Ensure the last element is str
-        assert command[0] == "add"
-        assert type(int(command[1])) == int
-        assert command[2] in units
-        assert type(command[3]) == str
-        return True
-    except (IndexError, AssertionError, ValueError):
-        return False
+    return match_add(content, tokenize(content), 0, units=units)
 
 
 def is_remove_command(content: str) -> bool:
-    try:
-        command = content.split(" ")
-        assert command[0] == "remove"
-        assert type(int(command[1])) == int
-        return True
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_remove(content, tokenize(content), 0)
 
 
 def is_list_command(content: str) -> bool:
-    try:
-        command = content.split(" ")
-        assert command[0] == "list"
-        return True
-    except (AssertionError, IndexError, ValueError):
-        return False
-
-
-def is_repeat_reminder_command(content: str, units=UNITS + SINGULAR_UNITS) -> bool:
-    try:
-        command = content.split(" ")
-        assert command[0] == "repeat"
-        assert type(int(command[1])) == int
-        assert command[2] == "every"
-        assert type(int(command[3])) == int
-        assert command[4] in units
-        return True
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_list(content, tokenize(content), 0)
 
 
-def is_multi_remind_command(content: str) -> bool:
-    try:
-        result = re.match(r"multi\s+\d+(((@\w+)(\s)?)+)?", content)
+def is_repeat_reminder_command(content: str, units=ALL_REPEAT_UNITS) -> bool:
+    return match_repeat(content, tokenize(content), 0, units=units)
 
-        return result is not None
-    except (AssertionError, IndexError, ValueError):
-        return False
+
+def is_multi_remind_command(content: str) -> bool:
+    return match_multi_remind(content, [], 0) is not None
 
 
 def is_remindme_command(content: str) -> bool:
-    try:
-        result = re.match(r"me\s+\d+\s+\w+(\s+--multi\s+(@\w+)+)?", content)
-        return result is not None
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_remindme(content, [], 0) is not None
+
+
+def rejoin_tokens(tokens: List[str], maxsplit: int) -> List[str]:
+    """
+    Same as content.split(" ", maxsplit) for already tokenized content.
+    """
+    if len(tokens) <= maxsplit + 1:
+        return tokens
+    return tokens[:maxsplit] + [" ".join(tokens[maxsplit:])]
 
 
 def has_multi(content: str) -> bool:
@@ -121,64 +106,27 @@ def is_calendar_remind_command(content: str) -> bool:
     --calendar 10-12-2020 01:00 (default: monadical cloud)
     --calendar 10-12-2020 01:00 --type google --email hapm.develop@gmail.com
     """
-    try:
-        result = re.match(
-            r"--calendar\s(((0?([1-9]|1[0-9]|2[0-9]|3[0-1]))-(0?([1-9]|1[0-2]))-([1-2][0-9][0-9][0-9]))\s((0?([0-9]|1[0-9]|2[0-3])):(([0-5]?[0-9])))(\s(--type\s\w*\s--email\s(\w+[/.-]*?\w)*@\w*.\w*)?)?)",
-            content,
-        )
-        return result is not None
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_calendar_remind(content, [], 0) is not None
 
 
 def is_iso_time_command(content: str, timestamp: int) -> bool:
-    try:
-        result = re.match(
-            r"me at\s+\b([0-9]|1[0-2])\b(:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)?\s+(am|pm)*(\s+--multi\s+(@\w+)+)?",
-            content,
-            flags=re.IGNORECASE,
-        )
-
-        if result is not None:
-            current_time = datetime.fromtimestamp(timestamp).time()
-            hour = int(result.group(1))
-            period = result.group(4).lower()
-            reminder_hour = (
-                hour if period == "am" or (hour == 12 and period == "pm") else 12 + hour
-            )
-            minutes = int(result.group(3)) if result.group(3) is not None else 0
-            reminder_time = current_time.replace(hour=reminder_hour, minute=minutes)
-
-            return reminder_time > current_time
-        return False
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_iso_time(content, [], timestamp) is not None
 
 
 def is_iso_date_command(content: str, timestamp: int) -> bool:
-    try:
-        result = re.match(
-            r"me\s+at\s+\b(\b(20[2-8][0-9]|209[0-9]|2[1-9][0-9]{2}|[3-9][0-9]{3})\b-\b(0+[1-9]|1[0-2])\b-\b(0+[1-9]|[12][0-9]|3[01])\b)\b\s+\b(\b(0+[0-9]|1[0-9]|2[0-3])\b:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)(\s+--multi\s+(@\w+)+)?",
-            content,
-        )
-        if result is not None:
-            remainder_datetime = f"{result.group(1)} {result.group(5)}"
-            new_datetime = datetime.strptime(remainder_datetime, "%Y-%m-%d %H:%M")
-            current_datetime = datetime.fromtimestamp(timestamp)
-            return new_datetime > current_datetime
-        return False
-    except (AssertionError, IndexError, ValueError):
-        return False
+    return match_iso_date(content, [], timestamp) is not None
 
 
-def parse_remindme_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
+def parse_remindme_command_content(
+    message: Dict[str, Any], tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
     """
     Given a message object with reminder details,
     construct a JSON/dict.
     """
     url_params = get_url_params(message)
     url = create_conversation_url(**url_params)
-    content = message["content"].split(" ", maxsplit=4)
+    content = rejoin_tokens(tokens or tokenize(message["content"]), maxsplit=4)
     zulip_usernames = []
     is_multi = has_multi(message["content"])
     if is_multi:
@@ -198,13 +146,15 @@ def parse_remindme_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def parse_add_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
+def parse_add_command_content(
+    message: Dict[str, Any], tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
     """
     Given a message object with reminder details,
     construct a JSON/dict.
     """
-    content = message["content"].split(
-        " ", maxsplit=3
+    content = rejoin_tokens(
+        tokens or tokenize(message["content"]), maxsplit=3
     )  # Ensure the last element is str
     return {
         "zulip_user_email": message["sender_email"],
@@ -217,7 +167,24 @@ def parse_add_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def parse_calendar_remind_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
+def parse_bulk_add_command_content(
+    message: Dict[str, Any], tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    One add reminder per line after "add":
+    {'reminders': [{... same as parse_add_command_content ...}, ...]}
+    """
+    return {
+        "reminders": [
+            parse_add_command_content(message, tokenize("add " + line))
+            for line in bulk_add_lines(message["content"])
+        ]
+    }
+
+
+def parse_calendar_remind_command_content(
+    message: Dict[str, Any], tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
     """
     --calendar 10-12-2020 01:00 --type google --email hapm.develop@gmail.com
     """
@@ -225,7 +192,7 @@ def parse_calendar_remind_command_content(message: Dict[str, Any]) -> Dict[str,
     url_params = get_url_params(message)
     url = create_conversation_url(**url_params)
 
-    command = message["content"].split(" ", maxsplit=6)
+    command = rejoin_tokens(tokens or tokenize(message["content"]), maxsplit=6)
     api_type = None
 
     email = message.get("sender_email", None)
@@ -242,13 +209,17 @@ def parse_calendar_remind_command_content(message: Dict[str, Any]) -> Dict[str,
     }
 
 
-def parse_remove_command_content(content: str) -> Dict[str, Any]:
-    command = content.split(" ")
+def parse_remove_command_content(
+    content: str, tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    command = tokens or tokenize(content)
     return {"reminder_id": command[1]}
 
 
-def parse_repeat_command_content(content: str) -> Dict[str, Any]:
-    command = content.split(" ")
+def parse_repeat_command_content(
+    content: str, tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    command = tokens or tokenize(content)
     return {
         "reminder_id": command[1],
         "repeat_unit": command[4],
@@ -256,25 +227,31 @@ def parse_repeat_command_content(content: str) -> Dict[str, Any]:
     }
 
 
-def parse_multi_remind_command_content(content: str) -> Dict[str, Any]:
+def parse_multi_remind_command_content(
+    content: str, tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
     """
     multiremind 23 @**Jose** @**Max** ->
     {'reminder_id': 23, 'users_to_remind': ['Jose', Max]}
     """
-    command = content.split(" ", maxsplit=2)
+    command = rejoin_tokens(tokens or tokenize(content), maxsplit=2)
     users_to_remind = command[2].replace("*", "").replace("@", " ").strip().split(" ",)
     return {"reminder_id": command[1], "users_to_remind": users_to_remind}
 
 
-def parse_add_is_time_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
+def parse_add_is_time_command_content(
+    message: Dict[str, Any],
+    tokens: Optional[List[str]] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
     """
     Given a message object with reminder details,
-    construct a JSON/dict.
+    construct a JSON/dict. deadline is the one found by parse_command.
     """
     url_params = get_url_params(message)
     url = create_conversation_url(**url_params)
 
-    content = message["content"].split(" ")
+    content = tokens or tokenize(message["content"])
     zulip_usernames = []
     is_multi = has_multi(message["content"])
     if is_multi:
@@ -282,44 +259,36 @@ def parse_add_is_time_command_content(message: Dict[str, Any]) -> Dict[str, Any]
             content[5].replace("*", "").replace("@", " ").strip().split(" ",)
         )
 
-    current_time = datetime.fromtimestamp(message["timestamp"])
-    time_period = content[3]
-    reminder_time_splitted = content[2].split(":")
-    reminder_splitted_hour = int(reminder_time_splitted[0])
-    reminder_hour = (
-        reminder_splitted_hour if time_period == "am" else 12 + reminder_splitted_hour
-    )
-    try:
-        reminder_minutes = int(reminder_time_splitted[1])
-    except IndexError:
-        reminder_minutes = 0
-
-    total_time = (reminder_hour - current_time.hour) * 60 + (
-        reminder_minutes - current_time.minute
-    )
+    if deadline is None:
+        hour, _, minutes = content[2].partition(":")
+        deadline = clock_deadline(
+            message["timestamp"], to_24_hour(int(hour), content[3]), int(minutes or 0)
+        )
 
     return {
         "zulip_user_email": message["sender_email"],
         "zulip_usernames": zulip_usernames,
         "title": url,
         "created": message["timestamp"],
-        "deadline": compute_deadline_timestamp(
-            message["timestamp"], total_time, "minutes"
-        ),
+        "deadline": deadline,
         "is_multi": is_multi,
         "active": True,
     }
 
 
-def parse_add_date_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
+def parse_add_date_command_content(
+    message: Dict[str, Any],
+    tokens: Optional[List[str]] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
     """
     Given a message object with reminder details,
-    construct a JSON/dict.
+    construct a JSON/dict. deadline is the one found by parse_command.
     """
     url_params = get_url_params(message)
     url = create_conversation_url(**url_params)
 
-    content = message["content"].split(" ")
+    content = tokens or tokenize(message["content"])
 
     zulip_usernames = []
     is_multi = has_multi(message["content"])
@@ -328,8 +297,12 @@ def parse_add_date_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
             content[5].replace("*", "").replace("@", " ").strip().split(" ",)
         )
 
-    reminder_datetime = f"{content[2]} {content[3]}"
-    deadline = datetime.strptime(reminder_datetime, "%Y-%m-%d %H:%M").timestamp()
+    if deadline is None:
+        year, month, day = content[2].split("-")
+        hour, minutes = content[3].split(":")
+        deadline = date_deadline(
+            int(year), int(month), int(day), int(hour), int(minutes)
+        )
     return {
         "zulip_user_email": message["sender_email"],
         "zulip_usernames": zulip_usernames,
@@ -341,29 +314,41 @@ def parse_add_date_command_content(message: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def parse_list_command_content(
+    message: Dict[str, Any], tokens: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    list | list next | list --page <int>
+    """
+    command = tokens or tokenize(message["content"])
+    page = None
+    if len(command) >= 3 and command[1] == "--page" and command[2].isdigit():
+        page = max(int(command[2]), 1)
+    return {
+        "zulip_user_email": message["sender_email"],
+        "next": len(command) >= 2 and command[1] == "next",
+        "page": page,
+    }
+
+
 def generate_reminders_list(response: Dict[str, Any]) -> str:
-    bot_response = ""
     reminders_list = response["reminders_list"]
     if not reminders_list:
         return "No reminders avaliable."
-    for reminder in reminders_list:
-        bot_response += f"""
-        \nReminder id {reminder['reminder_id']}, titled {reminder['title']}, is scheduled on {reminder['deadline']}
-        """
-    return bot_response
+    lines = [
+        f"Reminder id {reminder['reminder_id']}, titled {reminder['title']}, is scheduled on {reminder['deadline']}"
+        for reminder in reminders_list
+    ]
+    if response.get("next_cursor"):
+        lines.append("Send `list next` to see more reminders.")
+    return "\n\n".join(lines)
 
 
 def compute_deadline_timestamp(
-    timestamp_submitted: str, time_value: int, time_unit: str
-) -> str:
+    timestamp_submitted: float, time_value: int, time_unit: str
+) -> float:
     """
     Given a submitted stamp and an interval,
     return deadline timestamp.
     """
-
-    if time_unit in SINGULAR_UNITS:  # Convert singular units to plural
-        time_unit = f"{time_unit}s"
-
-    interval = timedelta(**{time_unit: int(time_value)})
-    datetime_submitted = datetime.fromtimestamp(timestamp_submitted)
-    return (datetime_submitted + interval).timestamp()
+    return relative_deadline(timestamp_submitted, int(time_value), time_unit)
@@ -0,0 +1,209 @@
+"""
+Command grammar of the bot.
+
+A message is tokenized once, its first token selects the candidate commands
+from ``DISPATCH_TABLE`` and each candidate is checked with precompiled
+patterns. The resulting ``Command`` is shared by the predicate and the
+``parse_*_command_content`` step so the content is never split twice.
+"""
+import re
+from typing import Callable, Dict, List, Match, NamedTuple, Optional, Tuple, Union
+
+from .constants import UNITS, SINGULAR_UNITS
+from .timespec import clock_deadline, date_deadline, to_24_hour
+
+ISO_DATE_COMMAND = "iso_date"
+ISO_TIME_COMMAND = "iso_time"
+REMINDME_COMMAND = "remindme"
+ADD_COMMAND = "add"
+BULK_ADD_COMMAND = "bulk_add"
+REMOVE_COMMAND = "remove"
+LIST_COMMAND = "list"
+REPEAT_COMMAND = "repeat"
+MULTI_REMIND_COMMAND = "multi"
+CALENDAR_REMIND_COMMAND = "calendar"
+
+ALL_UNITS = frozenset(UNITS + SINGULAR_UNITS)
+ALL_REPEAT_UNITS = ALL_UNITS | {"month", "months"}
+
+INT_RE = re.compile(r"[-+]?\d+\Z")
+MULTI_REMIND_RE = re.compile(r"multi\s+\d+(((@\w+)(\s)?)+)?")
+REMINDME_RE = re.compile(r"me\s+\d+\s+\w+(\s+--multi\s+(@\w+)+)?")
+CALENDAR_REMIND_RE = re.compile(
+    r"--calendar\s(((0?([1-9]|1[0-9]|2[0-9]|3[0-1]))-(0?([1-9]|1[0-2]))-([1-2][0-9][0-9][0-9]))\s((0?([0-9]|1[0-9]|2[0-3])):(([0-5]?[0-9])))(\s(--type\s\w*\s--email\s(\w+[/.-]*?\w)*@\w*.\w*)?)?)"
+)
+ISO_TIME_RE = re.compile(
+    r"me at\s+\b([0-9]|1[0-2])\b(:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)?\s+(am|pm)*(\s+--multi\s+(@\w+)+)?",
+    flags=re.IGNORECASE,
+)
+ISO_DATE_RE = re.compile(
+    r"me\s+at\s+\b(\b(20[2-8][0-9]|209[0-9]|2[1-9][0-9]{2}|[3-9][0-9]{3})\b-\b(0+[1-9]|1[0-2])\b-\b(0+[1-9]|[12][0-9]|3[01])\b)\b\s+\b(\b(0+[0-9]|1[0-9]|2[0-3])\b:\b(0+[0-9]|[1-4][0-9]|5[0-9])\b)(\s+--multi\s+(@\w+)+)?"
+)
+
+
+class Command(NamedTuple):
+    name: str
+    tokens: List[str]
+    match: Optional[Match]
+    # Deadline timestamp, for the commands giving a time of day or a date
+    deadline: Optional[float] = None
+
+
+class TimeMatch(NamedTuple):
+    match: Match
+    deadline: float
+
+
+def tokenize(content: str) -> List[str]:
+    return content.split(" ")
+
+
+def is_int(token: str) -> bool:
+    return INT_RE.match(token) is not None
+
+
+def match_add(
+    content: str, tokens: List[str], timestamp: int, units=ALL_UNITS
+) -> bool:
+    """
+    <COMMAND> <int> UNIT <str>
+    """
+    return (
+        len(tokens) >= 4
+        and tokens[0] == "add"
+        and is_int(tokens[1])
+        and tokens[2] in units
+    )
+
+
+def bulk_add_lines(content: str) -> List[str]:
+    """
+    The non-empty reminder lines following the "add" line.
+    """
+    return [line.strip() for line in content.splitlines()[1:] if line.strip()]
+
+
+def match_bulk_add(
+    content: str, tokens: List[str], timestamp: int, units=ALL_UNITS
+) -> bool:
+    """
+    add
+    <int> UNIT <str>
+    <int> UNIT <str>
+    """
+    if content.partition("\n")[0].strip() != "add":
+        return False
+    lines = bulk_add_lines(content)
+    return bool(lines) and all(
+        match_add(line, tokenize("add " + line), timestamp, units=units)
+        for line in lines
+    )
+
+
+def match_remove(content: str, tokens: List[str], timestamp: int) -> bool:
+    return len(tokens) >= 2 and tokens[0] == "remove" and is_int(tokens[1])
+
+
+def match_list(content: str, tokens: List[str], timestamp: int) -> bool:
+    return tokens[0] == "list"
+
+
+def match_repeat(
+    content: str, tokens: List[str], timestamp: int, units=ALL_REPEAT_UNITS
+) -> bool:
+    return (
+        len(tokens) >= 5
+        and tokens[0] == "repeat"
+        and is_int(tokens[1])
+        and tokens[2] == "every"
+        and is_int(tokens[3])
+        and tokens[4] in units
+    )
+
+
+def match_multi_remind(
+    content: str, tokens: List[str], timestamp: int
+) -> Optional[Match]:
+    return MULTI_REMIND_RE.match(content)
+
+
+def match_remindme(content: str, tokens: List[str], timestamp: int) -> Optional[Match]:
+    return REMINDME_RE.match(content)
+
+
+def match_calendar_remind(
+    content: str, tokens: List[str], timestamp: int
+) -> Optional[Match]:
+    return CALENDAR_REMIND_RE.match(content)
+
+
+def match_iso_time(
+    content: str, tokens: List[str], timestamp: int
+) -> Optional[TimeMatch]:
+    result = ISO_TIME_RE.match(content)
+    if result is None or result.group(4) is None:
+        return None
+    hour = to_24_hour(int(result.group(1)), result.group(4))
+    minutes = int(result.group(3)) if result.group(3) is not None else 0
+    deadline = clock_deadline(timestamp, hour, minutes)
+    if deadline is None or deadline <= timestamp:
+        return None
+    return TimeMatch(result, deadline)
+
+
+def match_iso_date(
+    content: str, tokens: List[str], timestamp: int
+) -> Optional[TimeMatch]:
+    result = ISO_DATE_RE.match(content)
+    if result is None:
+        return None
+    deadline = date_deadline(
+        int(result.group(2)),
+        int(result.group(3)),
+        int(result.group(4)),
+        int(result.group(6)),
+        int(result.group(7)),
+    )
+    if deadline is None or deadline <= timestamp:
+        return None
+    return TimeMatch(result, deadline)
+
+
+# Keyword commands answer a bool, pattern commands their match object and
+# time commands their match along with the deadline.
+Matcher = Callable[
+    [str, List[str], int], Union[bool, Optional[Match], Optional[TimeMatch]]
+]
+
+# First token -> candidate commands, in priority order.
+DISPATCH_TABLE: Dict[str, Tuple[Tuple[str, Matcher], ...]] = {
+    "me": (
+        (ISO_DATE_COMMAND, match_iso_date),
+        (ISO_TIME_COMMAND, match_iso_time),
+        (REMINDME_COMMAND, match_remindme),
+    ),
+    "add": ((BULK_ADD_COMMAND, match_bulk_add), (ADD_COMMAND, match_add)),
+    "remove": ((REMOVE_COMMAND, match_remove),),
+    "list": ((LIST_COMMAND, match_list),),
+    "repeat": ((REPEAT_COMMAND, match_repeat),),
+    "multi": ((MULTI_REMIND_COMMAND, match_multi_remind),),
+    "--calendar": ((CALENDAR_REMIND_COMMAND, match_calendar_remind),),
+}
+
+
+def parse_command(content: str, timestamp: int) -> Optional[Command]:
+    """
+    Return the first command matching the content, or None.
+    """
+    tokens = tokenize(content)
+    # "me at" is matched case-insensitively, every other keyword is exact.
+    # A multi-line command ("add" batches) is keyed by its first line.
+    keyword = tokens[0].partition("\n")[0].strip().lower()
+    candidates = DISPATCH_TABLE.get(keyword, ())
+    for name, matcher in candidates:
+        result = matcher(content, tokens, timestamp)
+        if isinstance(result, TimeMatch):
+            return Command(name, tokens, result.match, result.deadline)
+        if result:
+            return Command(name, tokens, None if result is True else result)
+    return None
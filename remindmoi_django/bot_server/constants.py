@@ -1,20 +1,62 @@
+import os
+
 UNITS = ["minutes", "hours", "days", "weeks"]
 SINGULAR_UNITS = ["minute", "hour", "day", "week"]
 REPEAT_UNITS = ["weekly", "daily", "monthly"] + ["minutely"]  # Remove after testing
 
 DEBUG = False
 
-# End points
-ENDPOINT_URL = "http://localhost:8000"
+# Zone of the times users type ("me at 5 pm"), None for the machine zone
+BOT_TIMEZONE = None
+
+# End points. The default is runserver's, gunicorn (etc/supervisord.conf)
+# listens on REMINDMOI_BIND
+ENDPOINT_URL = os.environ.get("REMINDMOI_ENDPOINT_URL", "http://localhost:8000")
 ADD_ENDPOINT = ENDPOINT_URL + "/add_reminder"
+BULK_ADD_ENDPOINT = ENDPOINT_URL + "/bulk_add_reminders"
 REMOVE_ENDPOINT = ENDPOINT_URL + "/remove_reminder"
 LIST_ENDPOINT = ENDPOINT_URL + "/list_reminders"
 REPEAT_ENDPOINT = ENDPOINT_URL + "/repeat_reminder"
 MULTI_REMIND_ENDPOINT = ENDPOINT_URL + "/multi_remind"
-CALENDAR_REMIND_ENDPOINT = ENDPOINT_URL + "/create-calendar-event"
+CALENDAR_REMIND_ENDPOINT = ENDPOINT_URL + "/calendar-remind"
 AUTHORIZED_USER = ENDPOINT_URL + "/email-authorized"
 REFRESH_TOKEN = ENDPOINT_URL + "/auth/nextcloud/refresh-token"
 
+# Backend HTTP client. Timeouts are (connect, read) in seconds.
+BACKEND_POOL_SIZE = 10
+BACKEND_RETRIES = 2
+BACKEND_RETRY_BACKOFF = 0.1
+BACKEND_RETRY_STATUSES = (502, 503, 504)
+DEFAULT_BACKEND_TIMEOUT = (3.05, 10)
+BACKEND_TIMEOUTS = {
+    ADD_ENDPOINT: (3.05, 10),
+    BULK_ADD_ENDPOINT: (3.05, 30),
+    REMOVE_ENDPOINT: (3.05, 10),
+    LIST_ENDPOINT: (3.05, 15),
+    REPEAT_ENDPOINT: (3.05, 10),
+    MULTI_REMIND_ENDPOINT: (3.05, 20),
+    AUTHORIZED_USER: (3.05, 5),
+    REFRESH_TOKEN: (3.05, 20),
+    # May refresh the token before talking to CalDAV
+    CALENDAR_REMIND_ENDPOINT: (3.05, 45),
+}
+
+# Bot runtime. With BOT_ASYNC_RUNTIME messages are answered concurrently,
+# in order within a conversation and at most BOT_USER_CONCURRENCY per user.
+BOT_ASYNC_RUNTIME = True
+BOT_WORKERS = BACKEND_POOL_SIZE
+BOT_USER_CONCURRENCY = 2
+BOT_SHUTDOWN_TIMEOUT = 10
+
+# Tracing. Every command gets a request id, sent to the backend in the
+# X-Request-Id header. Commands slower than TRACE_SLOW_COMMAND_SECONDS, and
+# a TRACE_SAMPLE_RATE fraction of the others, are written with their spans
+# to TRACE_FILE (JSON lines), or logged to "remindmoi.trace" without one.
+# None and 0 turn the spans off.
+TRACE_SLOW_COMMAND_SECONDS = 2.0
+TRACE_SAMPLE_RATE = 0.0
+TRACE_FILE = None
+
 BASE_URL = "https://zulip.monadical.com"
 BASE_TEMPLATE_URL = f"{BASE_URL}/#narrow"
 
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .constants import (
+    BOT_WORKERS,
+    BOT_USER_CONCURRENCY,
+    BOT_SHUTDOWN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_key(message: Dict[str, Any]) -> str:
+    """
+    A stream topic, or the set of people in a private conversation.
+    """
+    if message.get("type") == "stream":
+        return f"stream:{message.get('stream_id')}:{message.get('subject')}"
+    recipients = message.get("display_recipient")
+    if isinstance(recipients, list):
+        emails = sorted(recipient.get("email") for recipient in recipients)
+        return "private:" + ",".join(emails)
+    return "private:" + message.get("sender_email", "")
+
+
+class AsyncBotRuntime(object):
+    """
+    Answers messages concurrently on an asyncio loop running in its own
+    thread, so a slow command (CalDAV, a slow backend) does not hold every
+    other message behind it.
+
+    Jobs of the same conversation still run one at a time in arrival order,
+    and a user has at most user_concurrency jobs running at once. The jobs
+    themselves are blocking (they use the keep-alive BackendClient) and run
+    on a bounded worker pool.
+    """
+
+    def __init__(
+        self,
+        workers: int = BOT_WORKERS,
+        user_concurrency: int = BOT_USER_CONCURRENCY,
+    ) -> None:
+        self.user_concurrency = user_concurrency
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bot-worker")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run_loop, name="bot-runtime", daemon=True
+        )
+        # key -> [lock or semaphore, jobs holding or waiting for it, key]
+        self.conversations: Dict[str, list] = {}
+        self.users: Dict[str, list] = {}
+        self.pending = 0
+        self.idle: Optional[asyncio.Event] = None
+        self.accepting = False
+
+    def start(self) -> None:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+        self.accepting = True
+
+    def submit(self, message: Dict[str, Any], job: Callable[[], None]) -> bool:
+        """
+        Queue job, the answer to message. Thread safe, returns immediately.
+        """
+        if not self.accepting:
+            return False
+        self.loop.call_soon_threadsafe(self._schedule, message, job)
+        return True
+
+    def stop(self, timeout: float = BOT_SHUTDOWN_TIMEOUT) -> bool:
+        """
+        Stop accepting messages and wait up to timeout seconds for the queued
+        ones to be answered. Return whether every job finished.
+        """
+        if not self.thread.is_alive():
+            return True
+        self.accepting = False
+        drained = asyncio.run_coroutine_threadsafe(self._drain(), self.loop)
+        try:
+            drained.result(timeout)
+            finished = True
+        except Exception:
+            logger.warning("%d bot replies were not sent on shutdown", self.pending)
+            finished = False
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        self.executor.shutdown(wait=finished)
+        return finished
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _setup(self) -> None:
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def _drain(self) -> None:
+        await self.idle.wait()
+
+    def _schedule(self, message: Dict[str, Any], job: Callable[[], None]) -> None:
+        # Runs on the loop: taking the slots here, in arrival order, is what
+        # keeps the per conversation order (asyncio locks are FIFO).
+        conversation = self._acquire_slot(
+            self.conversations, conversation_key(message), asyncio.Lock
+        )
+        user = self._acquire_slot(
+            self.users,
+            message.get("sender_email", ""),
+            lambda: asyncio.Semaphore(self.user_concurrency),
+        )
+        self.pending += 1
+        self.idle.clear()
+        self.loop.create_task(self._answer(job, conversation, user))
+
+    def _acquire_slot(self, slots: Dict[str, list], key: str, factory) -> list:
+        slot = slots.get(key)
+        if slot is None:
+            slot = slots[key] = [factory(), 0, key]
+        slot[1] += 1
+        return slot
+
+    def _release_slot(self, slots: Dict[str, list], slot: list) -> None:
+        slot[1] -= 1
+        if slot[1] == 0:
+            del slots[slot[2]]
+
+    async def _answer(self, job: Callable[[], None], conversation: list, user: list) -> None:
+        try:
+            async with conversation[0]:
+                async with user[0]:
+                    await self.loop.run_in_executor(self.executor, job)
+        except Exception:
+            logger.exception("Failed to answer a message")
+        finally:
+            self._release_slot(self.conversations, conversation)
+            self._release_slot(self.users, user)
+            self.pending -= 1
+            if self.pending == 0:
+                self.idle.set()
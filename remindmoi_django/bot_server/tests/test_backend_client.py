@@ -0,0 +1,43 @@
+from django.test.testcases import SimpleTestCase
+
+from bot_server.backend_client import BackendClient
+from bot_server.constants import (
+    ADD_ENDPOINT,
+    CALENDAR_REMIND_ENDPOINT,
+    BACKEND_POOL_SIZE,
+    BACKEND_RETRIES,
+    BACKEND_TIMEOUTS,
+    DEFAULT_BACKEND_TIMEOUT,
+)
+
+
+class BackendClientTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.client = BackendClient()
+
+    def tearDown(self) -> None:
+        self.client.close()
+        super().tearDown()
+
+    def test_timeout_per_endpoint(self):
+        self.assertEqual(
+            self.client.timeout_for(ADD_ENDPOINT), BACKEND_TIMEOUTS[ADD_ENDPOINT]
+        )
+        self.assertEqual(
+            self.client.timeout_for(CALENDAR_REMIND_ENDPOINT),
+            BACKEND_TIMEOUTS[CALENDAR_REMIND_ENDPOINT],
+        )
+
+    def test_timeout_unknown_endpoint(self):
+        self.assertEqual(
+            self.client.timeout_for("http://localhost:8000/unknown"),
+            DEFAULT_BACKEND_TIMEOUT,
+        )
+
+    def test_session_is_pooled_and_retried(self):
+        adapter = self.client.session.get_adapter(ADD_ENDPOINT)
+        self.assertEqual(adapter._pool_maxsize, BACKEND_POOL_SIZE)
+        self.assertEqual(adapter.max_retries.connect, BACKEND_RETRIES)
+        self.assertFalse(adapter.max_retries.is_retry("POST", 503))
+        self.assertTrue(adapter.max_retries.is_retry("GET", 503))
@@ -0,0 +1,80 @@
+import datetime
+
+from django.test.testcases import SimpleTestCase
+
+from bot_server.bot_helpers import (
+    parse_add_command_content,
+    parse_bulk_add_command_content,
+)
+from bot_server.commands import (
+    parse_command,
+    ISO_DATE_COMMAND,
+    ISO_TIME_COMMAND,
+    REMINDME_COMMAND,
+    ADD_COMMAND,
+    BULK_ADD_COMMAND,
+    REMOVE_COMMAND,
+    LIST_COMMAND,
+    REPEAT_COMMAND,
+    MULTI_REMIND_COMMAND,
+    CALENDAR_REMIND_COMMAND,
+)
+from .test_utils import PRIVATE_MESSAGE
+
+
+class CommandGrammarTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.timestamp = datetime.datetime(2019, 12, 31, 0, 0).timestamp()
+
+    def assertCommand(self, content, name):
+        command = parse_command(content, self.timestamp)
+        self.assertIsNotNone(command, content)
+        self.assertEqual(command.name, name)
+
+    def test_dispatch(self):
+        self.assertCommand("me at 2020-04-19 11:00", ISO_DATE_COMMAND)
+        self.assertCommand("me at 5 pm", ISO_TIME_COMMAND)
+        self.assertCommand("me 10 minutes --multi @juan", REMINDME_COMMAND)
+        self.assertCommand("add 1 day clean the dishes", ADD_COMMAND)
+        self.assertCommand("add\n1 day clean the dishes\n2 hours eat", BULK_ADD_COMMAND)
+        self.assertCommand("remove 12", REMOVE_COMMAND)
+        self.assertCommand("list", LIST_COMMAND)
+        self.assertCommand("repeat 23 every 2 weeks", REPEAT_COMMAND)
+        self.assertCommand("multi 23 @**Jose** @**Max**", MULTI_REMIND_COMMAND)
+        self.assertCommand("--calendar 16-06-2020 18:00", CALENDAR_REMIND_COMMAND)
+
+    def test_garbage(self):
+        for content in [
+            "",
+            "hello there",
+            "add one day laundry",
+            "add 1 fortnight laundry",
+            "add\n1 day clean the dishes\nlaundry",
+            "add\n",
+            "remove x",
+            "repeat 23 each 2 weeks",
+            "me at 5",
+            "me at 2021-02-29 11:20",
+        ]:
+            self.assertIsNone(parse_command(content, self.timestamp), content)
+
+    def test_tokens_are_shared_with_parser(self):
+        message = dict(PRIVATE_MESSAGE, content="add 1 day clean the dishes")
+        command = parse_command(message["content"], message["timestamp"])
+        reminder = parse_add_command_content(message, command.tokens)
+        self.assertEqual(reminder, parse_add_command_content(message))
+        self.assertEqual(reminder["title"], "clean the dishes")
+
+    def test_bulk_add(self):
+        message = dict(
+            PRIVATE_MESSAGE, content="add\n1 day clean the dishes\n\n 10 hours eat \n"
+        )
+        command = parse_command(message["content"], message["timestamp"])
+        reminders = parse_bulk_add_command_content(message, command.tokens)["reminders"]
+        self.assertEqual(
+            [reminder["title"] for reminder in reminders], ["clean the dishes", "eat"]
+        )
+        self.assertEqual(
+            reminders[1]["deadline"], message["timestamp"] + 10 * 60 * 60
+        )
@@ -13,6 +13,8 @@ from bot_server.bot_helpers import (
     is_multi_remind_command,
     is_iso_time_command,
     is_iso_date_command,
+    parse_list_command_content,
+    generate_reminders_list,
 )
 
 
@@ -135,3 +137,24 @@ class HelperTestCase(TestCase):
         current_time = datetime.datetime(2019, 12, 31, 23, 59).timestamp()
         command = "me at 2021-02-29 11:20"
         self.assertFalse(is_iso_date_command(command, current_time))
+
+    def test_parse_list_command(self):
+        for content, expected_next, expected_page in [
+            ("list", False, None),
+            ("list reminders", False, None),
+            ("list next", True, None),
+            ("list --page 3", False, 3),
+            ("list --page 0", False, 1),
+            ("list --page x", False, None),
+        ]:
+            message = dict(PRIVATE_MESSAGE, content=content)
+            list_request = parse_list_command_content(message)
+            self.assertEqual(list_request["next"], expected_next, content)
+            self.assertEqual(list_request["page"], expected_page, content)
+
+    def test_generate_reminders_list_next_page(self):
+        reminder = {"reminder_id": 1, "title": "eat", "deadline": "2020-04-19"}
+        response = {"reminders_list": [reminder], "next_cursor": None}
+        self.assertNotIn("list next", generate_reminders_list(response))
+        response["next_cursor"] = "2020-04-19T00:00:00+00:00|1"
+        self.assertIn("list next", generate_reminders_list(response))
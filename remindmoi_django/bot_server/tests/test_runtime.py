@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.test.testcases import SimpleTestCase
+
+from bot_server.runtime import AsyncBotRuntime, conversation_key
+from .test_utils import PRIVATE_MESSAGE, PUBLIC_MESSAGE
+
+
+def private_message(sender: str, content: str):
+    return dict(
+        PRIVATE_MESSAGE,
+        sender_email=sender,
+        content=content,
+        display_recipient=[{"email": sender}, {"email": "bot@monadical.com"}],
+    )
+
+
+class AsyncBotRuntimeTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.runtime = AsyncBotRuntime(workers=8, user_concurrency=2)
+        self.runtime.start()
+        self.lock = threading.Lock()
+        self.answered = []
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self) -> None:
+        self.runtime.stop(timeout=5)
+        super().tearDown()
+
+    def job(self, name: str, seconds: float = 0.0):
+        def answer():
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(seconds)
+            with self.lock:
+                self.running -= 1
+                self.answered.append(name)
+
+        return answer
+
+    def test_conversation_key(self):
+        self.assertEqual(
+            conversation_key(PRIVATE_MESSAGE),
+            "private:juan@monadical.com,remindjd-bot@zulip.monadical.com",
+        )
+        self.assertTrue(conversation_key(PUBLIC_MESSAGE).startswith("stream:"))
+
+    def test_conversation_order(self):
+        message = private_message("juan@monadical.com", "list")
+        for index, seconds in enumerate([0.05, 0.01, 0.03, 0]):
+            self.runtime.submit(message, self.job(index, seconds))
+
+        self.assertTrue(self.runtime.stop(timeout=5))
+        self.assertEqual(self.answered, [0, 1, 2, 3])
+        self.assertEqual(self.max_running, 1)
+
+    def test_slow_conversation_does_not_block_others(self):
+        self.runtime.submit(
+            private_message("slow@monadical.com", "--calendar"), self.job("slow", 0.3)
+        )
+        self.runtime.submit(private_message("fast@monadical.com", "list"), self.job("fast"))
+
+        self.assertTrue(self.runtime.stop(timeout=5))
+        self.assertEqual(self.answered, ["fast", "slow"])
+
+    def test_user_concurrency(self):
+        for index in range(6):
+            message = dict(
+                PUBLIC_MESSAGE, sender_email="juan@monadical.com", subject=str(index)
+            )
+            self.runtime.submit(message, self.job(index, 0.05))
+
+        self.assertTrue(self.runtime.stop(timeout=5))
+        self.assertEqual(len(self.answered), 6)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(self.runtime.users, {})
+        self.assertEqual(self.runtime.conversations, {})
+
+    def test_no_messages_after_stop(self):
+        self.runtime.stop(timeout=5)
+        self.assertFalse(
+            self.runtime.submit(PRIVATE_MESSAGE, self.job("late"))
+        )
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from django.test.testcases import SimpleTestCase
+
+from bot_server.bot_helpers import (
+    parse_add_date_command_content,
+    parse_add_is_time_command_content,
+)
+from bot_server.commands import parse_command, ISO_DATE_COMMAND, ISO_TIME_COMMAND
+from bot_server.timespec import (
+    clock_deadline,
+    date_deadline,
+    get_timezone,
+    relative_deadline,
+)
+from .test_utils import PRIVATE_MESSAGE
+
+NEW_YORK = get_timezone("America/New_York")
+
+
+def local_timestamp(*args) -> float:
+    return datetime(*args, tzinfo=NEW_YORK).timestamp()
+
+
+class TimeSpecTestCase(SimpleTestCase):
+    def test_get_timezone_is_cached(self):
+        self.assertIs(get_timezone(), get_timezone())
+        self.assertIs(get_timezone("America/New_York"), NEW_YORK)
+
+    def test_relative_deadline(self):
+        start = local_timestamp(2020, 3, 7, 10, 0)
+        self.assertEqual(relative_deadline(start, 90, "minutes", NEW_YORK), start + 5400)
+        self.assertEqual(relative_deadline(start, 1, "hour", NEW_YORK), start + 3600)
+        # Clocks go forward on March 8th, one day later is still 10:00
+        self.assertEqual(
+            relative_deadline(start, 1, "day", NEW_YORK),
+            local_timestamp(2020, 3, 8, 10, 0),
+        )
+        self.assertEqual(
+            relative_deadline(start, 1, "day", NEW_YORK) - start, 23 * 60 * 60
+        )
+
+    def test_relative_deadline_overflow(self):
+        with self.assertRaises(OverflowError):
+            relative_deadline(0, 10 ** 12, "hours")
+        with self.assertRaises(OverflowError):
+            relative_deadline(0, 10 ** 12, "weeks")
+
+    def test_clock_deadline(self):
+        now = local_timestamp(2020, 1, 15, 9, 30)
+        self.assertEqual(
+            clock_deadline(now, 17, 5, NEW_YORK), local_timestamp(2020, 1, 15, 17, 5)
+        )
+        self.assertIsNone(clock_deadline(now, 24, 0, NEW_YORK))
+
+    def test_clock_deadline_dst_day(self):
+        now = local_timestamp(2020, 3, 8, 0, 30)
+        self.assertEqual(
+            clock_deadline(now, 17, 0, NEW_YORK), local_timestamp(2020, 3, 8, 17, 0)
+        )
+
+    def test_date_deadline(self):
+        self.assertEqual(
+            date_deadline(2020, 4, 19, 11, 0, NEW_YORK),
+            local_timestamp(2020, 4, 19, 11, 0),
+        )
+        self.assertIsNone(date_deadline(2021, 2, 29, 11, 20, NEW_YORK))
+
+    def test_deadline_is_parsed_once(self):
+        timestamp = datetime(2019, 12, 31, 8, 0).timestamp()
+        for content, name, parse, expected in [
+            (
+                "me at 5:30 pm",
+                ISO_TIME_COMMAND,
+                parse_add_is_time_command_content,
+                datetime(2019, 12, 31, 17, 30).timestamp(),
+            ),
+            (
+                "me at 2020-04-19 11:00",
+                ISO_DATE_COMMAND,
+                parse_add_date_command_content,
+                datetime(2020, 4, 19, 11, 0).timestamp(),
+            ),
+        ]:
+            message = dict(PRIVATE_MESSAGE, content=content, timestamp=timestamp)
+            command = parse_command(content, timestamp)
+            self.assertEqual(command.name, name)
+            self.assertEqual(command.deadline, expected)
+            self.assertEqual(parse(message)["deadline"], expected)
+            self.assertEqual(
+                parse(message, command.tokens, command.deadline)["deadline"], expected
+            )
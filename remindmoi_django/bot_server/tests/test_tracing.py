@@ -0,0 +1,21 @@
+from unittest import mock
+
+from django.test.testcases import SimpleTestCase
+
+from bot_server.backend_client import BackendClient
+from bot_server.constants import ADD_ENDPOINT
+from bot_server.tracing import REQUEST_ID_HEADER, Tracer
+
+
+class BackendClientTracingTestCase(SimpleTestCase):
+    def test_request_id_header(self):
+        client = BackendClient()
+        self.addCleanup(client.close)
+        with mock.patch.object(client.session, "request") as request:
+            with Tracer().trace("add", "abc"):
+                client.post(ADD_ENDPOINT, json={})
+            client.post(ADD_ENDPOINT, json={})
+        self.assertEqual(
+            request.call_args_list[0].kwargs["headers"], {REQUEST_ID_HEADER: "abc"}
+        )
+        self.assertNotIn("headers", request.call_args_list[1].kwargs)
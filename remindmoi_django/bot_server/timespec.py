@@ -0,0 +1,112 @@
+"""
+Time expressions of the bot commands.
+
+A command's time spec is turned into a deadline timestamp once, when the
+command is recognised, and the deadline travels with the ``Command``. Dates are
+built from the matched integers instead of ``strptime``, minutes and hours are
+plain arithmetic, and the start of the current local day is cached so the
+"me at 5 pm" form does not need a ``datetime`` per message.
+
+Local times are read in ``BOT_TIMEZONE`` (the machine zone by default).
+"""
+from datetime import datetime, timedelta, tzinfo
+from typing import Dict, Optional, Tuple
+
+from dateutil.tz import UTC
+
+from .constants import BOT_TIMEZONE, SINGULAR_UNITS
+
+# The bot runs as remindmoi_django.bot_server, its tests as bot_server
+try:
+    from ..remindmoi_common.timezones import get_timezone
+except ImportError:
+    from remindmoi_common.timezones import get_timezone
+
+# Elapsed time units. Days and weeks keep the wall-clock time instead, so a
+# reminder "in 1 day" fires at the same hour after a DST change.
+UNIT_SECONDS = {"minutes": 60, "hours": 60 * 60}
+MIN_TIMESTAMP = datetime(1, 1, 2, tzinfo=UTC).timestamp()
+MAX_TIMESTAMP = datetime(9999, 12, 31, tzinfo=UTC).timestamp()
+
+# id(tz) -> (start of the local day, start of the next one, same UTC offset,
+# tz). dateutil zones are not hashable.
+_local_days: Dict[int, Tuple[float, float, bool, tzinfo]] = {}
+
+
+def bot_timezone() -> tzinfo:
+    return get_timezone(BOT_TIMEZONE)
+
+
+def relative_deadline(
+    timestamp: float, value: int, unit: str, tz: Optional[tzinfo] = None
+) -> float:
+    """
+    timestamp + <value> <unit>. Raise OverflowError out of the datetime range.
+    """
+    if unit in SINGULAR_UNITS:  # Convert singular units to plural
+        unit = f"{unit}s"
+    seconds = UNIT_SECONDS.get(unit)
+    if seconds is not None:
+        deadline = timestamp + value * seconds
+    else:
+        start = datetime.fromtimestamp(timestamp, tz or bot_timezone())
+        deadline = (start + timedelta(**{unit: value})).timestamp()
+    if not MIN_TIMESTAMP <= deadline <= MAX_TIMESTAMP:
+        raise OverflowError("deadline out of range")
+    return deadline
+
+
+def local_midnight(timestamp: float, tz: tzinfo) -> Optional[float]:
+    """
+    Start of the local day holding timestamp, or None when the UTC offset
+    changes during that day.
+    """
+    day = _local_days.get(id(tz))
+    if day is None or day[3] is not tz or not day[0] <= timestamp < day[1]:
+        now = datetime.fromtimestamp(timestamp, tz)
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            end = start + timedelta(days=1)
+        except OverflowError:  # Last day of the datetime range
+            return None
+        regular = start.utcoffset() == end.utcoffset()
+        day = (start.timestamp(), end.timestamp(), regular, tz)
+        _local_days[id(tz)] = day
+    return day[0] if day[2] else None
+
+
+def to_24_hour(hour: int, period: str) -> int:
+    """
+    Same reading as always: "am" hours are kept as is, "12 pm" is noon.
+    """
+    if period.lower() == "am" or hour == 12:
+        return hour
+    return hour + 12
+
+
+def clock_deadline(
+    timestamp: float, hour: int, minute: int, tz: Optional[tzinfo] = None
+) -> Optional[float]:
+    """
+    Today at hour:minute, local time. None if that is not a valid time.
+    """
+    tz = tz or bot_timezone()
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    midnight = local_midnight(timestamp, tz)
+    if midnight is not None:
+        return midnight + hour * 60 * 60 + minute * 60
+    now = datetime.fromtimestamp(timestamp, tz)
+    return now.replace(hour=hour, minute=minute, second=0, microsecond=0).timestamp()
+
+
+def date_deadline(
+    year: int, month: int, day: int, hour: int, minute: int, tz: Optional[tzinfo] = None
+) -> Optional[float]:
+    """
+    The given local date and time. None if that date does not exist.
+    """
+    try:
+        return datetime(year, month, day, hour, minute, tzinfo=tz or bot_timezone()).timestamp()
+    except ValueError:
+        return None
@@ -0,0 +1,31 @@
+# The bot runs as remindmoi_django.bot_server, its tests as bot_server
+try:
+    from ..remindmoi_common.tracing import (
+        REQUEST_ID_HEADER,
+        Trace,
+        Tracer,
+        current_request_id,
+        current_trace,
+        new_request_id,
+        span,
+    )
+except ImportError:
+    from remindmoi_common.tracing import (
+        REQUEST_ID_HEADER,
+        Trace,
+        Tracer,
+        current_request_id,
+        current_trace,
+        new_request_id,
+        span,
+    )
+
+__all__ = [
+    "REQUEST_ID_HEADER",
+    "Trace",
+    "Tracer",
+    "current_request_id",
+    "current_trace",
+    "new_request_id",
+    "span",
+]
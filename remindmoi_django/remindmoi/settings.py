@@ -47,10 +47,11 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django_apscheduler",
-    "remindmoi_bot",
+    "remindmoi_bot.apps.RemindmoiBotConfig",
 ]
 
 MIDDLEWARE = [
+    "remindmoi_bot.tracing.TracingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -86,11 +87,43 @@ WSGI_APPLICATION = "remindmoi.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+# SQLite by default, PostgreSQL with REMINDMOI_DB_ENGINE=postgresql and the
+# REMINDMOI_DB_* connection variables.
+DATABASE_ENGINE = os.environ.get("REMINDMOI_DB_ENGINE", "sqlite3")
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("REMINDMOI_DB_NAME", "remindmoi"),
+            "USER": os.environ.get("REMINDMOI_DB_USER", "remindmoi"),
+            "PASSWORD": os.environ.get("REMINDMOI_DB_PASSWORD", ""),
+            "HOST": os.environ.get("REMINDMOI_DB_HOST", "localhost"),
+            "PORT": os.environ.get("REMINDMOI_DB_PORT", "5432"),
+            # Persistent connections, reused by the requests of a worker
+            "CONN_MAX_AGE": int(os.environ.get("REMINDMOI_DB_CONN_MAX_AGE", 60)),
+        }
     }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get(
+                "REMINDMOI_DB_NAME", os.path.join(BASE_DIR, "db.sqlite3")
+            ),
+            # Seconds a write waits for another one to finish
+            "OPTIONS": {"timeout": 20},
+        }
+    }
+
+# Set on every new SQLite connection: readers do not block the writer (WAL),
+# commits fsync at checkpoints only (NORMAL, durable enough with WAL), and
+# writes wait busy_timeout ms for the lock instead of failing with
+# "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 20000,
 }
 
 
@@ -130,3 +163,110 @@ STATICFILES_DIR = os.path.join(BASE_DIR, "static")
 STATICFILES_DIRS = [
     STATICFILES_DIR,
 ]
+
+# Reminder dispatcher: how many due reminders are delivered together, the
+# longest the dispatcher sleeps when nothing is due (None: until a reminder
+# is scheduled) and the pause after a failed dispatch.
+REMINDER_DISPATCH_BATCH_SIZE = 100
+REMINDER_DISPATCH_IDLE_SECONDS = None
+REMINDER_DISPATCH_RETRY_SECONDS = 30
+
+# Sending a reminder occurrence is tried REMINDER_DELIVERY_ATTEMPTS times per
+# recipient, REMINDER_DELIVERY_RETRY_SECONDS apart, before giving up on it.
+REMINDER_DELIVERY_ATTEMPTS = 3
+REMINDER_DELIVERY_RETRY_SECONDS = 60
+# The ledger of past occurrences is kept REMINDER_DELIVERY_RETENTION_SECONDS,
+# dispatchers delete older rows every REMINDER_DELIVERY_PURGE_SECONDS.
+REMINDER_DELIVERY_RETENTION_SECONDS = 7 * 24 * 60 * 60
+REMINDER_DELIVERY_PURGE_SECONDS = 60 * 60
+
+# Run the dispatcher and the token refresher in the web process. With more
+# than one web worker set it to False (REMINDMOI_DISPATCH_IN_PROCESS=0, as
+# etc/gunicorn.conf.py does) and run `manage.py run_dispatcher` instead:
+# dispatchers claim reminders for REMINDER_LEASE_SECONDS and look for
+# reminders added by the web workers every REMINDER_DISPATCH_POLL_SECONDS.
+REMINDER_DISPATCH_IN_PROCESS = os.environ.get("REMINDMOI_DISPATCH_IN_PROCESS", "1") != "0"
+REMINDER_DISPATCH_POLL_SECONDS = 5
+REMINDER_LEASE_SECONDS = 300
+# Where `metrics_snapshot` reads the metrics from by default: the dispatcher
+# started with --metrics-port (etc/supervisord.conf). Counters are kept by
+# the process sending the reminders, web workers only record theirs when
+# they dispatch in process.
+REMINDER_METRICS_URL = os.environ.get(
+    "REMINDMOI_METRICS_URL", "http://127.0.0.1:9101/metrics"
+)
+
+# Reminder delivery: concurrent Zulip senders, messages per second allowed
+# (with bursts) and retries when Zulip answers RATE_LIMIT_HIT.
+ZULIP_SEND_WORKERS = 8
+ZULIP_SEND_RATE = 20
+ZULIP_SEND_BURST = 40
+ZULIP_SEND_RETRIES = 3
+
+# Seconds the cached Zulip member directory is trusted. A process serving
+# every request watches realm_user events (an event queue each) and keeps
+# it longer, gunicorn workers rely on the TTL alone.
+ZULIP_MEMBERS_WATCH = REMINDER_DISPATCH_IN_PROCESS
+ZULIP_MEMBERS_TTL = 60 * 60 if ZULIP_MEMBERS_WATCH else 5 * 60
+
+# Reminders per page of the "list" command
+REMINDERS_PAGE_SIZE = 20
+
+# Rendered "list" pages are cached per user and dropped when the user's
+# reminders are added, removed, get new recipients or fire. Every web worker
+# and the dispatcher must see the same cache: one process keeps it in
+# memory, gunicorn and run_dispatcher (etc/supervisord.conf) keep it in
+# REMINDMOI_LIST_CACHE_DIR.
+REMINDERS_LIST_CACHE = "reminder_lists"
+REMINDERS_LIST_CACHE_SECONDS = 60 * 60
+REMINDERS_LIST_CACHE_DIR = os.environ.get("REMINDMOI_LIST_CACHE_DIR")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    REMINDERS_LIST_CACHE: {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache"
+        if REMINDERS_LIST_CACHE_DIR
+        else "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": REMINDERS_LIST_CACHE_DIR or REMINDERS_LIST_CACHE,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Most reminders accepted by one bulk_add_reminders request
+BULK_ADD_MAX_REMINDERS = 500
+
+# Zone of the deadlines shown by "list", None for the machine zone
+REMINDERS_DISPLAY_TIMEZONE = None
+
+# Nextcloud token refresher: tokens are refreshed this many seconds before
+# they expire, batch_size users per query with at most workers requests at
+# once to Nextcloud.
+OAUTH_REFRESH_MARGIN_SECONDS = 5 * 60
+OAUTH_REFRESH_BATCH_SIZE = 50
+OAUTH_REFRESH_WORKERS = 4
+OAUTH_REFRESH_IDLE_SECONDS = 60
+# A token Nextcloud refuses to refresh is tried again OAUTH_REFRESH_RETRY_SECONDS
+# later, twice as long after each refusal, and dropped after
+# OAUTH_REFRESH_ATTEMPTS refusals in a row: the user has to log in again.
+OAUTH_REFRESH_ATTEMPTS = 5
+OAUTH_REFRESH_RETRY_SECONDS = 60
+# (connect, read) timeouts of the requests to Nextcloud. A refresh is
+# claimed for OAUTH_REFRESH_CLAIM_SECONDS, longer than the request may take:
+# others wait for it, then take over.
+NEXTCLOUD_TIMEOUT = (3.05, 20)
+OAUTH_REFRESH_CLAIM_SECONDS = 60
+
+# Request tracing. Requests carrying the bot's X-Request-Id (or a new one)
+# are traced: database queries, scheduler calls and outbound HTTP. Requests
+# slower than TRACE_SLOW_REQUEST_SECONDS, and a TRACE_SAMPLE_RATE fraction
+# of the others, are written to TRACE_FILE (JSON lines), or logged to
+# "remindmoi.trace" without one. None and 0 turn tracing off.
+TRACE_SLOW_REQUEST_SECONDS = 1.0
+TRACE_SAMPLE_RATE = 0.0
+TRACE_FILE = os.environ.get("REMINDMOI_TRACE_FILE")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"remindmoi.trace": {"handlers": ["console"], "level": "INFO"}},
+}
@@ -18,19 +18,29 @@ from django.urls import path, include
 
 from remindmoi_bot.views import (
     add_reminder,
+    bulk_add_reminders,
     remove_reminder,
     list_reminders,
     repeat_reminder,
     multi_remind,
-    create_calendar_event,)
+    create_calendar_event,
+    calendar_remind,
+    health,
+    ready,
+    metrics_view,)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("add_reminder", add_reminder),
+    path("bulk_add_reminders", bulk_add_reminders),
     path("remove_reminder", remove_reminder),
     path("list_reminders", list_reminders),
     path("repeat_reminder", repeat_reminder),
     path("multi_remind", multi_remind),
     path("create-calendar-event", create_calendar_event),
+    path("calendar-remind", calendar_remind),
+    path("healthz", health),
+    path("readyz", ready),
+    path("metrics", metrics_view),
     path("", include("remindmoi_bot.urls")),
 ]
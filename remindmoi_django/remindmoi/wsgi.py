@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "remindmoi.settings")
 
 application = get_wsgi_application()
+
+# Served processes (runserver, gunicorn) send the reminders, unless
+# REMINDER_DISPATCH_IN_PROCESS is off.
+from remindmoi_bot import scheduler  # noqa: E402
+
+scheduler.start()
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class RemindmoiBotConfig(AppConfig):
     name = "remindmoi_bot"
+
+    def ready(self):
+        from remindmoi_bot.db import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid="configure_sqlite")
@@ -1,6 +1,10 @@
 import datetime
 import json
-from typing import Dict, Any
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Any, Optional
 
 import pytz
 import requests
@@ -12,10 +16,20 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views import View
 from django.views.generic import RedirectView
 from django.conf import settings
-from oauth2client.client import OAuth2Credentials
+from django.db.models import Q
+from django.utils import timezone
 from requests.auth import AuthBase
 
 from remindmoi_bot.models import OAuthUser
+from remindmoi_common.tracing import span
+
+if TYPE_CHECKING:
+    from oauth2client.client import OAuth2Credentials
+
+logger = logging.getLogger(__name__)
+
+# Pause between two looks at a refresh claimed by another process
+OAUTH_REFRESH_WAIT_SECONDS = 0.25
 
 NEXTCLOUD_BASE_URL = "https://cloud.monadical.com/"
 NEXTCLOUD_TOKEN_URL = f"{NEXTCLOUD_BASE_URL}index.php/apps/oauth2/api/v1/token"
@@ -23,12 +37,34 @@ NEXTCLOUD_REDIRECT_URL = f"{NEXTCLOUD_BASE_URL}auth/nextcloud/success/"
 NEXTCLOUD_LOGIN_URL = f"{NEXTCLOUD_BASE_URL}index.php/apps/oauth2/authorize"
 
 
-def login_url() -> str:
-    icloud_secrets = settings.ICLOUD_SECRETS
+class ClientSecrets(object):
+    """
+    The "web" section of the client secret file. It is read once and read
+    again only when the file changes on disk.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mtime: Optional[int] = None
+        self.secrets: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def get(self) -> Dict[str, str]:
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    with open(self.path) as secret_file:
+                        self.secrets = dict(json.load(secret_file)["web"])
+                    self.mtime = mtime
+        return self.secrets
+
+
+client_secrets = ClientSecrets(settings.ICLOUD_SECRETS)
+
 
-    with open(icloud_secrets) as secret_file:
-        json_file = json.load(secret_file)
-        secrets_dict = {key: value for key, value in json_file["web"].items()}
+def login_url() -> str:
+    secrets_dict = client_secrets.get()
 
     return (
         f"{NEXTCLOUD_LOGIN_URL}?"
@@ -38,32 +74,122 @@ def login_url() -> str:
 
 
 def auth_token_request(**data) -> Dict[str, Any]:
-    icloud_secrets = settings.ICLOUD_SECRETS
-
-    with open(icloud_secrets) as secret_file:
-        json_file = json.load(secret_file)
-        secrets_dict = {key: value for key, value in json_file["web"].items()}
-
-    resp_json = requests.post(
-        NEXTCLOUD_TOKEN_URL,
-        data={
-            "client_id": secrets_dict["client_id"],
-            "client_secret": secrets_dict["client_secret"],
-            **data
-        },
-        headers={
-            "Content-Type": "application/x-www-form-urlencoded",
-        },
-    ).json()
+    secrets_dict = client_secrets.get()
+
+    with span("http", service="nextcloud", path="token"):
+        resp_json = requests.post(
+            NEXTCLOUD_TOKEN_URL,
+            data={
+                "client_id": secrets_dict["client_id"],
+                "client_secret": secrets_dict["client_secret"],
+                **data
+            },
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+            },
+            timeout=settings.NEXTCLOUD_TIMEOUT,
+        ).json()
     return resp_json
 
 
-def get_user_info(access_token, user_id):
-    user_info = requests.get(
-        url=f"https://cloud.monadical.com/ocs/v1.php/cloud/users/{user_id}?format=json",
-        headers=auth_headers(access_token, True)
+TOKEN_FIELDS = [
+    "access_token",
+    "refresh_token",
+    "token_expiry",
+    "refresh_failures",
+    "refresh_retry_at",
+]
+
+
+def refresh_oauth_user(oauth_user: OAuthUser) -> bool:
+    """
+    Exchange the refresh token of oauth_user for a new access token and save
+    it. Return False if Nextcloud did not hand out a new token; after
+    OAUTH_REFRESH_ATTEMPTS refusals in a row the refresh token is dropped.
+
+    Refresh tokens are single use: the refresh is claimed with a conditional
+    UPDATE (as claim_reminders does), a concurrent one (token refresher,
+    calendar command) waits for it and keeps the token it got.
+    """
+    refresh_token = oauth_user.refresh_token
+    now = timezone.now()
+    claimed_until = now + datetime.timedelta(seconds=settings.OAUTH_REFRESH_CLAIM_SECONDS)
+    claimed = OAuthUser.objects.filter(
+        Q(refresh_claimed_until__isnull=True) | Q(refresh_claimed_until__lte=now),
+        pk=oauth_user.pk,
+        refresh_token=refresh_token,
+    ).update(refresh_claimed_until=claimed_until)
+    if not claimed:
+        return wait_for_refresh(oauth_user, refresh_token)
+
+    try:
+        response = auth_token_request(
+            grant_type='refresh_token',
+            refresh_token=refresh_token,
+        )
+    except Exception:
+        OAuthUser.objects.filter(pk=oauth_user.pk).update(refresh_claimed_until=None)
+        raise
+
+    user = OAuthUser.objects.get(pk=oauth_user.pk)
+    if "access_token" not in response:
+        user.refresh_failures += 1
+        if user.refresh_failures >= settings.OAUTH_REFRESH_ATTEMPTS:
+            logger.warning(
+                "Dropped the refresh token of %s after %s refusals: %s",
+                user.zulip_user_email,
+                user.refresh_failures,
+                response,
+            )
+            user.refresh_token = None
+            user.refresh_retry_at = None
+        else:
+            delay = settings.OAUTH_REFRESH_RETRY_SECONDS * 2 ** (
+                user.refresh_failures - 1
+            )
+            user.refresh_retry_at = timezone.now() + datetime.timedelta(seconds=delay)
+    else:
+        token_expiry = None
+        if 'expires_in' in response:
+            delta = datetime.timedelta(seconds=int(response['expires_in']))
+            token_expiry = delta + timezone.now()
+
+        user.refresh_token = response.get('refresh_token', None)
+        user.access_token = response["access_token"]
+        user.token_expiry = token_expiry
+        user.refresh_failures = 0
+        user.refresh_retry_at = None
+    user.refresh_claimed_until = None
+    user.save(update_fields=TOKEN_FIELDS + ["refresh_claimed_until"])
+
+    for field in TOKEN_FIELDS:
+        setattr(oauth_user, field, getattr(user, field))
+    return "access_token" in response
+
+
+def wait_for_refresh(oauth_user: OAuthUser, refresh_token: Optional[str]) -> bool:
+    """
+    Wait for the refresh another process claimed and take its outcome, or
+    refresh again if that one never finished.
+    """
+    while True:
+        user = OAuthUser.objects.get(pk=oauth_user.pk)
+        if user.refresh_token != refresh_token or user.refresh_claimed_until is None:
+            for field in TOKEN_FIELDS:
+                setattr(oauth_user, field, getattr(user, field))
+            return user.refresh_token is not None and user.refresh_token != refresh_token
+        if user.refresh_claimed_until <= timezone.now():
+            return refresh_oauth_user(oauth_user)
+        time.sleep(OAUTH_REFRESH_WAIT_SECONDS)
 
-    ).json()
+
+def get_user_info(access_token, user_id):
+    with span("http", service="nextcloud", path="users"):
+        user_info = requests.get(
+            url=f"https://cloud.monadical.com/ocs/v1.php/cloud/users/{user_id}?format=json",
+            headers=auth_headers(access_token, True),
+            timeout=settings.NEXTCLOUD_TIMEOUT,
+        ).json()
 
     return user_info
 
@@ -75,7 +201,9 @@ def auth_headers(access_token, is_ocs=False):
     }
 
 
-def set_oauth_credentials(secrets_dict: Dict[str, str], access_token, token_expiry, refresh_token) -> OAuth2Credentials:
+def set_oauth_credentials(secrets_dict: Dict[str, str], access_token, token_expiry, refresh_token) -> "OAuth2Credentials":
+    # Only calendar commands need it, keep it out of the startup
+    from oauth2client.client import OAuth2Credentials
 
     return OAuth2Credentials(
         access_token=access_token,
@@ -144,6 +272,8 @@ class NextCloudLoginSuccess(View):
                 "access_token": response["access_token"],
                 "refresh_token": refresh_token,
                 "token_expiry": token_expiry,
+                "refresh_failures": 0,
+                "refresh_retry_at": None,
             }
         )
 
@@ -172,30 +302,12 @@ class NextCloudRefreshToken(View):
 
             }, status=500)
 
-        response = auth_token_request(
-            grant_type='refresh_token',
-            refresh_token=oauth_obj.refresh_token,
-        )
-
-        if "access_token" not in response:
+        if not refresh_oauth_user(oauth_obj):
             return JsonResponse({
                 "message": 'Access token is not in the response',
 
             }, status=500)
 
-        refresh_token = response.get('refresh_token', None)
-        oauth_obj.refresh_token = refresh_token
-        oauth_obj.save()
-
-        token_expiry = None
-        if 'expires_in' in response:
-            delta = datetime.timedelta(seconds=int(response['expires_in']))
-            token_expiry = delta + datetime.datetime.utcnow()
-
-        oauth_obj.token_expiry = token_expiry
-        oauth_obj.access_token = response["access_token"]
-        oauth_obj.save()
-
         return render(request, self.template_name, context)
 
 
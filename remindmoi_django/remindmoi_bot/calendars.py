@@ -0,0 +1,72 @@
+import threading
+from typing import Dict, Tuple
+
+import caldav
+from caldav.lib.error import DAVError
+
+from remindmoi_bot.auth import OAuth, client_secrets, set_oauth_credentials
+from remindmoi_bot.models import OAuthUser
+
+CALDAV_URL = "https://cloud.monadical.com/remote.php/dav"
+PERSONAL_CALENDAR = "Personal"
+
+
+class CalendarCache(object):
+    """
+    Per user DAV client (one keep-alive session each) and the URL of their
+    personal calendar. Only the first event of a user pays for the principal
+    and calendar discovery, the following ones are a single PUT.
+    """
+
+    def __init__(self) -> None:
+        # email -> (DAV client, access token it uses, calendar url)
+        self.entries: Dict[str, Tuple[caldav.DAVClient, str, str]] = {}
+        self.lock = threading.Lock()
+
+    def invalidate(self, user_email: str) -> None:
+        with self.lock:
+            self.entries.pop(user_email, None)
+
+    def calendar(self, oauth_user: OAuthUser) -> caldav.Calendar:
+        with self.lock:
+            entry = self.entries.get(oauth_user.zulip_user_email)
+        if entry is None:
+            client = caldav.DAVClient(CALDAV_URL, auth=self.auth(oauth_user))
+            calendar_url = discover_calendar_url(client)
+            entry = (client, oauth_user.access_token, calendar_url)
+        elif entry[1] != oauth_user.access_token:  # The token was refreshed
+            entry[0].auth = self.auth(oauth_user)
+            entry = (entry[0], oauth_user.access_token, entry[2])
+        with self.lock:
+            self.entries[oauth_user.zulip_user_email] = entry
+        return caldav.Calendar(client=entry[0], url=entry[2])
+
+    def auth(self, oauth_user: OAuthUser) -> OAuth:
+        credentials = set_oauth_credentials(
+            secrets_dict=client_secrets.get(),
+            access_token=oauth_user.access_token,
+            token_expiry=oauth_user.token_expiry,
+            refresh_token=oauth_user.refresh_token,
+        )
+        return OAuth(credentials)
+
+    def add_event(self, oauth_user: OAuthUser, icalstream: str) -> None:
+        try:
+            self.calendar(oauth_user).add_event(icalstream)
+        except DAVError:
+            # The calendar may have moved, discover it again once
+            self.invalidate(oauth_user.zulip_user_email)
+            self.calendar(oauth_user).add_event(icalstream)
+
+
+def discover_calendar_url(client: caldav.DAVClient) -> str:
+    personal_calendar = None
+    for calendar in client.principal().calendars():
+        if calendar.name == PERSONAL_CALENDAR:
+            personal_calendar = calendar
+
+    assert personal_calendar is not None
+    return str(personal_calendar.url)
+
+
+calendar_cache = CalendarCache()
@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs) -> None:
+    """
+    connection_created receiver applying settings.SQLITE_PRAGMAS.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
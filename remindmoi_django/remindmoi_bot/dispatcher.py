@@ -0,0 +1,243 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from remindmoi_bot import metrics
+from remindmoi_bot.models import Reminder, ReminderDelivery
+from remindmoi_bot.schedule import ReminderSchedule
+from remindmoi_bot.zulip_utils import deliver_reminders
+
+logger = logging.getLogger(__name__)
+
+
+def claim_reminders(
+    reminder_ids: List[int],
+    owner: str,
+    now: Optional[datetime] = None,
+    lease_seconds: float = settings.REMINDER_LEASE_SECONDS,
+) -> List[int]:
+    """
+    Lease the given reminders that are due and not leased by another
+    dispatcher, return the ids of those claimed.
+    """
+    now = now or timezone.now()
+    expires_at = now + timedelta(seconds=lease_seconds)
+    claimable = Reminder.objects.filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now),
+        reminder_id__in=reminder_ids,
+        active=True,
+        next_fire_at__lte=now,
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = list(
+                claimable.select_for_update(skip_locked=True).values_list(
+                    "reminder_id", flat=True
+                )
+            )
+            Reminder.objects.filter(reminder_id__in=claimed).update(
+                lease_owner=owner, lease_expires_at=expires_at
+            )
+        return claimed
+
+    # A single conditional UPDATE: when dispatchers race, the first one to
+    # write gets the rows and the others match none.
+    claimable.update(lease_owner=owner, lease_expires_at=expires_at)
+    return list(
+        Reminder.objects.filter(
+            reminder_id__in=reminder_ids,
+            lease_owner=owner,
+            lease_expires_at=expires_at,
+        ).values_list("reminder_id", flat=True)
+    )
+
+
+def release_reminders(reminder_ids: List[int], owner: str) -> None:
+    Reminder.objects.filter(reminder_id__in=reminder_ids, lease_owner=owner).update(
+        lease_owner=None, lease_expires_at=None
+    )
+
+
+def purge_deliveries(
+    now: Optional[datetime] = None,
+    retention_seconds: float = settings.REMINDER_DELIVERY_RETENTION_SECONDS,
+) -> int:
+    """
+    Delete the ledger rows of occurrences older than retention_seconds,
+    except those of occurrences still being sent. Return how many were
+    deleted.
+    """
+    now = now or timezone.now()
+    deleted, _ = (
+        ReminderDelivery.objects.filter(
+            fire_at__lt=now - timedelta(seconds=retention_seconds)
+        )
+        .exclude(reminder__next_fire_at=F("fire_at"))
+        .delete()
+    )
+    return deleted
+
+
+def dispatcher_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class ReminderDispatcher(threading.Thread):
+    """
+    Sends reminders, one-off and repeated. Fire times are kept in an
+    in-memory ReminderSchedule, rebuilt from the Reminder table when the
+    thread starts. Views write the row first, then call schedule_reminder()
+    or cancel(), so the table always holds what the schedule must become.
+
+    The thread sleeps until the next fire time, or until a reminder due
+    earlier is scheduled. With idle_seconds set it also wakes up at least
+    that often.
+
+    Several dispatchers, in other processes, can share the table: each one
+    leases the reminders it sends (claim_reminders) and, with poll_seconds
+    set, reads the reminders due before its next poll from the table instead
+    of waiting for schedule_reminder().
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.REMINDER_DISPATCH_BATCH_SIZE,
+        idle_seconds: Optional[float] = settings.REMINDER_DISPATCH_IDLE_SECONDS,
+        poll_seconds: Optional[float] = None,
+        lease_seconds: float = settings.REMINDER_LEASE_SECONDS,
+        owner: Optional[str] = None,
+    ) -> None:
+        super().__init__(name="reminder-dispatcher", daemon=True)
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = owner or dispatcher_name()
+        self.schedule = ReminderSchedule()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def load(self) -> None:
+        reminders = Reminder.objects.filter(active=True, next_fire_at__isnull=False)
+        if self.poll_seconds is not None:
+            # Read again on every poll, only what is due before the next one
+            horizon = timezone.now() + timedelta(seconds=self.poll_seconds)
+            reminders = reminders.filter(next_fire_at__lte=horizon)
+        with metrics.query_latency.time(query="load"):
+            entries = list(reminders.values_list("reminder_id", "next_fire_at"))
+        self.schedule.load(
+            (reminder_id, fire_at.timestamp()) for reminder_id, fire_at in entries
+        )
+
+    def schedule_reminder(self, reminder_id: int, fire_at: Optional[datetime]) -> None:
+        if fire_at is None:
+            self.cancel(reminder_id)
+            return
+        next_fire_at = self.schedule.next_fire_at()
+        self.schedule.add(reminder_id, fire_at.timestamp())
+        if next_fire_at is None or fire_at.timestamp() < next_fire_at:
+            self.wakeup()
+
+    def cancel(self, reminder_id: int) -> None:
+        self.schedule.cancel(reminder_id)
+
+    def wakeup(self) -> None:
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def run(self) -> None:
+        loaded_at = None
+        purged_at = None
+        purge_seconds = settings.REMINDER_DELIVERY_PURGE_SECONDS
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                if loaded_at is None or (
+                    self.poll_seconds is not None
+                    and time.monotonic() >= loaded_at + self.poll_seconds
+                ):
+                    self.load()
+                    loaded_at = time.monotonic()
+                if purged_at is None or time.monotonic() >= purged_at + purge_seconds:
+                    with metrics.query_latency.time(query="purge"):
+                        purge_deliveries()
+                    purged_at = time.monotonic()
+                timeout = self.dispatch_pending()
+                if self.poll_seconds is not None:
+                    until_poll = max(loaded_at + self.poll_seconds - time.monotonic(), 0)
+                    timeout = until_poll if timeout is None else min(timeout, until_poll)
+                until_purge = max(purged_at + purge_seconds - time.monotonic(), 0)
+                timeout = until_purge if timeout is None else min(timeout, until_purge)
+            except Exception:
+                logger.exception("Reminder dispatch failed")
+                timeout = self.idle_seconds or settings.REMINDER_DISPATCH_RETRY_SECONDS
+            self._wakeup.wait(timeout)
+
+    def dispatch_pending(self) -> Optional[float]:
+        """
+        Send every due reminder, return the seconds until the next one (None
+        to wait for a wakeup).
+        """
+        while True:
+            now = timezone.now()
+            reminder_ids = self.schedule.pop_due(now.timestamp(), self.batch_size)
+            if reminder_ids:
+                self.deliver(reminder_ids, now)
+            if len(reminder_ids) < self.batch_size:
+                break
+
+        fire_at = self.schedule.next_fire_at()
+        if fire_at is None:
+            return self.idle_seconds
+        wait = max(fire_at - time.time(), 0)
+        return wait if self.idle_seconds is None else min(wait, self.idle_seconds)
+
+    def deliver(self, reminder_ids: List[int], now: datetime) -> None:
+        # The table has the last word: skip reminders removed or moved since
+        # they were scheduled, or sent by another dispatcher.
+        with metrics.query_latency.time(query="claim"):
+            claimed = claim_reminders(
+                reminder_ids, self.owner, now, self.lease_seconds
+            )
+        try:
+            if claimed:
+                deliver_reminders(claimed)
+        finally:
+            with metrics.query_latency.time(query="release"):
+                release_reminders(claimed, self.owner)
+                # Reminders still due could not be sent to everybody, nobody
+                # retries them before REMINDER_DELIVERY_RETRY_SECONDS.
+                retry_at = timezone.now() + timedelta(
+                    seconds=settings.REMINDER_DELIVERY_RETRY_SECONDS
+                )
+                Reminder.objects.filter(
+                    reminder_id__in=claimed, active=True, next_fire_at__lte=now
+                ).update(lease_expires_at=retry_at)
+            with metrics.query_latency.time(query="reschedule"):
+                self.reschedule(reminder_ids)
+
+    def reschedule(self, reminder_ids: List[int]) -> None:
+        """
+        Put back the reminders still to send: repeated ones at their next
+        occurrence, those leased by another dispatcher when the lease ends.
+        """
+        for reminder_id, fire_at, lease_expires_at in Reminder.objects.filter(
+            reminder_id__in=reminder_ids, active=True, next_fire_at__isnull=False
+        ).values_list("reminder_id", "next_fire_at", "lease_expires_at"):
+            if lease_expires_at is not None and lease_expires_at > fire_at:
+                fire_at = lease_expires_at
+            self.schedule.add(reminder_id, fire_at.timestamp())
@@ -0,0 +1,53 @@
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[settings.REMINDERS_LIST_CACHE]
+
+
+def list_version(user_email: str) -> str:
+    """
+    Token that the user's cached pages are stored under. A new one is drawn
+    when the user's reminders change, or when it was evicted.
+    """
+    cache = get_cache()
+    key = f"list-version:{user_email}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def cached_list(
+    user_email: str,
+    cursor: Optional[str],
+    page: Optional[int],
+    build: Callable[[], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    The user's list page, from the cache or from build(). The version is
+    read before building, so a page built while the reminders change is
+    stored under the old version and never served.
+    """
+    cache = get_cache()
+    key = f"list:{user_email}:{list_version(user_email)}:{cursor or ''}:{page or ''}"
+    response = cache.get(key)
+    if response is None:
+        response = build()
+        cache.set(key, response, settings.REMINDERS_LIST_CACHE_SECONDS)
+    return response
+
+
+def invalidate_lists(user_emails: Iterable[str]) -> None:
+    """
+    Call once the change is committed.
+    """
+    get_cache().set_many(
+        {f"list-version:{email}": uuid.uuid4().hex for email in set(user_emails)},
+        None,
+    )
@@ -0,0 +1,30 @@
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from remindmoi_bot import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the reminder metrics of the running dispatcher. Counters and "
+        "histograms live in the process that records them: --url reads "
+        "another one (a web worker's /metrics), --local prints this "
+        "process's, where only the pending reminders are filled in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default=settings.REMINDER_METRICS_URL,
+            help=f"Default: {settings.REMINDER_METRICS_URL}",
+        )
+        parser.add_argument("--local", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["local"]:
+            self.stdout.write(metrics.render(), ending="")
+            return
+        with urlopen(options["url"], timeout=10) as response:
+            self.stdout.write(response.read().decode(), ending="")
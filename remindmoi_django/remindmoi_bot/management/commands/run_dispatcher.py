@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from remindmoi_bot import metrics
+from remindmoi_bot.dispatcher import ReminderDispatcher
+from remindmoi_bot.token_refresher import TokenRefresher
+
+
+class Command(BaseCommand):
+    help = (
+        "Send reminders from the Reminder table. Any number of dispatchers "
+        "can run against the same database, set REMINDER_DISPATCH_IN_PROCESS "
+        "to False so web workers only write rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-seconds",
+            type=float,
+            default=settings.REMINDER_DISPATCH_POLL_SECONDS,
+            help="How often to look for reminders added by the web workers.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.REMINDER_DISPATCH_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--no-token-refresher",
+            action="store_true",
+            help="Leave Nextcloud tokens to another dispatcher.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve this dispatcher's metrics on 127.0.0.1:PORT/metrics.",
+        )
+
+    def handle(self, *args, **options):
+        if options["metrics_port"]:
+            metrics.serve(options["metrics_port"])
+        if not options["no_token_refresher"]:
+            TokenRefresher().start()
+        dispatcher = ReminderDispatcher(
+            batch_size=options["batch_size"], poll_seconds=options["poll_seconds"]
+        )
+        self.stdout.write(f"Dispatcher {dispatcher.owner} started")
+        try:
+            dispatcher.run()
+        except KeyboardInterrupt:
+            dispatcher.stop()
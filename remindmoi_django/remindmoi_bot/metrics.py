@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Samples of one metric: (name suffix, labels, value)
+Samples = List[Tuple[str, Dict[str, str], float]]
+
+
+class Metric(object):
+    """
+    In-process metric, rendered in the Prometheus text format. Every process
+    (web worker, dispatcher) has its own values.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> Samples:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Samples:
+        with self.lock:
+            return [("", dict(key), value) for key, value in self.values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]) -> None:
+        super().__init__(name, help)
+        self.buckets = sorted(buckets)
+        # labels -> (count per bucket, then +Inf), sum
+        self.values: Dict[Tuple, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Samples:
+        samples = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets + [float("inf")], counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append(("_bucket", {**labels, "le": le}, cumulative))
+                samples.append(("_count", labels, cumulative))
+                samples.append(("_sum", labels, total))
+        return samples
+
+
+class Gauge(Metric):
+    """
+    Read when rendered, from collect().
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Samples]) -> None:
+        super().__init__(name, help)
+        self.collect = collect
+
+    def samples(self) -> Samples:
+        return self.collect()
+
+
+REGISTRY: List[Metric] = []
+
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+fire_lag = Histogram(
+    "remindmoi_reminder_fire_lag_seconds",
+    "Time between a reminder's fire time and its message reaching Zulip.",
+    LAG_BUCKETS,
+)
+send_latency = Histogram(
+    "remindmoi_zulip_send_seconds",
+    "Duration of the Zulip send_message calls, one per recipient.",
+    LATENCY_BUCKETS,
+)
+send_errors = Counter(
+    "remindmoi_zulip_send_errors_total",
+    "Failed Zulip send_message calls, by error code.",
+)
+query_latency = Histogram(
+    "remindmoi_dispatcher_query_seconds",
+    "Duration of the dispatcher's database queries.",
+    LATENCY_BUCKETS,
+)
+
+# Upper bounds of the pending buckets, seconds from now
+DUE_BUCKETS = (("overdue", 0), ("1m", 60), ("5m", 300), ("1h", 3600), ("1d", 86400))
+
+
+def pending_reminders() -> Samples:
+    from remindmoi_bot.models import Reminder
+
+    now = timezone.now()
+    aggregates = {"later": Count("pk")}
+    for name, seconds in DUE_BUCKETS:
+        aggregates[name] = Count(
+            "pk", filter=Q(next_fire_at__lte=now + timedelta(seconds=seconds))
+        )
+    counts = Reminder.objects.filter(active=True, next_fire_at__isnull=False).aggregate(
+        **aggregates
+    )
+    samples, previous = [], 0
+    for name in [name for name, _ in DUE_BUCKETS] + ["later"]:
+        samples.append(("", {"due": name}, counts[name] - previous))
+        previous = counts[name]
+    return samples
+
+
+Gauge(
+    "remindmoi_reminders_pending",
+    "Active reminders by time until they fire: overdue, within 1m, 5m, 1h, "
+    "1d, or later. Read from the database.",
+    pending_reminders,
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in metric.samples():
+            label_text = ",".join(
+                '{}="{}"'.format(name, str(label).replace('"', '\\"'))
+                for name, label in labels.items()
+            )
+            label_text = f"{{{label_text}}}" if label_text else ""
+            value = int(value) if float(value).is_integer() else value
+            lines.append(f"{metric.name}{suffix}{label_text} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        try:
+            body = render().encode()
+        finally:
+            connection.close()  # Every scrape runs in a new thread
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve render() from a daemon thread, for processes without the Django
+    views (run_dispatcher).
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.2 on 2026-10-18 06:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def deactivate_past_reminders(apps, schema_editor):
+    # Reminders were never flagged once sent. Their deadline has passed, so the
+    # dispatcher must not pick them up again.
+    Reminder = apps.get_model("remindmoi_bot", "Reminder")
+    Reminder.objects.filter(active=True, deadline__lte=timezone.now()).update(
+        active=False
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0006_historyevents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['active', 'deadline'], name='reminder_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['zulip_user_email'], name='reminder_email_idx'),
+        ),
+        migrations.RunPython(deactivate_past_reminders, migrations.RunPython.noop),
+    ]
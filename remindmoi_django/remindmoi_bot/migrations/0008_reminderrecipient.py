@@ -0,0 +1,53 @@
+# Generated by Django 3.0.2 on 2026-10-18 06:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_recipients(apps, schema_editor):
+    Reminder = apps.get_model("remindmoi_bot", "Reminder")
+    ReminderRecipient = apps.get_model("remindmoi_bot", "ReminderRecipient")
+    recipients = []
+    for reminder_id, zulip_user_email in Reminder.objects.values_list(
+        "reminder_id", "zulip_user_email"
+    ).iterator():
+        for email in dict.fromkeys(zulip_user_email.split(",")):
+            recipients.append(
+                ReminderRecipient(reminder_id=reminder_id, zulip_user_email=email)
+            )
+    ReminderRecipient.objects.bulk_create(recipients, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0007_reminder_due_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderRecipient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zulip_user_email', models.CharField(max_length=128)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='reminder',
+            name='reminder_email_idx',
+        ),
+        migrations.AddField(
+            model_name='reminderrecipient',
+            name='reminder',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='remindmoi_bot.Reminder'),
+        ),
+        migrations.AddIndex(
+            model_name='reminderrecipient',
+            index=models.Index(fields=['zulip_user_email', 'reminder'], name='recipient_email_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reminderrecipient',
+            constraint=models.UniqueConstraint(fields=('reminder', 'zulip_user_email'), name='unique_recipient'),
+        ),
+        migrations.RunPython(backfill_recipients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.2 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0008_reminderrecipient'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='oauthuser',
+            index=models.Index(fields=['token_expiry'], name='oauth_token_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.0.2 on 2026-10-18 06:16
+
+import pickle
+
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from django.db import migrations, models
+from django.db.models import F
+
+UNIT_SECONDS = [("weeks", 7 * 24 * 60 * 60), ("days", 24 * 60 * 60), ("hours", 60 * 60), ("minutes", 60)]
+
+
+def backfill_next_fire_at(apps, schema_editor):
+    Reminder = apps.get_model("remindmoi_bot", "Reminder")
+    Reminder.objects.filter(active=True).update(next_fire_at=F("deadline"))
+
+
+def convert_interval_jobs(apps, schema_editor):
+    # Repeated reminders were APScheduler interval jobs, they become rules on
+    # the reminder. One-off "date" jobs are obsolete since the dispatcher.
+    Reminder = apps.get_model("remindmoi_bot", "Reminder")
+    DjangoJob = apps.get_model("django_apscheduler", "DjangoJob")
+    converted = []
+    for job in DjangoJob.objects.all().iterator():
+        try:
+            state = pickle.loads(bytes(job.job_state))
+        except Exception:
+            continue
+        trigger = state.get("trigger")
+        if isinstance(trigger, DateTrigger):
+            converted.append(job.pk)
+        if not isinstance(trigger, IntervalTrigger) or not state.get("args"):
+            continue
+        seconds = int(trigger.interval.total_seconds())
+        for unit, unit_seconds in UNIT_SECONDS:
+            if seconds and seconds % unit_seconds == 0:
+                Reminder.objects.filter(reminder_id=state["args"][0]).update(
+                    repeat_unit=unit,
+                    repeat_interval=seconds // unit_seconds,
+                    next_fire_at=state.get("next_run_time") or F("deadline"),
+                    active=True,
+                )
+                converted.append(job.pk)
+                break
+    DjangoJob.objects.filter(pk__in=converted).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0009_oauthuser_token_expiry_index'),
+        ('django_apscheduler', '0002_auto_20180412_0758'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reminder',
+            name='reminder_due_idx',
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='next_fire_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='repeat_interval',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='repeat_unit',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['active', 'next_fire_at'], name='reminder_next_fire_idx'),
+        ),
+        migrations.RunPython(backfill_next_fire_at, migrations.RunPython.noop),
+        migrations.RunPython(convert_interval_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.2 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0010_reminder_recurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.2 on 2026-10-18 09:12
+
+from django.db import migrations
+
+
+def purge_jobs(apps, schema_editor):
+    # Reminders are sent by the dispatcher, keyed by reminder id. The
+    # APScheduler jobs 0010 could not convert (ids made of the reminder id
+    # and title) are never read again.
+    DjangoJob = apps.get_model("django_apscheduler", "DjangoJob")
+    DjangoJob.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0012_reminderdelivery'),
+        ('django_apscheduler', '0002_auto_20180412_0758'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.2 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0013_purge_scheduler_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reminder',
+            name='zulip_user_email',
+            field=models.TextField(),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.2 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0014_reminder_recipients_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oauthuser',
+            name='refresh_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='oauthuser',
+            name='refresh_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
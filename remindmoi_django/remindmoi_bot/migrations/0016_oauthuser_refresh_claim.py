@@ -0,0 +1,18 @@
+# Generated by Django 3.0.2 on 2026-10-18 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remindmoi_bot', '0015_oauthuser_refresh_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oauthuser',
+            name='refresh_claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
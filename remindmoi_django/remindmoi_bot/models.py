@@ -1,18 +1,145 @@
 import json
 import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
 
+from dateutil.relativedelta import relativedelta
 from django.db import models
 
+# Recurrence frequencies, an RRULE FREQ with its INTERVAL in repeat_interval
+REPEAT_UNITS = ["minutes", "hours", "days", "weeks", "months"]
+
+
+def normalize_repeat_unit(unit: str) -> Optional[str]:
+    unit = unit if unit.endswith("s") else f"{unit}s"
+    return unit if unit in REPEAT_UNITS else None
+
 
 class Reminder(models.Model):
     reminder_id = models.AutoField(primary_key=True)
 
-    zulip_user_email = models.CharField(max_length=128)
+    # Comma-separated recipients, mirrored into ReminderRecipient rows. A
+    # multi_remind can list any number of them.
+    zulip_user_email = models.TextField()
     title = models.CharField(max_length=1024)
     created = models.DateTimeField()
     deadline = models.DateTimeField()
     active = models.BooleanField(default=True)
 
+    # Sent every repeat_interval repeat_unit after the deadline
+    repeat_unit = models.CharField(max_length=16, blank=True, null=True)
+    repeat_interval = models.PositiveIntegerField(blank=True, null=True)
+    # Next time the reminder is sent, None once it will not be sent again
+    next_fire_at = models.DateTimeField(blank=True, null=True)
+    # Dispatcher sending the reminder, others leave it alone until the lease
+    # expires
+    lease_owner = models.CharField(max_length=128, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Due-time queue scanned by the dispatcher
+            models.Index(
+                fields=["active", "next_fire_at"], name="reminder_next_fire_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs) -> None:
+        if self._state.adding and self.active and self.next_fire_at is None:
+            self.next_fire_at = self.deadline
+        super().save(*args, **kwargs)
+
+    @property
+    def is_repeated(self) -> bool:
+        return bool(self.repeat_unit and self.repeat_interval)
+
+    def advance(self, now: datetime) -> None:
+        """
+        Move next_fire_at to the first occurrence after now, counted from the
+        deadline so months do not drift, or clear it for one-off reminders.
+        """
+        if not self.is_repeated:
+            self.next_fire_at = None
+            self.active = False
+            return
+        if self.repeat_unit == "months":
+            elapsed = (now.year - self.deadline.year) * 12 + (
+                now.month - self.deadline.month
+            )
+            count = max(elapsed // self.repeat_interval, 0)
+            while True:
+                next_fire_at = self.deadline + relativedelta(
+                    months=count * self.repeat_interval
+                )
+                if next_fire_at > now:
+                    break
+                count += 1
+        else:
+            step = timedelta(**{self.repeat_unit: self.repeat_interval})
+            count = max((now - self.deadline) // step + 1, 0)
+            next_fire_at = self.deadline + count * step
+        self.next_fire_at = next_fire_at
+
+    def recipient_emails(self) -> List[str]:
+        return list(dict.fromkeys(self.zulip_user_email.split(",")))
+
+    def sync_recipients(self) -> None:
+        """
+        Mirror the comma-separated zulip_user_email into ReminderRecipient rows.
+        """
+        emails = self.recipient_emails()
+        self.recipients.exclude(zulip_user_email__in=emails).delete()
+        ReminderRecipient.objects.bulk_create(
+            [
+                ReminderRecipient(reminder=self, zulip_user_email=email)
+                for email in emails
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class ReminderRecipient(models.Model):
+    reminder = models.ForeignKey(
+        Reminder, on_delete=models.CASCADE, related_name="recipients"
+    )
+    zulip_user_email = models.CharField(max_length=128)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["reminder", "zulip_user_email"], name="unique_recipient"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["zulip_user_email", "reminder"], name="recipient_email_idx"
+            ),
+        ]
+
+
+class ReminderDelivery(models.Model):
+    """
+    Ledger of the messages sent for each occurrence of a reminder: a retry
+    only sends to the recipients whose row has no sent_at.
+    """
+
+    reminder = models.ForeignKey(
+        Reminder, on_delete=models.CASCADE, related_name="deliveries"
+    )
+    zulip_user_email = models.CharField(max_length=128)
+    # next_fire_at of the occurrence
+    fire_at = models.DateTimeField()
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["reminder", "fire_at", "zulip_user_email"],
+                name="unique_delivery",
+            ),
+        ]
+
 
 class OAuthUser(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -23,6 +150,18 @@ class OAuthUser(models.Model):
     access_token = models.CharField(max_length=64, unique=True, blank=True, null=True)
     refresh_token = models.CharField(max_length=64, unique=True, blank=True, null=True)
     token_expiry = models.DateTimeField(blank=True, null=True)
+    # Refreshes Nextcloud refused in a row, the next one is not tried before
+    # refresh_retry_at
+    refresh_failures = models.PositiveIntegerField(default=0)
+    refresh_retry_at = models.DateTimeField(blank=True, null=True)
+    # Set while a process refreshes the token, others wait for it
+    refresh_claimed_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Tokens about to expire, scanned by the token refresher
+            models.Index(fields=["token_expiry"], name="oauth_token_expiry_idx"),
+        ]
 
     def oauth_to_dict(self):
         return {
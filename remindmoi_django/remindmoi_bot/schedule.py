@@ -0,0 +1,72 @@
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class ReminderSchedule(object):
+    """
+    In-memory min-heap of (fire time, reminder id), fire times being unix
+    timestamps. The Reminder table stays the source of truth: this is rebuilt
+    from it at startup and only tells the dispatcher which rows to look at.
+
+    add() is O(log n). cancel() and rescheduling are O(1): the old heap entry
+    is left behind and skipped when it reaches the top, and the heap is
+    rebuilt once stale entries outnumber the live ones.
+    """
+
+    def __init__(self) -> None:
+        self.heap: List[Tuple[float, int]] = []
+        self.fire_times: Dict[int, float] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.fire_times)
+
+    def load(self, entries: Iterable[Tuple[int, float]]) -> None:
+        """
+        Add (reminder id, fire time) entries at once, in O(n).
+        """
+        entries = list(entries)
+        with self.lock:
+            self.fire_times.update(entries)
+            self._rebuild()
+
+    def add(self, reminder_id: int, fire_at: float) -> None:
+        with self.lock:
+            self.fire_times[reminder_id] = fire_at
+            heapq.heappush(self.heap, (fire_at, reminder_id))
+            if len(self.heap) > 2 * len(self.fire_times) + 64:
+                self._rebuild()
+
+    def cancel(self, reminder_id: int) -> None:
+        with self.lock:
+            self.fire_times.pop(reminder_id, None)
+
+    def next_fire_at(self) -> Optional[float]:
+        with self.lock:
+            self._drop_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float, limit: int) -> List[int]:
+        """
+        Remove and return up to limit reminders due at now, oldest first.
+        """
+        due = []
+        with self.lock:
+            while len(due) < limit:
+                self._drop_stale()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                _, reminder_id = heapq.heappop(self.heap)
+                del self.fire_times[reminder_id]
+                due.append(reminder_id)
+        return due
+
+    def _drop_stale(self) -> None:
+        heap = self.heap
+        while heap and self.fire_times.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _rebuild(self) -> None:
+        self.heap = [(fire_at, reminder_id) for reminder_id, fire_at in self.fire_times.items()]
+        heapq.heapify(self.heap)
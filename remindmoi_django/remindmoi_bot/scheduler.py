@@ -1,9 +1,66 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from django_apscheduler.jobstores import DjangoJobStore
+import threading
+from datetime import datetime
+from typing import Optional
 
+from django.conf import settings
 
-scheduler = BackgroundScheduler()
-scheduler.add_jobstore(DjangoJobStore(), "default")
+from remindmoi_bot.dispatcher import ReminderDispatcher
+from remindmoi_bot.token_refresher import TokenRefresher
+from remindmoi_common.tracing import span
 
-scheduler.start()
-print("Scheduler started!")
+# Started by start(), from wsgi.py: manage.py commands, tests and migrations
+# import the views without sending reminders.
+dispatcher: Optional[ReminderDispatcher] = None
+token_refresher: Optional[TokenRefresher] = None
+_lock = threading.Lock()
+
+
+def start() -> None:
+    global dispatcher, token_refresher
+    if not settings.REMINDER_DISPATCH_IN_PROCESS:
+        return
+    with _lock:
+        if dispatcher is not None:
+            return
+        # One-off and repeated reminders are both sent by the dispatcher,
+        # from the Reminder table.
+        dispatcher = ReminderDispatcher()
+        dispatcher.start()
+        print("Dispatcher started!")
+
+        token_refresher = TokenRefresher()
+        token_refresher.start()
+        print("Token refresher started!")
+
+
+def stop() -> None:
+    global dispatcher, token_refresher
+    with _lock:
+        if dispatcher is not None:
+            dispatcher.stop()
+            token_refresher.stop()
+        dispatcher = token_refresher = None
+
+
+def dispatcher_state() -> str:
+    if not settings.REMINDER_DISPATCH_IN_PROCESS:
+        return "external"
+    if dispatcher is None:
+        return "not started"
+    return "running" if dispatcher.is_alive() else "stopped"
+
+
+def schedule_reminder(reminder_id: int, fire_at: Optional[datetime]) -> None:
+    """
+    Call once the row is saved. Dispatchers in other processes find it on
+    their next poll.
+    """
+    if dispatcher is not None:
+        with span("scheduler.schedule", reminder_id=reminder_id):
+            dispatcher.schedule_reminder(reminder_id, fire_at)
+
+
+def cancel_reminder(reminder_id: int) -> None:
+    if dispatcher is not None:
+        with span("scheduler.cancel", reminder_id=reminder_id):
+            dispatcher.cancel(reminder_id)
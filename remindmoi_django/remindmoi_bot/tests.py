@@ -1,3 +1,1142 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+from urllib.request import urlopen
 
-# Create your tests here.
+import pytz
+from caldav.lib.error import DAVError
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from remindmoi_bot import list_cache, metrics
+from remindmoi_bot.auth import ClientSecrets, refresh_oauth_user
+from remindmoi_bot.calendars import CalendarCache
+from remindmoi_bot.dispatcher import (
+    ReminderDispatcher,
+    claim_reminders,
+    purge_deliveries,
+    release_reminders,
+)
+from remindmoi_bot.models import (
+    HistoryEvents,
+    OAuthUser,
+    Reminder,
+    ReminderDelivery,
+    ReminderRecipient,
+)
+from remindmoi_bot.schedule import ReminderSchedule
+from remindmoi_bot.token_refresher import TokenRefresher, expiring_oauth_users
+from remindmoi_bot.zulip_utils import (
+    MemberDirectory,
+    advance_reminders,
+    deliver_reminders,
+    record_deliveries,
+)
+from remindmoi_common.tracing import Tracer
+
+
+def create_reminder(minutes: int, **kwargs) -> Reminder:
+    now = timezone.now()
+    defaults = {
+        "zulip_user_email": "juan@monadical.com",
+        "title": "clean the dishes",
+        "created": now,
+        "deadline": now + timedelta(minutes=minutes),
+    }
+    defaults.update(kwargs)
+    reminder = Reminder.objects.create(**defaults)
+    reminder.sync_recipients()
+    return reminder
+
+
+class DispatcherTestCase(TestCase):
+    @mock.patch("remindmoi_bot.dispatcher.deliver_reminders")
+    def test_dispatch_pending(self, deliver):
+        due = [create_reminder(-minutes) for minutes in range(1, 4)]
+        create_reminder(30)
+        deliver.side_effect = lambda ids: Reminder.objects.filter(
+            reminder_id__in=ids
+        ).update(active=False)
+        dispatcher = ReminderDispatcher(batch_size=2, idle_seconds=60)
+        dispatcher.load()
+
+        wait = dispatcher.dispatch_pending()
+
+        batches = [call.args[0] for call in deliver.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(
+            sorted(sum(batches, [])), sorted(r.reminder_id for r in due)
+        )
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 60)
+
+    @mock.patch("remindmoi_bot.dispatcher.deliver_reminders")
+    def test_dispatch_checks_table(self, deliver):
+        cancelled = create_reminder(-3)
+        removed = create_reminder(-2)
+        moved = create_reminder(-1)
+        dispatcher = ReminderDispatcher(idle_seconds=None)
+        dispatcher.load()
+        dispatcher.cancel(cancelled.reminder_id)
+        removed.delete()
+        moved.next_fire_at = timezone.now() + timedelta(minutes=5)
+        moved.save()
+
+        wait = dispatcher.dispatch_pending()
+
+        deliver.assert_not_called()
+        self.assertEqual(len(dispatcher.schedule), 1)  # Only the moved one
+        self.assertAlmostEqual(wait, 300, delta=5)
+
+    @mock.patch("remindmoi_bot.dispatcher.deliver_reminders")
+    def test_dispatch_reschedules_repeated(self, deliver):
+        reminder = create_reminder(-1, repeat_unit="hours", repeat_interval=1)
+        deliver.side_effect = advance_reminders
+        dispatcher = ReminderDispatcher(idle_seconds=None)
+        dispatcher.schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
+
+        dispatcher.dispatch_pending()
+
+        deliver.assert_called_once_with([reminder.reminder_id])
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, reminder.deadline + timedelta(hours=1))
+        self.assertEqual(
+            dispatcher.schedule.next_fire_at(), reminder.next_fire_at.timestamp()
+        )
+
+    @mock.patch("remindmoi_bot.dispatcher.deliver_reminders")
+    def test_dispatch_retries_later(self, deliver):
+        reminder = create_reminder(-1)
+        dispatcher = ReminderDispatcher(idle_seconds=None)
+        dispatcher.schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
+
+        wait = dispatcher.dispatch_pending()  # deliver left it due
+
+        self.assertEqual(deliver.call_count, 1)
+        self.assertAlmostEqual(wait, 60, delta=5)
+        self.assertEqual(claim_reminders([reminder.reminder_id], "other"), [])
+
+    def test_dispatch_nothing_scheduled(self):
+        dispatcher = ReminderDispatcher(idle_seconds=None)
+        self.assertIsNone(dispatcher.dispatch_pending())
+
+    def test_poll_loads_horizon(self):
+        due = create_reminder(-1)
+        soon = create_reminder(1)
+        create_reminder(60)
+        dispatcher = ReminderDispatcher(poll_seconds=300)
+        dispatcher.load()
+        self.assertEqual(
+            sorted(dispatcher.schedule.fire_times), [due.reminder_id, soon.reminder_id]
+        )
+
+
+class PurgeDeliveriesTestCase(TestCase):
+    def test_purge_deliveries(self):
+        now = timezone.now()
+        old = now - timedelta(days=8)
+        sent = create_reminder(-60 * 24 * 8, active=False)
+        repeated = create_reminder(-60 * 24 * 8, repeat_unit="days", repeat_interval=1)
+        # Still being retried, however old
+        ReminderDelivery.objects.create(
+            reminder=repeated,
+            zulip_user_email="juan@monadical.com",
+            fire_at=repeated.next_fire_at,
+        )
+        ReminderDelivery.objects.create(
+            reminder=sent, zulip_user_email="juan@monadical.com", fire_at=old, sent_at=old
+        )
+        recent = ReminderDelivery.objects.create(
+            reminder=sent,
+            zulip_user_email="ana@monadical.com",
+            fire_at=now - timedelta(days=1),
+        )
+
+        self.assertEqual(purge_deliveries(now, retention_seconds=7 * 24 * 3600), 1)
+        self.assertEqual(
+            sorted(ReminderDelivery.objects.values_list("pk", flat=True)),
+            sorted([recent.pk, repeated.deliveries.get().pk]),
+        )
+
+
+class LeaseTestCase(TestCase):
+    def test_claim_once(self):
+        ids = [create_reminder(-1).reminder_id for _ in range(3)]
+        create_reminder(10)
+
+        self.assertEqual(sorted(claim_reminders(ids, "first")), ids)
+        self.assertEqual(claim_reminders(ids, "second"), [])
+
+    def test_claim_expired_lease(self):
+        reminder = create_reminder(-1)
+        now = timezone.now()
+        claim_reminders([reminder.reminder_id], "first", now, lease_seconds=60)
+
+        later = now + timedelta(seconds=61)
+        self.assertEqual(
+            claim_reminders([reminder.reminder_id], "second", later),
+            [reminder.reminder_id],
+        )
+
+    def test_release(self):
+        reminder = create_reminder(-1)
+        claim_reminders([reminder.reminder_id], "first")
+        release_reminders([reminder.reminder_id], "second")  # Not its lease
+        self.assertEqual(claim_reminders([reminder.reminder_id], "second"), [])
+
+        release_reminders([reminder.reminder_id], "first")
+        self.assertEqual(
+            claim_reminders([reminder.reminder_id], "second"), [reminder.reminder_id]
+        )
+
+    @mock.patch("remindmoi_bot.dispatcher.deliver_reminders")
+    def test_dispatchers_share_reminders(self, deliver):
+        deliver.side_effect = lambda ids: Reminder.objects.filter(
+            reminder_id__in=ids
+        ).update(active=False)
+        leased = create_reminder(-2)
+        free = create_reminder(-1)
+        now = timezone.now()
+        claim_reminders([leased.reminder_id], "other", now, lease_seconds=60)
+        dispatcher = ReminderDispatcher(idle_seconds=None)
+        dispatcher.load()
+
+        dispatcher.dispatch_pending()
+
+        deliver.assert_called_once_with([free.reminder_id])
+        self.assertFalse(Reminder.objects.filter(lease_owner=dispatcher.owner).exists())
+        # Retried if the other dispatcher has not sent it when its lease ends
+        self.assertAlmostEqual(
+            dispatcher.schedule.next_fire_at(), now.timestamp() + 60, delta=1
+        )
+
+
+class ReminderScheduleTestCase(SimpleTestCase):
+    def test_pop_due(self):
+        schedule = ReminderSchedule()
+        schedule.load([(1, 30.0), (2, 10.0), (3, 20.0)])
+        schedule.add(4, 5.0)
+        schedule.add(3, 50.0)  # Rescheduled
+        schedule.cancel(2)
+
+        self.assertEqual(schedule.next_fire_at(), 5.0)
+        self.assertEqual(schedule.pop_due(40.0, limit=10), [4, 1])
+        self.assertEqual(schedule.pop_due(40.0, limit=10), [])
+        self.assertEqual(schedule.next_fire_at(), 50.0)
+        self.assertEqual(len(schedule), 1)
+
+    def test_pop_due_limit(self):
+        schedule = ReminderSchedule()
+        schedule.load((reminder_id, float(reminder_id)) for reminder_id in range(10))
+        self.assertEqual(schedule.pop_due(100.0, limit=4), [0, 1, 2, 3])
+        self.assertEqual(len(schedule), 6)
+
+    def test_stale_entries_rebuilt(self):
+        schedule = ReminderSchedule()
+        for fire_at in range(1000):
+            schedule.add(1, float(fire_at))
+        self.assertLess(len(schedule.heap), 100)
+        self.assertEqual(schedule.pop_due(1000.0, limit=10), [1])
+
+
+@mock.patch("remindmoi_bot.zulip_utils.get_client")
+class DeliveryTestCase(TestCase):
+    def test_deliver_reminders(self, get_client):
+        client = get_client.return_value
+        client.send_message.return_value = {"result": "success"}
+        single = create_reminder(-1)
+        multi = create_reminder(-1, zulip_user_email="a@monadical.com,b@monadical.com")
+
+        delivered = deliver_reminders([single.reminder_id, multi.reminder_id])
+
+        self.assertEqual(sorted(delivered), [single.reminder_id, multi.reminder_id])
+        self.assertEqual(client.send_message.call_count, 3)
+        self.assertFalse(Reminder.objects.filter(active=True).exists())
+
+    def test_deliver_reminders_failure(self, get_client):
+        client = get_client.return_value
+        client.send_message.return_value = {"result": "error", "code": "BAD_REQUEST"}
+        reminder = create_reminder(-1)
+
+        self.assertEqual(deliver_reminders([reminder.reminder_id]), [])
+        self.assertEqual(client.send_message.call_count, 1)
+
+    def test_retry_sends_only_failed(self, get_client):
+        client = get_client.return_value
+        reminder = create_reminder(-1, zulip_user_email="a@monadical.com,b@monadical.com")
+        client.send_message.side_effect = lambda message: {
+            "result": "success" if message["to"] == "a@monadical.com" else "error"
+        }
+
+        self.assertEqual(deliver_reminders([reminder.reminder_id]), [])
+        reminder.refresh_from_db()
+        self.assertTrue(reminder.active)  # Left due for a retry
+
+        client.send_message.side_effect = None
+        client.send_message.return_value = {"result": "success"}
+        client.send_message.reset_mock()
+        self.assertEqual(deliver_reminders([reminder.reminder_id]), [reminder.reminder_id])
+        client.send_message.assert_called_once()
+        self.assertEqual(client.send_message.call_args.args[0]["to"], "b@monadical.com")
+        reminder.refresh_from_db()
+        self.assertFalse(reminder.active)
+        self.assertEqual(
+            sorted(ReminderDelivery.objects.values_list("zulip_user_email", "attempts")),
+            [("a@monadical.com", 1), ("b@monadical.com", 2)],
+        )
+
+    @override_settings(REMINDER_DELIVERY_ATTEMPTS=2)
+    def test_gives_up_after_attempts(self, get_client):
+        client = get_client.return_value
+        client.send_message.return_value = {"result": "error", "code": "BAD_REQUEST"}
+        reminder = create_reminder(-1, repeat_unit="days", repeat_interval=1)
+
+        deliver_reminders([reminder.reminder_id])
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, reminder.deadline)
+        deliver_reminders([reminder.reminder_id])
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, reminder.deadline + timedelta(days=1))
+
+    def test_next_occurrence_sent_again(self, get_client):
+        client = get_client.return_value
+        client.send_message.return_value = {"result": "success"}
+        reminder = create_reminder(-1, repeat_unit="days", repeat_interval=1)
+        deliver_reminders([reminder.reminder_id])
+        Reminder.objects.filter(pk=reminder.pk).update(
+            next_fire_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        deliver_reminders([reminder.reminder_id])
+
+        self.assertEqual(client.send_message.call_count, 2)
+        self.assertEqual(ReminderDelivery.objects.count(), 2)
+
+    def test_deliver_reminders_rate_limited(self, get_client):
+        client = get_client.return_value
+        client.send_message.side_effect = [
+            {"result": "error", "code": "RATE_LIMIT_HIT", "retry-after": 0.01},
+            {"result": "success"},
+        ]
+        reminder = create_reminder(-1)
+
+        self.assertEqual(deliver_reminders([reminder.reminder_id]), [reminder.reminder_id])
+        self.assertEqual(client.send_message.call_count, 2)
+
+
+@mock.patch("remindmoi_bot.zulip_utils.get_client")
+class MemberDirectoryTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.members = {
+            "members": [
+                {"full_name": "Jose", "email": "jose@monadical.com"},
+                {"full_name": "Max  Power", "email": "max@monadical.com"},
+                {"full_name": "Carolina", "email": "carolina@monadical.com"},
+            ]
+        }
+        self.directory = MemberDirectory(ttl=60, watch_events=False)
+
+    def test_emails_are_cached(self, get_client):
+        client = get_client.return_value
+        client.get_members.return_value = self.members
+
+        self.assertEqual(
+            self.directory.emails(["Jose", "Carolina"]),
+            ["jose@monadical.com", "carolina@monadical.com"],
+        )
+        self.assertEqual(self.directory.emails(["Jose"]), ["jose@monadical.com"])
+        self.assertEqual(client.get_members.call_count, 1)
+
+    def test_emails_normalized_name(self, get_client):
+        client = get_client.return_value
+        client.get_members.return_value = self.members
+
+        self.assertEqual(self.directory.emails(["max power"]), ["max@monadical.com"])
+        self.assertEqual(self.directory.emails(["Nobody"]), [])
+
+    def test_realm_user_event_invalidates(self, get_client):
+        client = get_client.return_value
+        client.get_members.return_value = self.members
+        self.directory.emails(["Jose"])
+
+        self.directory.handle_event({"type": "message"})
+        self.directory.emails(["Jose"])
+        self.assertEqual(client.get_members.call_count, 1)
+
+        self.directory.handle_event({"type": "realm_user", "op": "add"})
+        self.directory.emails(["Jose"])
+        self.assertEqual(client.get_members.call_count, 2)
+
+    def test_listen_and_unwatch(self, get_client):
+        client = get_client.return_value
+        client.get_members.return_value = self.members
+        client.register.return_value = {
+            "result": "success", "queue_id": "q1", "last_event_id": -1
+        }
+
+        def get_events(queue_id, last_event_id):
+            self.directory.stopped.set()
+            return {"result": "success", "events": [{"type": "realm_user", "id": 0}]}
+
+        client.get_events.side_effect = get_events
+        self.directory.emails(["Jose"])
+        self.directory.listen()
+        self.assertEqual(self.directory.queue_id, "q1")
+        self.directory.emails(["Jose"])
+        self.assertEqual(client.get_members.call_count, 2)
+
+        self.directory.unwatch()
+        client.deregister.assert_called_once_with("q1", timeout=1)
+        self.assertIsNone(self.directory.queue_id)
+
+    def test_expired_queue_registered_again(self, get_client):
+        client = get_client.return_value
+        client.register.side_effect = [
+            {"result": "success", "queue_id": "q1", "last_event_id": -1},
+            {"result": "success", "queue_id": "q2", "last_event_id": 5},
+        ]
+        answers = [
+            {"result": "error", "code": "BAD_EVENT_QUEUE_ID", "msg": "Bad queue"},
+            {"result": "success", "events": []},
+        ]
+
+        def get_events(queue_id, last_event_id):
+            if len(answers) == 1:
+                self.directory.stopped.set()
+            return answers.pop(0)
+
+        client.get_events.side_effect = get_events
+        with mock.patch.object(self.directory.stopped, "wait"):
+            self.directory.listen()
+        self.assertEqual(self.directory.queue_id, "q2")
+        self.assertEqual(
+            client.get_events.call_args.kwargs, {"queue_id": "q2", "last_event_id": 5}
+        )
+
+    def test_listener_survives_errors(self, get_client):
+        client = get_client.return_value
+        client.register.side_effect = [
+            ConnectionError("network"),
+            {"result": "success", "queue_id": "q1", "last_event_id": -1},
+        ]
+        answers = [
+            ConnectionError("network"),
+            {"result": "success", "events": [{"type": "realm_user", "id": 3}]},
+        ]
+
+        def get_events(queue_id, last_event_id):
+            answer = answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            self.directory.stopped.set()
+            return answer
+
+        client.get_events.side_effect = get_events
+        self.directory.watching = True
+        with mock.patch.object(self.directory.stopped, "wait") as wait:
+            self.directory.listen()
+
+        self.assertEqual([call.args[0] for call in wait.call_args_list], [1, 2])
+        self.assertEqual(self.directory.queue_id, "q1")
+        self.assertEqual(self.directory.last_event_id, 3)
+        self.assertFalse(self.directory.watching)
+
+
+class BulkAddTestCase(TestCase):
+    def bulk_add(self, reminders):
+        return self.client.post(
+            "/bulk_add_reminders",
+            json.dumps({"reminders": reminders}),
+            content_type="application/json",
+        )
+
+    def test_bulk_add_reminders(self):
+        now = timezone.now().timestamp()
+        reminders = [
+            {
+                "zulip_user_email": "juan@monadical.com",
+                "title": title,
+                "created": now,
+                "deadline": now + 60,
+            }
+            for title in ("clean the dishes", "eat")
+        ]
+
+        response = self.bulk_add(reminders).json()
+
+        self.assertTrue(response["success"])
+        self.assertEqual(
+            list(
+                Reminder.objects.filter(
+                    reminder_id__in=response["reminder_ids"]
+                ).order_by("reminder_id").values_list("title", flat=True)
+            ),
+            ["clean the dishes", "eat"],
+        )
+        self.assertEqual(
+            ReminderRecipient.objects.filter(
+                reminder_id__in=response["reminder_ids"]
+            ).count(),
+            2,
+        )
+
+    @override_settings(BULK_ADD_MAX_REMINDERS=1)
+    def test_bulk_add_too_many(self):
+        response = self.bulk_add([{}, {}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Reminder.objects.exists())
+
+
+class RecipientsTestCase(TestCase):
+    def test_sync_recipients(self):
+        reminder = create_reminder(10, zulip_user_email="a@monadical.com,b@monadical.com")
+        reminder.zulip_user_email = "b@monadical.com,c@monadical.com,c@monadical.com"
+        reminder.save()
+        reminder.sync_recipients()
+
+        self.assertEqual(
+            sorted(reminder.recipients.values_list("zulip_user_email", flat=True)),
+            ["b@monadical.com", "c@monadical.com"],
+        )
+
+    def test_list_reminders_exact_email(self):
+        mine = create_reminder(10, zulip_user_email="jo@monadical.com,max@monadical.com")
+        create_reminder(10, zulip_user_email="jose@monadical.com")
+
+        response = self.client.post(
+            "/list_reminders",
+            json.dumps({"zulip_user_email": "jo@monadical.com"}),
+            content_type="application/json",
+        )
+
+        reminders = response.json()["reminders_list"]
+        self.assertEqual([r["reminder_id"] for r in reminders], [mine.reminder_id])
+        self.assertEqual(ReminderRecipient.objects.count(), 3)
+
+    def test_many_recipients(self):
+        emails = [f"teammate.number{i}@monadical.com" for i in range(20)]
+        reminder = create_reminder(10, zulip_user_email=",".join(emails))
+        reminder.sync_recipients()
+
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.recipient_emails(), emails)
+        self.assertIsNone(Reminder._meta.get_field("zulip_user_email").max_length)
+
+
+class RemoveReminderTestCase(TestCase):
+    def remove(self, reminder_id):
+        return self.client.post(
+            "/remove_reminder",
+            json.dumps({"reminder_id": reminder_id}),
+            content_type="application/json",
+        )
+
+    def test_remove_twice(self):
+        reminder = create_reminder(10)
+        self.assertEqual(self.remove(reminder.reminder_id).json(), {"success": True})
+        self.assertEqual(self.remove(reminder.reminder_id).json(), {"success": True})
+        self.assertFalse(Reminder.objects.exists())
+        self.assertFalse(ReminderRecipient.objects.exists())
+
+    def test_remove_sent(self):
+        reminder = create_reminder(-1)
+        ReminderDelivery.objects.create(
+            reminder=reminder,
+            fire_at=reminder.next_fire_at,
+            zulip_user_email=reminder.zulip_user_email,
+            attempts=1,
+            sent_at=timezone.now(),
+        )
+        advance_reminders([reminder.reminder_id])
+
+        self.assertEqual(self.remove(reminder.reminder_id).status_code, 200)
+        self.assertFalse(ReminderDelivery.objects.exists())
+
+
+@override_settings(REMINDERS_PAGE_SIZE=2)
+class ListRemindersTestCase(TestCase):
+    def setUp(self):
+        # Reminders are created through the ORM, bypassing invalidation
+        list_cache.get_cache().clear()
+
+    def list_reminders(self, **kwargs):
+        payload = {"zulip_user_email": "juan@monadical.com"}
+        payload.update(kwargs)
+        response = self.client.post(
+            "/list_reminders", json.dumps(payload), content_type="application/json"
+        )
+        return response.json()
+
+    def test_keyset_pagination(self):
+        deadline = timezone.now() + timedelta(days=1)
+        reminders = [create_reminder(minutes) for minutes in (30, 10, 20)]
+        reminders.append(create_reminder(0, deadline=deadline))
+        reminders.append(create_reminder(0, deadline=deadline))
+        expected = sorted(reminders, key=lambda r: (r.deadline, r.reminder_id))
+
+        listed = []
+        response = self.list_reminders()
+        listed += response["reminders_list"]
+        while response["next_cursor"]:
+            response = self.list_reminders(cursor=response["next_cursor"])
+            listed += response["reminders_list"]
+
+        self.assertEqual(
+            [r["reminder_id"] for r in listed], [r.reminder_id for r in expected]
+        )
+
+    def test_repeated_listed_at_next_occurrence(self):
+        repeated = create_reminder(-60 * 24, repeat_unit="days", repeat_interval=1)
+        repeated.advance(timezone.now())
+        repeated.save()
+        sent = create_reminder(-30, active=False)
+        Reminder.objects.filter(pk=sent.pk).update(next_fire_at=None)
+        upcoming = create_reminder(60)
+
+        listed = self.list_reminders()["reminders_list"]
+        listed += self.list_reminders(page=2)["reminders_list"]
+
+        self.assertEqual(
+            [r["reminder_id"] for r in listed],
+            [sent.reminder_id, upcoming.reminder_id, repeated.reminder_id],
+        )
+        self.assertEqual(
+            datetime.fromisoformat(listed[2]["deadline"]), repeated.next_fire_at
+        )
+
+    def test_invalidated_when_advanced(self):
+        reminder = create_reminder(-1, repeat_unit="hours", repeat_interval=1)
+        before = self.list_reminders()["reminders_list"][0]["deadline"]
+
+        advance_reminders([reminder.reminder_id])
+
+        after = self.list_reminders()["reminders_list"][0]["deadline"]
+        self.assertEqual(
+            datetime.fromisoformat(after) - datetime.fromisoformat(before),
+            timedelta(hours=1),
+        )
+
+    def test_page(self):
+        reminders = [create_reminder(minutes) for minutes in (10, 20, 30)]
+
+        response = self.list_reminders(page=2)
+
+        self.assertEqual(
+            [r["reminder_id"] for r in response["reminders_list"]],
+            [reminders[2].reminder_id],
+        )
+        self.assertIsNone(response["next_cursor"])
+
+    def post(self, path, payload):
+        return self.client.post(path, json.dumps(payload), content_type="application/json")
+
+    def test_cached(self):
+        reminder = create_reminder(10)
+        self.list_reminders()
+        with self.assertNumQueries(0):
+            response = self.list_reminders()
+        self.assertEqual(response["reminders_list"][0]["reminder_id"], reminder.reminder_id)
+
+    def test_invalidated_by_add_and_remove(self):
+        self.assertEqual(self.list_reminders()["reminders_list"], [])
+        now = timezone.now().timestamp()
+        reminder_id = self.post(
+            "/add_reminder",
+            {
+                "zulip_user_email": "juan@monadical.com",
+                "title": "clean the dishes",
+                "created": now,
+                "deadline": now + 600,
+            },
+        ).json()["reminder_id"]
+        listed = self.list_reminders()["reminders_list"]
+        self.assertEqual([r["reminder_id"] for r in listed], [reminder_id])
+
+        self.post("/remove_reminder", {"reminder_id": reminder_id})
+        self.assertEqual(self.list_reminders()["reminders_list"], [])
+
+    @mock.patch("remindmoi_bot.views.get_user_emails")
+    def test_invalidated_for_new_recipients(self, get_user_emails):
+        get_user_emails.return_value = ["ana@monadical.com"]
+        reminder = create_reminder(10)
+        self.assertEqual(
+            self.list_reminders(zulip_user_email="ana@monadical.com")["reminders_list"],
+            [],
+        )
+        self.post(
+            "/multi_remind",
+            {"reminder_id": reminder.reminder_id, "users_to_remind": ["Ana"]},
+        )
+        listed = self.list_reminders(zulip_user_email="ana@monadical.com")
+        self.assertEqual(
+            [r["reminder_id"] for r in listed["reminders_list"]], [reminder.reminder_id]
+        )
+
+
+class ClientSecretsTestCase(TestCase):
+    def write_secrets(self, path: str, client_id: str, mtime: int) -> None:
+        with open(path, "w") as secret_file:
+            json.dump({"web": {"client_id": client_id}}, secret_file)
+        os.utime(path, (mtime, mtime))
+
+    def test_reload_on_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "client_secret.json")
+            self.write_secrets(path, "first", 1000)
+            secrets = ClientSecrets(path)
+
+            self.assertEqual(secrets.get()["client_id"], "first")
+            with mock.patch("builtins.open") as open_file:
+                secrets.get()
+                self.assertFalse(open_file.called)
+
+            self.write_secrets(path, "second", 2000)
+            self.assertEqual(secrets.get()["client_id"], "second")
+
+
+@mock.patch("remindmoi_bot.calendars.client_secrets")
+@mock.patch("remindmoi_bot.calendars.caldav")
+class CalendarCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = OAuthUser.objects.create(
+            zulip_user_email="juan@monadical.com",
+            user_id="juan",
+            access_token="token",
+            refresh_token="refresh",
+            token_expiry=timezone.now() + timedelta(hours=1),
+        )
+        self.cache = CalendarCache()
+
+    def mock_discovery(self, caldav):
+        personal = mock.Mock(url="https://cloud/calendars/juan/personal/")
+        personal.name = "Personal"
+        other = mock.Mock()
+        other.name = "Work"
+        client = caldav.DAVClient.return_value
+        client.principal.return_value.calendars.return_value = [other, personal]
+        return client
+
+    def test_calendar_url_is_cached(self, caldav, client_secrets):
+        client_secrets.get.return_value = {
+            "client_id": "id", "client_secret": "secret", "token_uri": "uri"
+        }
+        client = self.mock_discovery(caldav)
+
+        self.cache.add_event(self.user, "event 1")
+        self.cache.add_event(self.user, "event 2")
+
+        self.assertEqual(caldav.DAVClient.call_count, 1)
+        self.assertEqual(client.principal.call_count, 1)
+        caldav.Calendar.assert_called_with(
+            client=client, url="https://cloud/calendars/juan/personal/"
+        )
+        self.assertEqual(caldav.Calendar.return_value.add_event.call_count, 2)
+
+    def test_refreshed_token_reuses_client(self, caldav, client_secrets):
+        client_secrets.get.return_value = {
+            "client_id": "id", "client_secret": "secret", "token_uri": "uri"
+        }
+        client = self.mock_discovery(caldav)
+        self.cache.add_event(self.user, "event 1")
+
+        self.user.access_token = "new token"
+        self.cache.add_event(self.user, "event 2")
+
+        self.assertEqual(client.principal.call_count, 1)
+        self.assertEqual(client.auth.credentials.access_token, "new token")
+
+
+def create_oauth_user(name: str, minutes: int) -> OAuthUser:
+    return OAuthUser.objects.create(
+        zulip_user_email=f"{name}@monadical.com",
+        user_id=name,
+        access_token=f"{name}-access",
+        refresh_token=f"{name}-refresh",
+        token_expiry=timezone.now() + timedelta(minutes=minutes),
+    )
+
+
+class TokenRefreshTestCase(TestCase):
+    @mock.patch("remindmoi_bot.auth.auth_token_request")
+    def test_refresh_oauth_user(self, auth_token_request):
+        auth_token_request.return_value = {
+            "access_token": "new-access",
+            "refresh_token": "new-refresh",
+            "expires_in": 3600,
+        }
+        user = create_oauth_user("juan", 1)
+
+        self.assertTrue(refresh_oauth_user(user))
+
+        user.refresh_from_db()
+        self.assertEqual(user.access_token, "new-access")
+        self.assertEqual(user.refresh_token, "new-refresh")
+        self.assertGreater(user.token_expiry, timezone.now() + timedelta(minutes=59))
+
+    @override_settings(OAUTH_REFRESH_ATTEMPTS=3, OAUTH_REFRESH_RETRY_SECONDS=60)
+    @mock.patch("remindmoi_bot.auth.auth_token_request")
+    def test_refused_refresh_backs_off(self, auth_token_request):
+        auth_token_request.return_value = {"error": "invalid_grant"}
+        user = create_oauth_user("juan", -1)
+
+        self.assertFalse(refresh_oauth_user(user))
+        self.assertFalse(refresh_oauth_user(user))
+        user.refresh_from_db()
+        self.assertEqual(user.refresh_failures, 2)
+        self.assertAlmostEqual(
+            (user.refresh_retry_at - timezone.now()).total_seconds(), 120, delta=5
+        )
+        self.assertEqual(expiring_oauth_users(timezone.now()), [])
+
+        self.assertFalse(refresh_oauth_user(user))
+        user.refresh_from_db()
+        self.assertIsNone(user.refresh_token)  # Given up
+        self.assertEqual(auth_token_request.call_count, 3)
+
+    @mock.patch("remindmoi_bot.auth.auth_token_request")
+    def test_concurrent_refresh_keeps_new_token(self, auth_token_request):
+        auth_token_request.return_value = {
+            "access_token": "new-access",
+            "refresh_token": "new-refresh",
+            "expires_in": 3600,
+        }
+        user = create_oauth_user("juan", -1)
+        stale = OAuthUser.objects.get(pk=user.pk)
+        self.assertTrue(refresh_oauth_user(user))
+
+        self.assertTrue(refresh_oauth_user(stale))
+
+        auth_token_request.assert_called_once()
+        self.assertEqual(stale.access_token, "new-access")
+        self.assertEqual(stale.refresh_token, "new-refresh")
+
+    @mock.patch("remindmoi_bot.auth.time.sleep")
+    @mock.patch("remindmoi_bot.auth.auth_token_request")
+    def test_waits_for_claimed_refresh(self, auth_token_request, sleep):
+        user = create_oauth_user("juan", -1)
+        OAuthUser.objects.filter(pk=user.pk).update(
+            refresh_claimed_until=timezone.now() + timedelta(minutes=1)
+        )
+        # The other process saves its token while this one waits
+        sleep.side_effect = lambda seconds: OAuthUser.objects.filter(pk=user.pk).update(
+            access_token="other-access",
+            refresh_token="other-refresh",
+            refresh_claimed_until=None,
+        )
+
+        self.assertTrue(refresh_oauth_user(user))
+
+        auth_token_request.assert_not_called()
+        self.assertEqual(user.refresh_token, "other-refresh")
+
+    @mock.patch("remindmoi_bot.token_refresher.refresh_oauth_user")
+    def test_refresh_expiring(self, refresh_oauth_user):
+        refresh_oauth_user.side_effect = lambda user: user.user_id != "broken"
+        expiring = [create_oauth_user(f"user{index}", index) for index in range(-1, 4)]
+        create_oauth_user("broken", 2)
+        create_oauth_user("later", 30)
+        refresher = TokenRefresher(
+            margin_seconds=5 * 60, batch_size=2, workers=2, idle_seconds=60 * 60
+        )
+
+        wait = refresher.refresh_expiring()
+
+        refreshed = sorted(call.args[0].user_id for call in refresh_oauth_user.call_args_list)
+        self.assertEqual(refreshed, sorted([user.user_id for user in expiring] + ["broken"]))
+        # The next token to refresh is "later", 25 minutes from now
+        self.assertGreater(wait, 24 * 60)
+        self.assertLess(wait, 25 * 60)
+
+
+@mock.patch("remindmoi_bot.views.calendar_cache")
+@mock.patch("remindmoi_bot.views.refresh_oauth_user")
+class CalendarRemindTestCase(TestCase):
+    def calendar_remind(self, email="juan@monadical.com"):
+        return self.client.post(
+            "/calendar-remind",
+            json.dumps(
+                {
+                    "event_date": "16-06-2020",
+                    "event_time": "18:00",
+                    "api_type": None,
+                    "email": email,
+                    "title": "https://zulip.monadical.com/#narrow/pm-with/juan",
+                }
+            ),
+            content_type="application/json",
+        )
+
+    def test_unknown_user(self, refresh_oauth_user, calendar_cache):
+        self.assertEqual(self.calendar_remind("nobody@monadical.com").status_code, 404)
+        self.assertFalse(calendar_cache.add_event.called)
+
+    def test_valid_token(self, refresh_oauth_user, calendar_cache):
+        user = create_oauth_user("juan", 30)
+
+        self.assertEqual(self.calendar_remind().status_code, 200)
+        self.assertFalse(refresh_oauth_user.called)
+        self.assertEqual(calendar_cache.add_event.call_args.args[0], user)
+        self.assertEqual(HistoryEvents.objects.count(), 1)
+
+    def test_expired_token_is_refreshed(self, refresh_oauth_user, calendar_cache):
+        create_oauth_user("juan", -30)
+        refresh_oauth_user.return_value = True
+
+        self.assertEqual(self.calendar_remind().status_code, 200)
+        self.assertEqual(refresh_oauth_user.call_count, 1)
+
+    def test_refresh_failed(self, refresh_oauth_user, calendar_cache):
+        create_oauth_user("juan", -30)
+        refresh_oauth_user.return_value = False
+
+        self.assertEqual(self.calendar_remind().status_code, 401)
+        self.assertFalse(calendar_cache.add_event.called)
+
+    def test_calendar_error(self, refresh_oauth_user, calendar_cache):
+        create_oauth_user("juan", 30)
+        calendar_cache.add_event.side_effect = DAVError("boom")
+
+        self.assertEqual(self.calendar_remind().status_code, 502)
+        self.assertFalse(HistoryEvents.objects.exists())
+
+
+class RecurrenceTestCase(TestCase):
+    def test_advance_one_off(self):
+        reminder = create_reminder(-1)
+        reminder.advance(timezone.now())
+        self.assertIsNone(reminder.next_fire_at)
+        self.assertFalse(reminder.active)
+
+    def test_advance_skips_missed_occurrences(self):
+        reminder = create_reminder(-125, repeat_unit="hours", repeat_interval=1)
+        now = timezone.now()
+        reminder.advance(now)
+        self.assertEqual(reminder.next_fire_at, reminder.deadline + timedelta(hours=3))
+        self.assertGreater(reminder.next_fire_at, now)
+
+    def test_advance_months_from_deadline(self):
+        deadline = datetime(2020, 1, 31, 9, 0, tzinfo=pytz.utc)
+        reminder = create_reminder(
+            0, deadline=deadline, repeat_unit="months", repeat_interval=1
+        )
+        reminder.advance(datetime(2020, 2, 29, 9, 0, tzinfo=pytz.utc))
+        self.assertEqual(
+            reminder.next_fire_at, datetime(2020, 3, 31, 9, 0, tzinfo=pytz.utc)
+        )
+
+    def test_repeat_reminder(self):
+        reminder = create_reminder(-10)
+        Reminder.objects.filter(pk=reminder.pk).update(active=False, next_fire_at=None)
+
+        response = self.client.post(
+            "/repeat_reminder",
+            json.dumps({"reminder_id": reminder.pk, "repeat_unit": "hour", "repeat_value": "2"}),
+            content_type="application/json",
+        )
+
+        self.assertTrue(response.json()["success"])
+        reminder.refresh_from_db()
+        self.assertEqual((reminder.repeat_unit, reminder.repeat_interval), ("hours", 2))
+        self.assertTrue(reminder.active)
+        self.assertEqual(reminder.next_fire_at, reminder.deadline + timedelta(hours=2))
+
+    def test_repeat_reminder_invalid_unit(self):
+        reminder = create_reminder(10)
+        response = self.client.post(
+            "/repeat_reminder",
+            json.dumps({"reminder_id": reminder.pk, "repeat_unit": "fortnights", "repeat_value": "2"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("remindmoi_bot.zulip_utils.get_client")
+    def test_delivery_advances_repeated(self, get_client):
+        client = get_client.return_value
+        client.send_message.return_value = {"result": "success"}
+        repeated = create_reminder(-1, repeat_unit="days", repeat_interval=1)
+        one_off = create_reminder(-1)
+
+        deliver_reminders([repeated.reminder_id, one_off.reminder_id])
+
+        repeated.refresh_from_db()
+        one_off.refresh_from_db()
+        self.assertTrue(repeated.active)
+        self.assertEqual(repeated.next_fire_at, repeated.deadline + timedelta(days=1))
+        self.assertFalse(one_off.active)
+        self.assertIsNone(one_off.next_fire_at)
+
+
+class HealthTestCase(TestCase):
+    def test_health(self):
+        response = self.client.get("/healthz")
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_ready(self):
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["dispatcher"], "not started")
+
+    @override_settings(REMINDER_DISPATCH_IN_PROCESS=False)
+    def test_ready_external_dispatcher(self):
+        self.assertEqual(self.client.get("/readyz").json()["dispatcher"], "external")
+
+    @mock.patch("remindmoi_bot.views.connection")
+    def test_not_ready(self, connection):
+        connection.cursor.side_effect = DatabaseError("unable to open database file")
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["database"])
+
+
+class MetricsTestCase(TestCase):
+    def test_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", (0.1, 1))
+        metrics.REGISTRY.remove(histogram)
+        histogram.observe(0.05, query="claim")
+        histogram.observe(0.5, query="claim")
+        histogram.observe(5, query="claim")
+        samples = {
+            (suffix, labels.get("le")): value
+            for suffix, labels, value in histogram.samples()
+        }
+        self.assertEqual(samples[("_bucket", "0.1")], 1)
+        self.assertEqual(samples[("_bucket", "1")], 2)
+        self.assertEqual(samples[("_bucket", "+Inf")], 3)
+        self.assertEqual(samples[("_count", None)], 3)
+        self.assertEqual(samples[("_sum", None)], 5.55)
+
+    def test_pending_by_due_bucket(self):
+        create_reminder(-1)
+        create_reminder(3)
+        create_reminder(3)
+        create_reminder(60 * 24 * 7)
+        create_reminder(-1, active=False)
+        pending = {labels["due"]: value for _, labels, value in metrics.pending_reminders()}
+        self.assertEqual(
+            pending,
+            {"overdue": 1, "1m": 0, "5m": 2, "1h": 0, "1d": 0, "later": 1},
+        )
+
+    @mock.patch("remindmoi_bot.zulip_utils.get_client")
+    def test_delivery_recorded(self, get_client):
+        get_client.return_value.send_message.side_effect = [
+            {"result": "success"},
+            {"result": "error", "code": "BAD_REQUEST"},
+        ]
+        reminder = create_reminder(-1, zulip_user_email="a@monadical.com,b@monadical.com")
+        error_key = (("code", "BAD_REQUEST"),)
+        errors = metrics.send_errors.values.get(error_key, 0)
+        lags = metrics.fire_lag.values.get((), ([], 0))[0][:]
+
+        deliver_reminders([reminder.reminder_id])
+
+        self.assertEqual(metrics.send_errors.values[error_key], errors + 1)
+        self.assertEqual(sum(metrics.fire_lag.values[()][0]), sum(lags) + 1)
+
+    def test_endpoint(self):
+        create_reminder(-1)
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(
+            'remindmoi_reminders_pending{due="overdue"} 1\n', response.content.decode()
+        )
+
+    @mock.patch("remindmoi_bot.metrics.render", return_value="metric 1\n")
+    @mock.patch("remindmoi_bot.metrics.connection")
+    def test_server_closes_connection(self, connection, render):
+        server = metrics.serve(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+
+        with urlopen(url, timeout=10) as response:
+            self.assertEqual(response.read(), b"metric 1\n")
+
+        connection.close.assert_called_once_with()
+
+    @override_settings(REMINDER_METRICS_URL="http://127.0.0.1:9999/metrics")
+    @mock.patch("remindmoi_bot.management.commands.metrics_snapshot.urlopen")
+    def test_snapshot_reads_dispatcher(self, urlopen):
+        urlopen.return_value.__enter__.return_value.read.return_value = b"dispatcher\n"
+        out = io.StringIO()
+
+        call_command("metrics_snapshot", stdout=out)
+
+        urlopen.assert_called_once_with("http://127.0.0.1:9999/metrics", timeout=10)
+        self.assertEqual(out.getvalue(), "dispatcher\n")
+
+
+class TracingTestCase(TestCase):
+    def test_request_id_returned(self):
+        response = self.client.get("/healthz", HTTP_X_REQUEST_ID="abc")
+        self.assertEqual(response["X-Request-Id"], "abc")
+        self.assertTrue(self.client.get("/healthz")["X-Request-Id"])
+
+    def test_slow_request_exported(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        tracer = Tracer(slow_seconds=0, path=path)
+        with mock.patch("remindmoi_bot.tracing.tracer", tracer):
+            self.client.post(
+                "/add_reminder",
+                json.dumps(
+                    {
+                        "zulip_user_email": "juan@monadical.com",
+                        "title": "clean the dishes",
+                        "created": 1600000000,
+                        "deadline": 1900000000,
+                    }
+                ),
+                content_type="application/json",
+                HTTP_X_REQUEST_ID="abc",
+            )
+        with open(path) as trace_file:
+            trace = json.loads(trace_file.read())
+        self.assertEqual(trace["request_id"], "abc")
+        self.assertEqual(trace["name"], "POST /add_reminder")
+        self.assertIn("db", [span["name"] for span in trace["spans"]])
+
+
+class SqliteTuningTestCase(TestCase):
+    def test_pragmas_applied(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class RecordDeliveriesTestCase(TransactionTestCase):
+    # Foreign keys are checked on commit, TestCase never commits
+    def test_reminder_removed_while_sent(self):
+        removed = create_reminder(-1)
+        kept = create_reminder(-1)
+        deliveries = [
+            ReminderDelivery(
+                reminder_id=reminder.reminder_id,
+                fire_at=reminder.next_fire_at,
+                zulip_user_email=reminder.zulip_user_email,
+                attempts=1,
+                sent_at=timezone.now(),
+            )
+            for reminder in (removed, kept)
+        ]
+        removed.delete()
+
+        record_deliveries(deliveries)
+
+        self.assertEqual(
+            list(ReminderDelivery.objects.values_list("reminder_id", flat=True)),
+            [kept.reminder_id],
+        )
@@ -0,0 +1,119 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from remindmoi_bot.auth import refresh_oauth_user
+from remindmoi_bot.models import OAuthUser
+
+logger = logging.getLogger(__name__)
+
+
+def expiring_oauth_users(
+    before: datetime,
+    after: Optional[Tuple[datetime, uuid.UUID]] = None,
+    batch_size: int = settings.OAUTH_REFRESH_BATCH_SIZE,
+) -> List[OAuthUser]:
+    """
+    Up to batch_size refreshable users whose token expires before the given
+    time, soonest first, continuing after the given (token_expiry, id).
+    Users whose last refresh was refused wait for their refresh_retry_at.
+    """
+    users = OAuthUser.objects.filter(
+        Q(refresh_retry_at__isnull=True) | Q(refresh_retry_at__lte=timezone.now()),
+        token_expiry__lte=before,
+        refresh_token__isnull=False,
+    ).order_by("token_expiry", "id")
+    if after is not None:
+        token_expiry, user_id = after
+        users = users.filter(
+            Q(token_expiry__gt=token_expiry) | Q(token_expiry=token_expiry, id__gt=user_id)
+        )
+    return list(users[:batch_size])
+
+
+def next_token_expiry(after: datetime) -> Optional[datetime]:
+    return (
+        OAuthUser.objects.filter(token_expiry__gt=after, refresh_token__isnull=False)
+        .order_by("token_expiry")
+        .values_list("token_expiry", flat=True)
+        .first()
+    )
+
+
+class TokenRefresher(threading.Thread):
+    """
+    Refreshes Nextcloud tokens margin_seconds before they expire, so calendar
+    commands find a valid token instead of refreshing it themselves. Sleeps
+    until the next token is due (at most idle_seconds).
+    """
+
+    def __init__(
+        self,
+        margin_seconds: float = settings.OAUTH_REFRESH_MARGIN_SECONDS,
+        batch_size: int = settings.OAUTH_REFRESH_BATCH_SIZE,
+        workers: int = settings.OAUTH_REFRESH_WORKERS,
+        idle_seconds: float = settings.OAUTH_REFRESH_IDLE_SECONDS,
+    ) -> None:
+        super().__init__(name="token-refresher", daemon=True)
+        self.margin = timedelta(seconds=margin_seconds)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.idle_seconds = idle_seconds
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            close_old_connections()
+            try:
+                timeout = self.refresh_expiring()
+            except Exception:
+                logger.exception("Token refresh failed")
+                timeout = self.idle_seconds
+            self._stopped.wait(timeout)
+
+    def refresh_expiring(self) -> float:
+        """
+        Refresh every token expiring within the margin, return the seconds
+        until the next one does.
+        """
+        before = timezone.now() + self.margin
+        last = None
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="token-refresh") as pool:
+            while True:
+                # Keyset over (token_expiry, id): tokens failing to refresh
+                # are retried on a later tick, not in a loop.
+                users = expiring_oauth_users(before, last, self.batch_size)
+                if users:  # Before refreshing, it moves token_expiry
+                    last = (users[-1].token_expiry, users[-1].id)
+                for user, refreshed in zip(users, pool.map(self.refresh, users)):
+                    if not refreshed:
+                        logger.warning("Could not refresh the token of %s", user.zulip_user_email)
+                if len(users) < self.batch_size:
+                    break
+
+        # Tokens that just failed wait for the next idle tick
+        expiry = next_token_expiry(after=before)
+        if expiry is None:
+            return self.idle_seconds
+        wait = (expiry - self.margin - timezone.now()).total_seconds()
+        return min(max(wait, 0), self.idle_seconds)
+
+    def refresh(self, user: OAuthUser) -> bool:
+        try:
+            return refresh_oauth_user(user)
+        except Exception:
+            logger.exception("Could not refresh the token of %s", user.zulip_user_email)
+            return False
+        finally:
+            connection.close()  # Worker threads must not keep connections
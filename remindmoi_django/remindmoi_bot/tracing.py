@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import connection
+
+from remindmoi_common.tracing import REQUEST_ID_HEADER, Tracer, span
+
+tracer = Tracer(
+    settings.TRACE_SLOW_REQUEST_SECONDS, settings.TRACE_SAMPLE_RATE, settings.TRACE_FILE
+)
+
+
+def trace_query(execute, sql, params, many, context):
+    """
+    connection.execute_wrapper() timing every query of a traced request.
+    """
+    with span("db", sql=sql[:200]):
+        return execute(sql, params, many, context)
+
+
+class TracingMiddleware(object):
+    """
+    Traces every request under the request id the bot sent, and answers
+    with it.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        with tracer.trace(f"{request.method} {request.path}", request_id) as trace:
+            if trace.recording:
+                with connection.execute_wrapper(trace_query):
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        response[REQUEST_ID_HEADER] = trace.request_id
+        return response
@@ -1,82 +1,127 @@
-import os
 import json
 
-import caldav
 import pytz
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 
 import vobject
-from django.http import JsonResponse
+from caldav.lib.error import DAVError
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-
-from remindmoi_bot.auth import OAuth, set_oauth_credentials
-from remindmoi_bot.models import Reminder, OAuthUser, HistoryEvents
-from remindmoi_bot.scheduler import scheduler
-from remindmoi_bot.zulip_utils import (
-    send_private_zulip_reminder,
-    repeat_unit_to_interval,
-    get_user_emails,
-    convert_date_to_iso,
+from django.views.decorators.http import require_GET, require_POST
+
+from remindmoi_bot import metrics
+from remindmoi_bot.auth import refresh_oauth_user
+from remindmoi_bot.calendars import calendar_cache
+from remindmoi_bot.list_cache import cached_list, invalidate_lists
+from remindmoi_bot.models import (
+    Reminder,
+    ReminderRecipient,
+    OAuthUser,
+    HistoryEvents,
+    normalize_repeat_unit,
 )
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-ICLOUD_SECRETS = os.path.join(BASE_DIR, "client_secret.json")
+from remindmoi_bot.scheduler import (
+    cancel_reminder,
+    dispatcher_state,
+    schedule_reminder,
+)
+from remindmoi_bot.zulip_utils import get_user_emails, convert_date_to_iso
+from remindmoi_common.tracing import span
 
 
-@csrf_exempt
-@require_POST
-def add_reminder(request):
-    # TODO: make it safer. Add CSRF validation. Sanitize/validate post data
-    reminder_obj = json.loads(request.body)  # Create and save remninder object
+def build_reminder(reminder_obj: Dict[str, Any]) -> Reminder:
     zulip_emails = reminder_obj.get("zulip_user_email")
     if reminder_obj.get("is_multi"):
         zulip_usernames = reminder_obj.get("zulip_usernames")
-        zulip_emails = get_user_emails(zulip_usernames) + [zulip_emails]
+        with span("http", service="zulip", path="members"):
+            zulip_emails = get_user_emails(zulip_usernames) + [zulip_emails]
         zulip_emails = ",".join([email for email in zulip_emails])
-    reminder = Reminder.objects.create(
+    deadline = datetime.utcfromtimestamp(reminder_obj["deadline"]).replace(
+        tzinfo=pytz.utc
+    )
+    return Reminder(
         zulip_user_email=zulip_emails,
         title=reminder_obj["title"],
         created=datetime.utcfromtimestamp(reminder_obj["created"]).replace(
             tzinfo=pytz.utc
         ),
-        deadline=datetime.utcfromtimestamp(reminder_obj["deadline"]).replace(
-            tzinfo=pytz.utc
-        ),
-    )
-    reminder.save()
-    scheduler.add_job(  # Schedule reminder
-        send_private_zulip_reminder,
-        "date",
-        run_date=reminder.deadline,
-        args=[reminder.reminder_id],
-        # Create job name from title and reminder id
-        id=(str(reminder.reminder_id) + reminder.title),
+        deadline=deadline,
+        next_fire_at=deadline,  # bulk_create does not call save()
     )
-    return JsonResponse({"success": True, "reminder_id": reminder.reminder_id})
 
 
-def isoadd_reminder(request):
+@csrf_exempt
+@require_POST
+def add_reminder(request):
+    # TODO: make it safer. Add CSRF validation. Sanitize/validate post data
     reminder_obj = json.loads(request.body)  # Create and save remninder object
-    reminder = Reminder.objects.create(
-        zulip_user_email=reminder_obj["zulip_user_email"],
-        title=reminder_obj["title"],
-        created=datetime.utcfromtimestamp(reminder_obj["created"]).replace(
-            tzinfo=pytz.utc
-        ),
-        deadline=datetime.utcfromtimestamp(reminder_obj["deadline"]).replace(
-            tzinfo=pytz.utc
-        ),
+    reminder = build_reminder(reminder_obj)
+    with transaction.atomic():
+        reminder.save()
+        reminder.sync_recipients()
+    invalidate_lists(reminder.recipient_emails())
+    schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
+    return JsonResponse({"success": True, "reminder_id": reminder.reminder_id})
+
+
+@csrf_exempt
+@require_POST
+def bulk_add_reminders(request):
+    """
+    Store many reminders, as sent to add_reminder, in a single transaction.
+    """
+    reminder_objs = json.loads(request.body)["reminders"]
+    if not 0 < len(reminder_objs) <= settings.BULK_ADD_MAX_REMINDERS:
+        return JsonResponse({"success": False, "reminder_ids": []}, status=400)
+    reminders = [build_reminder(reminder_obj) for reminder_obj in reminder_objs]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Reminder.objects.bulk_create(reminders)
+        else:  # Recipients need the ids, still a single transaction
+            for reminder in reminders:
+                reminder.save(force_insert=True)
+        ReminderRecipient.objects.bulk_create(
+            [
+                ReminderRecipient(reminder=reminder, zulip_user_email=email)
+                for reminder in reminders
+                for email in reminder.recipient_emails()
+            ]
+        )
+    invalidate_lists(
+        email for reminder in reminders for email in reminder.recipient_emails()
     )
-    reminder.save()
-    scheduler.add_job(  # Schedule reminder
-        send_private_zulip_reminder,
-        "date",
-        run_date=reminder.deadline,
-        args=[reminder.reminder_id],
-        # Create job name from title and reminder id
-        id=(str(reminder.reminder_id) + reminder.title),
+    for reminder in reminders:
+        schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
+    return JsonResponse(
+        {
+            "success": True,
+            "reminder_ids": [reminder.reminder_id for reminder in reminders],
+        }
     )
+
+
+def isoadd_reminder(request):
+    reminder_obj = json.loads(request.body)  # Create and save remninder object
+    with transaction.atomic():
+        reminder = Reminder.objects.create(
+            zulip_user_email=reminder_obj["zulip_user_email"],
+            title=reminder_obj["title"],
+            created=datetime.utcfromtimestamp(reminder_obj["created"]).replace(
+                tzinfo=pytz.utc
+            ),
+            deadline=datetime.utcfromtimestamp(reminder_obj["deadline"]).replace(
+                tzinfo=pytz.utc
+            ),
+        )
+        reminder.sync_recipients()
+    invalidate_lists(reminder.recipient_emails())
+    schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
     return JsonResponse({"success": True, "reminder_id": reminder.reminder_id})
 
 
@@ -94,9 +139,14 @@ def multi_remind(request):
         reminder = Reminder.objects.get(reminder_id=int(reminder_id))
     except Reminder.DoesNotExist:
         return JsonResponse({"success": False, "reminder_id": reminder_id})
-    user_emails_to_remind = get_user_emails(usernames) + [reminder.zulip_user_email]
+    with span("http", service="zulip", path="members"):
+        user_emails_to_remind = get_user_emails(usernames) + [reminder.zulip_user_email]
+    previous_emails = reminder.recipient_emails()
     reminder.zulip_user_email = ",".join(user_emails_to_remind)
-    reminder.save()
+    with transaction.atomic():
+        reminder.save()
+        reminder.sync_recipients()
+    invalidate_lists(previous_emails + reminder.recipient_emails())
 
     return JsonResponse(
         {
@@ -110,54 +160,117 @@ def multi_remind(request):
 @csrf_exempt
 @require_POST
 def remove_reminder(request):
-    reminder_id = json.loads(request.body)["reminder_id"]
-    reminder = Reminder.objects.get(reminder_id=int(reminder_id))
-    scheduler.remove_job(
-        (str(reminder.reminder_id) + reminder.title)
-    )  # Remove reminder job
-    reminder.delete()  # Remove reminder object
+    """
+    Idempotent: a reminder already removed, or removed by another request
+    meanwhile, is reported removed.
+    """
+    reminder_id = int(json.loads(request.body)["reminder_id"])
+    reminder = (
+        Reminder.objects.filter(reminder_id=reminder_id)
+        .only("reminder_id", "zulip_user_email")
+        .first()
+    )
+    if reminder is not None:
+        reminder.delete()  # With its recipients and deliveries, by reminder id
+        invalidate_lists(reminder.recipient_emails())
+    cancel_reminder(reminder_id)
     return JsonResponse({"success": True})
 
 
 @csrf_exempt
 @require_POST
 def list_reminders(request):
-    response_reminders = []  # List of reminders to be returned to the client
+    """
+    One page of the user's reminders ordered by deadline. The next page is
+    requested with the returned "next_cursor" (keyset pagination), or a page
+    number can be given with "page".
+    """
+    list_request = json.loads(request.body)
+    user_email = list_request["zulip_user_email"]
+    cursor = list_request.get("cursor")
+    page = None if cursor else list_request.get("page")
+    response = cached_list(
+        user_email, cursor, page, lambda: build_list_page(user_email, cursor, page)
+    )
+    return JsonResponse({"success": True, **response})
+
+
+def build_list_page(
+    user_email: str, cursor: Optional[str], page: Optional[int]
+) -> Dict[str, Any]:
+    # Cached: a change to the fields returned here must invalidate_lists()
+    page_size = settings.REMINDERS_PAGE_SIZE
+    # Repeating reminders are listed at their next occurrence, sent ones at
+    # their deadline
+    user_reminders = (
+        Reminder.objects.filter(recipients__zulip_user_email=user_email)
+        .annotate(fire_at=Coalesce("next_fire_at", "deadline"))
+        .order_by("fire_at", "reminder_id")
+    )
+    if cursor:
+        fire_at, reminder_id = decode_list_cursor(cursor)
+        user_reminders = user_reminders.filter(
+            Q(fire_at__gt=fire_at) | Q(fire_at=fire_at, reminder_id__gt=reminder_id)
+        )
+    elif page:
+        offset = (max(int(page), 1) - 1) * page_size
+        user_reminders = user_reminders[offset:]
 
-    zulip_user_email = json.loads(request.body)["zulip_user_email"]
-    user_reminders = Reminder.objects.filter(
-        zulip_user_email__icontains=zulip_user_email
+    # Fetch one extra row to know whether there is a next page
+    rows = list(
+        user_reminders.values_list("reminder_id", "title", "fire_at")[: page_size + 1]
     )
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_list_cursor(rows[-1][2], rows[-1][0])
+
     # Return title and deadline (in unix timestamp) of reminders
-    for reminder in user_reminders.values():
-        response_reminders.append(
-            {
-                "title": reminder["title"],
-                "deadline": convert_date_to_iso(reminder["deadline"]),
-                "reminder_id": reminder["reminder_id"],
-            }
-        )
+    response_reminders = [
+        {
+            "title": title,
+            "deadline": convert_date_to_iso(fire_at),
+            "reminder_id": reminder_id,
+        }
+        for reminder_id, title, fire_at in rows
+    ]
+    return {"reminders_list": response_reminders, "next_cursor": next_cursor}
+
+
+def encode_list_cursor(fire_at: datetime, reminder_id: int) -> str:
+    return f"{fire_at.isoformat()}|{reminder_id}"
 
-    return JsonResponse({"success": True, "reminders_list": response_reminders})
+
+def decode_list_cursor(cursor: str) -> Tuple[datetime, int]:
+    fire_at, reminder_id = cursor.rsplit("|", 1)
+    return datetime.fromisoformat(fire_at), int(reminder_id)
 
 
 @csrf_exempt
 @require_POST
 def repeat_reminder(request):
+    """
+    Store the recurrence on the reminder. The dispatcher sends it at
+    next_fire_at and moves next_fire_at forward after each delivery.
+    """
     repeat_request = json.loads(request.body)
     reminder_id = repeat_request["reminder_id"]
-    repeat_unit = repeat_request["repeat_unit"]
-    repeat_value = repeat_request["repeat_value"]
+    repeat_unit = normalize_repeat_unit(repeat_request["repeat_unit"])
+    repeat_value = int(repeat_request["repeat_value"])
+    if repeat_unit is None or repeat_value <= 0:
+        return JsonResponse({"success": False}, status=400)
     reminder = Reminder.objects.get(reminder_id=reminder_id)
-    job_id = str(reminder.reminder_id) + reminder.title
-
-    scheduler.add_job(
-        send_private_zulip_reminder,
-        "interval",
-        **repeat_unit_to_interval(repeat_unit, repeat_value),
-        args=[reminder.reminder_id],
-        id=job_id
+
+    reminder.repeat_unit = repeat_unit
+    reminder.repeat_interval = repeat_value
+    if reminder.next_fire_at is None:  # Already sent, repeat from now on
+        reminder.active = True
+        reminder.advance(timezone.now())
+    reminder.save(
+        update_fields=["repeat_unit", "repeat_interval", "next_fire_at", "active"]
     )
+    invalidate_lists(reminder.recipient_emails())
+    schedule_reminder(reminder.reminder_id, reminder.next_fire_at)
     return JsonResponse({"success": True})
 
 
@@ -166,39 +279,54 @@ def repeat_reminder(request):
 def create_calendar_event(request):
     obj = json.loads(json.loads(request.body))
 
-    icloud_secrets = ICLOUD_SECRETS
-    with open(icloud_secrets) as secret_file:
-        data = json.load(secret_file)
-        secrets_dict = {key: value for key, value in data["web"].items()}
-
     oaut_user_qs = OAuthUser.objects.filter(zulip_user_email=obj['email'])
 
     if not oaut_user_qs.exists():
         return JsonResponse({"message": "the user doesn't exist"}, status=404)
 
-    oaut_user = oaut_user_qs.first()
+    add_calendar_event(oaut_user_qs.first(), obj)
 
-    credentials = set_oauth_credentials(
-        secrets_dict=secrets_dict,
-        access_token=oaut_user.access_token,
-        token_expiry=oaut_user.token_expiry,
-        refresh_token=oaut_user.refresh_token,
-    )
+    return JsonResponse({"success": True}, status=200)
 
-    auth = OAuth(credentials)
-    caldav_client = caldav.DAVClient(
-        "https://cloud.monadical.com/remote.php/dav",
-        auth=auth)
 
-    principal = caldav_client.principal()
-    calendars = principal.calendars()
-    personal_calendar = None
-    for calendar in calendars:
-        if calendar.name == "Personal":
-            personal_calendar = calendar
+@csrf_exempt
+@require_POST
+def calendar_remind(request):
+    """
+    Authorization check, token refresh when needed and event creation in one
+    request, for the bot's --calendar command.
+    """
+    obj = json.loads(request.body)
 
-    assert personal_calendar is not None
+    oaut_user = OAuthUser.objects.filter(zulip_user_email=obj["email"]).first()
+    if oaut_user is None:
+        return JsonResponse(
+            {"success": False, "message": "the user doesn't exist"}, status=404
+        )
 
+    # Tokens are normally refreshed in the background before they expire
+    if oaut_user.token_expiry is None or oaut_user.token_expiry <= timezone.now():
+        if not oaut_user.refresh_token or not refresh_oauth_user(oaut_user):
+            return JsonResponse(
+                {"success": False, "message": "the token could not be refreshed"},
+                status=401,
+            )
+
+    try:
+        add_calendar_event(oaut_user, obj)
+    except (DAVError, AssertionError) as error:
+        return JsonResponse(
+            {"success": False, "message": f"the event wasn't created: {error!r}"},
+            status=502,
+        )
+    return JsonResponse({"success": True}, status=200)
+
+
+def add_calendar_event(oaut_user: OAuthUser, obj: Dict[str, Any]) -> None:
+    """
+    Add the event to the user's calendar. The history entry is only kept if
+    the calendar accepted the event.
+    """
     # created the VCalendar
     cal = vobject.iCalendar()
     cal.add('prodid').value = "-//Example Corp.//CalDAV Client//EN"
@@ -227,7 +355,43 @@ def create_calendar_event(request):
     # fill the whole data required what are missing to create the event
     icalstream = cal.serialize()
 
-    # add event to calendar
-    personal_calendar.add_event(icalstream)
+    # add event to calendar. Not in a transaction: it would hold the database
+    # for as long as the CalDAV server takes to answer.
+    try:
+        with span("http", service="caldav", path="add_event"):
+            calendar_cache.add_event(oaut_user, icalstream)
+    except Exception:
+        history.delete()
+        raise
 
-    return JsonResponse({"success": True}, status=200)
+
+@require_GET
+def health(request):
+    """
+    Liveness: the worker answers.
+    """
+    return JsonResponse({"status": "ok"})
+
+
+@require_GET
+def ready(request):
+    """
+    Readiness: the database answers. Also reports whether this process
+    sends reminders.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError:
+        return JsonResponse({"status": "unavailable", "database": False}, status=503)
+    return JsonResponse(
+        {"status": "ok", "database": True, "dispatcher": dispatcher_state()}
+    )
+
+
+@require_GET
+def metrics_view(request):
+    """
+    This process' metrics, in the Prometheus text format.
+    """
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
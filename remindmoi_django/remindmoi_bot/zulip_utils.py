@@ -1,54 +1,362 @@
-import zulip
+import atexit
+import logging
+import threading
+import time
 
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional
 
-from dateutil.tz import gettz
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 
 from remindmoi.settings import ZULIPRC
-from remindmoi_bot.models import Reminder
+from remindmoi_bot import metrics
+from remindmoi_bot.list_cache import invalidate_lists
+from remindmoi_bot.models import Reminder, ReminderDelivery, ReminderRecipient
+from remindmoi_common.timezones import get_timezone
 
-SINGULAR_UNITS = ["minute", "hour", "day", "week", "month"]
+logger = logging.getLogger(__name__)
 
-# Pass the path to your zuliprc file here.
-client = zulip.Client(config_file=ZULIPRC)
 
+class RateLimiter(object):
+    """
+    Token bucket shared by the delivery workers. pause() blocks every worker,
+    it is called when Zulip answers RATE_LIMIT_HIT.
+    """
 
-def send_private_zulip_reminder(reminder_id: int) -> bool:
-    reminder = Reminder.objects.get(reminder_id=reminder_id)
-    emails = reminder.zulip_user_email.split(",")
-    content = f"Don't forget: {reminder.title}. Reminder id: {reminder.reminder_id}"
-    for email in emails:
-        response = client.send_message(
-            {"type": "private", "to": email, "content": content}
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if now >= self.resume_at and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.resume_at - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """
+    Built on first use, only processes sending messages import zulip and
+    read the zuliprc.
+    """
+    import zulip
+
+    # Pass the path to your zuliprc file here.
+    return zulip.Client(config_file=ZULIPRC)
+
+
+# Pause after the events API answered an error, doubled after each
+# consecutive one up to ZULIP_EVENTS_MAX_RETRY_SECONDS
+ZULIP_EVENTS_RETRY_SECONDS = 1
+ZULIP_EVENTS_MAX_RETRY_SECONDS = 60
+
+rate_limiter = RateLimiter(settings.ZULIP_SEND_RATE, settings.ZULIP_SEND_BURST)
+
+
+def send_zulip_message(message: Dict[str, str]) -> bool:
+    for _ in range(settings.ZULIP_SEND_RETRIES + 1):
+        rate_limiter.acquire()
+        with metrics.send_latency.time():
+            response = get_client().send_message(message)
+        if response.get("result") == "success":
+            return True
+        metrics.send_errors.inc(code=response.get("code", "UNKNOWN"))
+        if response.get("code") != "RATE_LIMIT_HIT":
+            break
+        rate_limiter.pause(float(response.get("retry-after", 1)))
+    logger.warning("Could not send message to %s: %s", message["to"], response)
+    return False
+
+
+def _send_zulip_message_safely(message: Dict[str, str]) -> bool:
+    try:
+        return send_zulip_message(message)
+    except Exception:
+        metrics.send_errors.inc(code="EXCEPTION")
+        logger.exception("Could not send message to %s", message["to"])
+        return False
+
+
+def deliver_reminders(reminder_ids: List[int]) -> List[int]:
+    """
+    Send the current occurrence of the given reminders to the recipients
+    that have not got it yet, through a bounded pool of workers, and record
+    each attempt in the ReminderDelivery ledger. Reminders every recipient
+    got, or that ran out of attempts, move to their next occurrence (or are
+    flagged inactive); the others stay due, to be retried.
+    Return the ids of the reminders every recipient got.
+    """
+    recipients = ReminderRecipient.objects.filter(
+        reminder_id__in=reminder_ids, reminder__next_fire_at__isnull=False
+    ).values_list(
+        "reminder_id", "reminder__title", "reminder__next_fire_at", "zulip_user_email"
+    )
+    ledger = {
+        (delivery.reminder_id, delivery.fire_at, delivery.zulip_user_email): delivery
+        for delivery in ReminderDelivery.objects.filter(
+            reminder_id__in=reminder_ids, reminder__next_fire_at=F("fire_at")
+        )
+    }
+    messages = []
+    for reminder_id, title, fire_at, email in recipients:
+        key = (reminder_id, fire_at, email)
+        delivery = ledger.get(key)
+        if delivery is None:
+            delivery = ledger[key] = ReminderDelivery(
+                reminder_id=reminder_id, fire_at=fire_at, zulip_user_email=email
+            )
+        if delivery.sent_at is not None:
+            continue  # Sent by an earlier attempt
+        content = f"Don't forget: {title}. Reminder id: {reminder_id}"
+        messages.append(
+            (delivery, {"type": "private", "to": email, "content": content})
+        )
+
+    if messages:
+        workers = min(settings.ZULIP_SEND_WORKERS, len(messages))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                _send_zulip_message_safely, [message for _, message in messages]
+            )
+            for (delivery, _), sent in zip(messages, results):
+                delivery.attempts += 1
+                if sent:
+                    delivery.sent_at = timezone.now()
+                    metrics.fire_lag.observe(
+                        (delivery.sent_at - delivery.fire_at).total_seconds()
+                    )
+        record_deliveries([delivery for delivery, _ in messages])
+
+    failed = set()
+    retried = set()
+    for (reminder_id, _, email), delivery in ledger.items():
+        if delivery.sent_at is None:
+            failed.add(reminder_id)
+            if delivery.attempts < settings.REMINDER_DELIVERY_ATTEMPTS:
+                retried.add(reminder_id)
+            else:
+                logger.warning("Gave up sending reminder %s to %s", reminder_id, email)
+
+    advance_reminders([rid for rid in reminder_ids if rid not in retried])
+    sent_ids = dict.fromkeys(reminder_id for reminder_id, _, _ in ledger)
+    return [reminder_id for reminder_id in sent_ids if reminder_id not in failed]
+
+
+def record_deliveries(deliveries: List[ReminderDelivery]) -> None:
+    try:
+        with transaction.atomic():
+            _save_deliveries(deliveries)
+    except IntegrityError:
+        # Some reminders were removed while being sent
+        existing = set(
+            Reminder.objects.filter(
+                reminder_id__in={delivery.reminder_id for delivery in deliveries}
+            ).values_list("reminder_id", flat=True)
         )
-    reminder.active = (
-        False  # For now, set reminder to negative to denoate that it's done
+        with transaction.atomic():
+            _save_deliveries(
+                [delivery for delivery in deliveries if delivery.reminder_id in existing]
+            )
+
+
+def _save_deliveries(deliveries: List[ReminderDelivery]) -> None:
+    ReminderDelivery.objects.bulk_create(
+        [delivery for delivery in deliveries if delivery.pk is None]
+    )
+    ReminderDelivery.objects.bulk_update(
+        [delivery for delivery in deliveries if delivery.pk is not None],
+        ["attempts", "sent_at"],
+    )
+
+
+def advance_reminders(reminder_ids: List[int]) -> None:
+    now = timezone.now()
+    repeated = list(
+        Reminder.objects.filter(
+            reminder_id__in=reminder_ids, repeat_unit__isnull=False
+        ).only("reminder_id", "deadline", "repeat_unit", "repeat_interval")
+    )
+    for reminder in repeated:
+        reminder.advance(now)
+    Reminder.objects.bulk_update(repeated, ["next_fire_at", "active"])
+    Reminder.objects.filter(reminder_id__in=reminder_ids).exclude(
+        reminder_id__in=[reminder.reminder_id for reminder in repeated]
+    ).update(active=False, next_fire_at=None)
+    # "list" shows the next occurrence
+    invalidate_lists(
+        ReminderRecipient.objects.filter(reminder_id__in=reminder_ids)
+        .values_list("zulip_user_email", flat=True)
+        .distinct()
     )
-    return response["result"] == "success"
 
 
-def repeat_unit_to_interval(repeat_unit: str, repeat_value: int) -> Dict[str, int]:
-    if repeat_unit in SINGULAR_UNITS:  # Convert singular units to plural
-        repeat_unit = f"{repeat_unit}s"
+def send_private_zulip_reminder(reminder_id: int) -> bool:
+    return reminder_id in deliver_reminders([reminder_id])
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+class MemberDirectory(object):
+    """
+    Cache of the realm roster indexed by full name and normalized name.
+    It is reloaded after ttl seconds and, with watch_events, on the next
+    lookup once a realm_user event says the roster changed.
+    """
+
+    def __init__(self, ttl: float, watch_events: bool = True) -> None:
+        self.ttl = ttl
+        self.watch_events = watch_events
+        self.by_name: Dict[str, List[str]] = {}
+        self.by_normalized_name: Dict[str, List[str]] = {}
+        self.expires_at = 0.0
+        self.watching = False
+        self.queue_id: Optional[str] = None
+        self.last_event_id = -1
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        members = get_client().get_members()["members"]
+        by_name: Dict[str, List[str]] = {}
+        by_normalized_name: Dict[str, List[str]] = {}
+        for member in members:
+            by_name.setdefault(member["full_name"], []).append(member["email"])
+            by_normalized_name.setdefault(
+                normalize_name(member["full_name"]), []
+            ).append(member["email"])
+        self.by_name = by_name
+        self.by_normalized_name = by_normalized_name
+        self.expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self) -> None:
+        self.expires_at = 0.0
+
+    def handle_event(self, event: Dict) -> None:
+        if event.get("type") == "realm_user":
+            self.invalidate()
+
+    def watch(self) -> None:
+        """
+        Listen to realm_user events in a daemon thread. Its event queue is
+        deleted when the process exits.
+        """
+        self.watching = True
+        threading.Thread(
+            target=self.listen, name="zulip-member-events", daemon=True
+        ).start()
+        atexit.unregister(self.unwatch)
+        atexit.register(self.unwatch)
+
+    def listen(self) -> None:
+        """
+        Poll the events until unwatch(), backing off while Zulip fails.
+        """
+        failures = 0
+        try:
+            while not self.stopped.is_set():
+                try:
+                    polled = self.poll()
+                except Exception:
+                    logger.exception("Could not read the realm_user events")
+                    polled = False
+                if polled:
+                    failures = 0
+                    continue
+                failures += 1
+                self.stopped.wait(
+                    min(
+                        ZULIP_EVENTS_RETRY_SECONDS * 2 ** (failures - 1),
+                        ZULIP_EVENTS_MAX_RETRY_SECONDS,
+                    )
+                )
+        finally:
+            self.watching = False  # The next lookup starts a new listener
+
+    def poll(self) -> bool:
+        """
+        Handle the events of one get_events call, registering a queue first
+        if there is none. Return False if Zulip answered an error.
+        """
+        client = get_client()
+        if self.queue_id is None:
+            response = client.register(event_types=["realm_user"])
+            if response.get("result") != "success":
+                return False
+            self.queue_id = response["queue_id"]
+            self.last_event_id = response["last_event_id"]
+            self.invalidate()  # Changes may have been missed meanwhile
+        response = client.get_events(
+            queue_id=self.queue_id, last_event_id=self.last_event_id
+        )
+        if response.get("result") != "success":
+            if response.get("code") == "BAD_EVENT_QUEUE_ID":
+                self.queue_id = None  # Expired, register a new one
+            return False
+        for event in response["events"]:
+            self.last_event_id = max(self.last_event_id, event["id"])
+            self.handle_event(event)
+        return True
+
+    def unwatch(self) -> None:
+        self.stopped.set()
+        queue_id, self.queue_id = self.queue_id, None
+        if queue_id is not None:
+            try:
+                get_client().deregister(queue_id, timeout=ZULIP_EVENTS_RETRY_SECONDS)
+            except Exception:
+                logger.warning("Could not delete the event queue %s", queue_id)
+
+    def emails(self, usernames: List[str]) -> List[str]:
+        with self.lock:
+            if self.watch_events and not self.watching and not self.stopped.is_set():
+                self.watch()
+            if time.monotonic() >= self.expires_at:
+                self.load()
+            by_name = self.by_name
+            by_normalized_name = self.by_normalized_name
+
+        user_emails = []
+        for username in dict.fromkeys(usernames):  # Ignore repeated names
+            emails = by_name.get(username) or by_normalized_name.get(
+                normalize_name(username), []
+            )
+            user_emails.extend(emails)
+        return user_emails
+
 
-    if repeat_unit == "minutes":
-        return {"minutes": int(repeat_value)}
-    if repeat_unit == "days":
-        return {"days": int(repeat_value)}
-    if repeat_unit == "weeks":
-        return {"weeks": int(repeat_value)}
-    if repeat_unit == "months":
-        return {"months": int(repeat_value)}
+member_directory = MemberDirectory(
+    settings.ZULIP_MEMBERS_TTL, settings.ZULIP_MEMBERS_WATCH
+)
 
 
 def get_user_emails(usernames: List[str]) -> List[str]:
-    members = client.get_members()["members"]
-    user_emails = [
-        member["email"] for member in members if member["full_name"] in usernames
-    ]
-    return user_emails
+    return member_directory.emails(usernames)
 
 
 def convert_date_to_iso(timestamp):
-    new_tzinfo = gettz()
-    return timestamp.replace(tzinfo=new_tzinfo).isoformat()
+    # Deadlines are stored in UTC, show them in the display zone
+    display_tz = get_timezone(settings.REMINDERS_DISPLAY_TIMEZONE)
+    return timestamp.astimezone(display_tz).isoformat()
@@ -0,0 +1,4 @@
+"""
+Helpers shared by the bot (bot_server) and the backend (remindmoi_bot), so
+neither imports the other. Standard library and dateutil only.
+"""
@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+
+from django.test.testcases import SimpleTestCase
+
+from remindmoi_common.tracing import Tracer, current_request_id, span
+
+
+class TracerTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def exported(self):
+        with open(self.path) as trace_file:
+            return [json.loads(line) for line in trace_file]
+
+    def test_slow_trace_exported(self):
+        tracer = Tracer(slow_seconds=0, path=self.path)
+        with tracer.trace("add", "abc"):
+            with span("backend", path="/add_reminder"):
+                self.assertEqual(current_request_id(), "abc")
+        self.assertIsNone(current_request_id())
+        [trace] = self.exported()
+        self.assertEqual(trace["request_id"], "abc")
+        self.assertEqual(trace["spans"][0]["name"], "backend")
+        self.assertEqual(trace["spans"][0]["path"], "/add_reminder")
+
+    def test_fast_trace_not_exported(self):
+        tracer = Tracer(slow_seconds=60, path=self.path)
+        with tracer.trace("add"):
+            with span("backend"):
+                pass
+        self.assertEqual(self.exported(), [])
+
+    def test_disabled_keeps_request_id(self):
+        tracer = Tracer(path=self.path)
+        with tracer.trace("add") as trace:
+            with span("backend"):
+                self.assertEqual(current_request_id(), trace.request_id)
+        self.assertEqual(trace.spans, [])
+        self.assertEqual(self.exported(), [])
+
@@ -0,0 +1,13 @@
+from datetime import tzinfo
+from functools import lru_cache
+from typing import Optional
+
+from dateutil.tz import gettz
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name: Optional[str] = None) -> tzinfo:
+    """
+    gettz() without a name builds a new local zone object on every call.
+    """
+    return gettz(name)
@@ -0,0 +1,128 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("remindmoi.trace")
+
+REQUEST_ID_HEADER = "X-Request-Id"
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Trace(object):
+    """
+    The spans of one command (in the bot) or request (in the backend),
+    tied together by request_id.
+    """
+
+    def __init__(
+        self, name: str, request_id: Optional[str] = None, recording: bool = True
+    ) -> None:
+        self.name = name
+        self.request_id = request_id or new_request_id()
+        self.recording = recording
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        # (name, start, end, attributes)
+        self.spans: List[Tuple[str, float, float, Dict[str, Any]]] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round((start - self.start) * 1000, 3),
+                    "duration_ms": round((end - start) * 1000, 3),
+                    **attributes,
+                }
+                for name, start, end, attributes in self.spans
+            ],
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Time the block as part of the current trace, if it is recorded.
+    """
+    trace = current_trace.get()
+    if trace is None or not trace.recording:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, start, time.perf_counter(), attributes))
+
+
+class Tracer(object):
+    """
+    Starts traces and exports the ones slower than slow_seconds, plus a
+    sample_rate fraction of the others, as JSON lines appended to path (or
+    logged to "remindmoi.trace" without one). With slow_seconds None and
+    sample_rate 0 no span is recorded, traces only carry the request id.
+    """
+
+    def __init__(
+        self,
+        slow_seconds: Optional[float] = None,
+        sample_rate: float = 0.0,
+        path: Optional[str] = None,
+    ) -> None:
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self.path = path
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.slow_seconds is not None or self.sample_rate > 0
+
+    @contextmanager
+    def trace(self, name: str, request_id: Optional[str] = None) -> Iterator[Trace]:
+        trace = Trace(name, request_id, recording=self.enabled)
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            trace.end = time.perf_counter()
+            if trace.recording and self.sampled(trace):
+                self.export(trace)
+
+    def sampled(self, trace: Trace) -> bool:
+        if self.slow_seconds is not None and trace.duration >= self.slow_seconds:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), default=str)
+        if self.path is None:
+            logger.info(line)
+            return
+        with self.lock, open(self.path, "a") as trace_file:
+            trace_file.write(line + "\n")